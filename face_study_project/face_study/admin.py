@@ -3,30 +3,66 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.http import HttpResponseRedirect
 from django.urls import path, reverse
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from .models import *
-from .export_utils import export_ratings_to_csv
+from .admin_filters import (
+    AgreementLevelBucketFilter, ApproximateCountPaginator,
+    ParticipantEmailFilter, RatedByParticipantFilter,
+)
+from .bulk_utils import delete_ratings_in_chunks, delete_rankings_in_chunks
+from .config_utils import get_active_config, invalidate_active_config
+from .export_utils import export_agreement_to_csv, export_ratings_to_csv
+from .forms import FaceImageAdminForm
+from .summary_utils import add_summary_deltas, rating_summary_deltas, subtract_rankings
 from .views import export_advanced
 
+
+def count_subquery(queryset, group_field, column='id', distinct=False):
+    """
+    COUNT por linha da listagem como subconsulta agrupada.
+
+    queryset deve estar filtrado por OuterRef('pk') em group_field; o
+    resultado é anotado na própria consulta da página.
+    """
+    counts = queryset.order_by().values(group_field).annotate(
+        total=Count(column, distinct=distinct)
+    ).values('total')
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def queue_export_job(modeladmin, request, filters, description):
+    """Cria uma ExportJob para o worker run_export_jobs e avisa o usuário"""
+    job = ExportJob.objects.create(filters=filters, description=description)
+    url = reverse('admin:face_study_exportjob_change', args=[job.pk])
+    modeladmin.message_user(
+        request,
+        format_html('Export #{} queued. Follow its progress <a href="{}">here</a>.', job.pk, url)
+    )
+
 @admin.register(FaceImage)
 class FaceImageAdmin(admin.ModelAdmin):
+    # Calcula o hash do conteúdo ao criar ou trocar a imagem, como o upload
+    form = FaceImageAdminForm
     list_display = ['code', 'image_preview', 'uploaded_at', 'rating_count_display', 'is_available_display']
-    list_filter = ['uploaded_at', 'ratings__participant']
+    list_filter = ['uploaded_at', RatedByParticipantFilter]
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
     search_fields = ['code']
     readonly_fields = ['image_preview', 'code', 'uploaded_at', 'rating_count_display']
     fields = ['code', 'image', 'image_preview', 'uploaded_at', 'rating_count_display']
-    actions = ['reset_ratings', 'export_ratings_for_selected_images']
+    actions = ['reset_ratings', 'export_ratings_for_selected_images', 'queue_export_for_selected_images']
     
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" style="max-height: 50px; max-width: 50px;" />', obj.image.url)
+            return format_html('<img src="{}" style="max-height: 50px; max-width: 50px;" />', obj.thumbnail_url)
         return "No Image"
     image_preview.short_description = 'Preview'
     
     def rating_count_display(self, obj):
-        count = obj.ratings.count()
-        config = StudyConfiguration.objects.filter(is_active=True).first()
-        if not config:
-            config = StudyConfiguration.objects.create()
+        # Lê o contador desnormalizado: nenhuma consulta por linha
+        count = obj.rating_count
+        config = get_active_config()
         
         max_ratings = config.max_ratings_per_image
         
@@ -48,28 +84,26 @@ class FaceImageAdmin(admin.ModelAdmin):
             color, status, count, max_ratings
         )
     rating_count_display.short_description = 'Ratings'
+    rating_count_display.admin_order_field = 'rating_count'
     
     def is_available_display(self, obj):
-        config = StudyConfiguration.objects.filter(is_active=True).first()
-        if not config:
-            config = StudyConfiguration.objects.create()
+        config = get_active_config()
         
-        if obj.ratings.count() >= config.max_ratings_per_image:
+        if obj.rating_count >= config.max_ratings_per_image:
             return format_html('<span style="color: red;">✗ Unavailable</span>')
         else:
             return format_html('<span style="color: green;">✓ Available</span>')
     is_available_display.short_description = 'Availability'
+    is_available_display.admin_order_field = 'rating_count'
     
     def reset_ratings(self, request, queryset):
-        """Ação para resetar as avaliações de imagens selecionadas"""
-        count = 0
-        for image in queryset:
-            deleted_count, _ = ImageRating.objects.filter(image=image).delete()
-            count += 1
+        """Ação para resetar as avaliações de imagens selecionadas (em lotes, sem cascata do Django)"""
+        count = queryset.count()
+        result = delete_ratings_in_chunks(ImageRating.objects.filter(image__in=queryset))
         
         self.message_user(
             request, 
-            f'Successfully reset ratings for {count} image(s).'
+            f'Successfully reset ratings for {count} image(s): {result.summary()}.'
         )
     reset_ratings.short_description = 'Reset ratings for selected images'
     
@@ -79,6 +113,12 @@ class FaceImageAdmin(admin.ModelAdmin):
         ratings = ImageRating.objects.filter(image__in=queryset)
         return export_ratings_to_csv(ratings)
     export_ratings_for_selected_images.short_description = 'Export ratings for selected images (CSV)'
+    
+    def queue_export_for_selected_images(self, request, queryset):
+        """Agenda a exportação das imagens selecionadas em segundo plano"""
+        image_ids = [str(image_id) for image_id in queryset.values_list('id', flat=True)]
+        queue_export_job(self, request, {'image_ids': image_ids}, f'{len(image_ids)} image(s)')
+    queue_export_for_selected_images.short_description = 'Export ratings for selected images (CSV, background)'
 
 
 @admin.register(Participant)
@@ -87,22 +127,33 @@ class ParticipantAdmin(admin.ModelAdmin):
     search_fields = ['email']
     readonly_fields = ['created_at', 'last_session_at', 'total_ratings_display', 'unique_images_display']
     list_filter = ['created_at', 'last_session_at']
-    actions = ['export_ratings_for_selected_participants']
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+    actions = ['export_ratings_for_selected_participants', 'queue_export_for_selected_participants', 'purge_participants']
+    
+    def get_queryset(self, request):
+        ratings = ImageRating.objects.filter(participant=OuterRef('pk'))
+        return super().get_queryset(request).annotate(
+            ratings_total=count_subquery(ratings, 'participant'),
+            unique_images_total=count_subquery(ratings, 'participant', 'image', distinct=True),
+        )
     
     def total_ratings(self, obj):
-        return obj.ratings.count()
+        return obj.ratings_total
     total_ratings.short_description = 'Total Ratings'
+    total_ratings.admin_order_field = 'ratings_total'
     
     def unique_images_rated(self, obj):
-        return obj.ratings.values('image').distinct().count()
+        return obj.unique_images_total
     unique_images_rated.short_description = 'Unique Images'
+    unique_images_rated.admin_order_field = 'unique_images_total'
     
     def total_ratings_display(self, obj):
-        return obj.total_ratings_count()
+        return obj.ratings_total
     total_ratings_display.short_description = 'Total Ratings'
     
     def unique_images_display(self, obj):
-        return obj.rated_images_count()
+        return obj.unique_images_total
     unique_images_display.short_description = 'Unique Images Rated'
     
     def export_ratings_for_selected_participants(self, request, queryset):
@@ -111,18 +162,45 @@ class ParticipantAdmin(admin.ModelAdmin):
         ratings = ImageRating.objects.filter(participant__in=queryset)
         return export_ratings_to_csv(ratings)
     export_ratings_for_selected_participants.short_description = 'Export ratings for selected participants (CSV)'
+    
+    def queue_export_for_selected_participants(self, request, queryset):
+        """Agenda a exportação dos participantes selecionados em segundo plano"""
+        participant_ids = list(queryset.values_list('id', flat=True))
+        queue_export_job(self, request, {'participant_ids': participant_ids}, f'{len(participant_ids)} participant(s)')
+    queue_export_for_selected_participants.short_description = 'Export ratings for selected participants (CSV, background)'
+    
+    def purge_participants(self, request, queryset):
+        """Apaga os participantes selecionados e todas as suas avaliações, em lotes"""
+        count = queryset.count()
+        result = delete_ratings_in_chunks(ImageRating.objects.filter(participant__in=queryset))
+        # Sem avaliações restantes, a cascata só remove as reservas
+        queryset.delete()
+        
+        self.message_user(request, f'Purged {count} participant(s): {result.summary()}.')
+    purge_participants.short_description = 'Purge selected participants and all their ratings'
 
 
 @admin.register(ImageRating)
 class ImageRatingAdmin(admin.ModelAdmin):
     list_display = ['participant', 'image', 'created_at', 'emotion_rankings_count']
-    list_filter = ['created_at', 'participant']
+    list_filter = ['created_at', ParticipantEmailFilter]
+    autocomplete_fields = ['participant', 'image']
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
     search_fields = ['participant__email', 'image__code']
-    actions = ['export_selected_ratings_csv', 'export_all_ratings_csv']
+    actions = ['export_selected_ratings_csv', 'export_all_ratings_csv', 'queue_export_selected_ratings', 'queue_export_all_ratings']
+    list_select_related = ['participant', 'image']
+    
+    def get_queryset(self, request):
+        rankings = EmotionRanking.objects.filter(rating=OuterRef('pk'))
+        return super().get_queryset(request).annotate(
+            rankings_total=count_subquery(rankings, 'rating'),
+        )
     
     def emotion_rankings_count(self, obj):
-        return obj.emotion_rankings.count()
+        return obj.rankings_total
     emotion_rankings_count.short_description = 'Emotions Ranked'
+    emotion_rankings_count.admin_order_field = 'rankings_total'
     
     def export_selected_ratings_csv(self, request, queryset):
         """Exporta avaliações selecionadas para CSV"""
@@ -134,6 +212,17 @@ class ImageRatingAdmin(admin.ModelAdmin):
         return export_ratings_to_csv()
     
     export_all_ratings_csv.short_description = 'Export ALL ratings to CSV'
+    
+    def queue_export_selected_ratings(self, request, queryset):
+        """Agenda a exportação das avaliações selecionadas em segundo plano"""
+        rating_ids = list(queryset.values_list('id', flat=True))
+        queue_export_job(self, request, {'rating_ids': rating_ids}, f'{len(rating_ids)} rating(s)')
+    queue_export_selected_ratings.short_description = 'Export selected ratings to CSV (background)'
+    
+    def queue_export_all_ratings(self, request, queryset):
+        """Agenda a exportação de TODAS as avaliações em segundo plano"""
+        queue_export_job(self, request, {}, 'all ratings')
+    queue_export_all_ratings.short_description = 'Export ALL ratings to CSV (background)'
 
     def get_urls(self):
         urls = super().get_urls()
@@ -149,18 +238,55 @@ class ImageRatingAdmin(admin.ModelAdmin):
 class EmotionalStateAdmin(admin.ModelAdmin):
     list_display = ['name', 'description', 'usage_count']
     search_fields = ['name']
+    actions = ['delete_emotions_with_rankings']
+    
+    def get_queryset(self, request):
+        rankings = EmotionRanking.objects.filter(emotion=OuterRef('pk'))
+        return super().get_queryset(request).annotate(
+            usage_total=count_subquery(rankings, 'emotion'),
+        )
     
     def usage_count(self, obj):
-        return obj.emotionranking_set.count()
+        return obj.usage_total
     usage_count.short_description = 'Times Used'
+    usage_count.admin_order_field = 'usage_total'
+    
+    def delete_emotions_with_rankings(self, request, queryset):
+        """Apaga as emoções selecionadas e seus rankings, em lotes"""
+        result = delete_rankings_in_chunks(EmotionRanking.objects.filter(emotion__in=queryset))
+        count = queryset.count()
+        queryset.delete()
+        
+        self.message_user(request, f'Deleted {count} emotion(s): {result.summary()}.')
+    delete_emotions_with_rankings.short_description = 'Delete selected emotions and all their rankings'
 
 
 @admin.register(EmotionRanking)
 class EmotionRankingAdmin(admin.ModelAdmin):
     list_display = ['rating', 'emotion', 'agreement_level', 'created_at']
-    list_filter = ['emotion', 'agreement_level']
+    list_filter = ['emotion', AgreementLevelBucketFilter]
+    autocomplete_fields = ['rating', 'emotion']
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
     search_fields = ['emotion__name', 'rating__participant__email']
     list_editable = ['agreement_level']
+    list_select_related = ['rating__participant', 'rating__image', 'emotion']
+    
+    # Edições diretas mantêm os resumos FaceEmotionSummary da imagem
+    def save_model(self, request, obj, form, change):
+        old_levels = {}
+        if change:
+            old_levels = dict(EmotionRanking.objects.filter(pk=obj.pk).values_list('emotion_id', 'agreement_level'))
+        super().save_model(request, obj, form, change)
+        add_summary_deltas(obj.rating.image_id, rating_summary_deltas(old_levels, {obj.emotion_id: obj.agreement_level}))
+    
+    def delete_model(self, request, obj):
+        subtract_rankings(EmotionRanking.objects.filter(pk=obj.pk))
+        super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        subtract_rankings(queryset)
+        super().delete_queryset(request, queryset)
 
 
 @admin.register(StudyConfiguration)
@@ -173,4 +299,115 @@ class StudyConfigurationAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         if obj.is_active:
             StudyConfiguration.objects.filter(is_active=True).update(is_active=False)
-        super().save_model(request, obj, form, change)
\ No newline at end of file
+        super().save_model(request, obj, form, change)
+        # O update acima não dispara sinais; garante a invalidação do cache
+        invalidate_active_config()
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'description', 'status', 'progress_display', 'rows_per_second_display', 'created_at', 'finished_at', 'download_link']
+    list_filter = ['status']
+    readonly_fields = [
+        'description', 'filters', 'status', 'progress_display', 'rows_per_second_display',
+        'download_link', 'error', 'created_at', 'started_at', 'finished_at',
+    ]
+    fields = readonly_fields
+    actions = ['requeue_jobs']
+    
+    def has_add_permission(self, request):
+        # Jobs são criados pelas ações de exportação das outras páginas
+        return False
+    
+    def progress_display(self, obj):
+        if obj.total_rows:
+            return f"{obj.rows_written}/{obj.total_rows} ({obj.rows_written * 100 // obj.total_rows}%)"
+        return f"{obj.rows_written}"
+    progress_display.short_description = 'Rows'
+    
+    def rows_per_second_display(self, obj):
+        return f"{obj.rows_per_second:.0f}" if obj.rows_per_second else '-'
+    rows_per_second_display.short_description = 'Rows/s'
+    
+    def download_link(self, obj):
+        if obj.status == ExportJob.STATUS_DONE and obj.file:
+            return format_html(
+                '<a href="{}">Download CSV</a>', reverse('faceStudy:download_export', args=[obj.pk])
+            )
+        return '-'
+    download_link.short_description = 'File'
+    
+    def requeue_jobs(self, request, queryset):
+        """Coloca jobs com falha de volta na fila (retomam do último checkpoint)"""
+        count = queryset.filter(status=ExportJob.STATUS_FAILED).update(status=ExportJob.STATUS_PENDING)
+        self.message_user(request, f'{count} job(s) queued again.')
+    requeue_jobs.short_description = 'Retry failed jobs'
+
+
+@admin.register(ImageEmotionAgreement)
+class ImageEmotionAgreementAdmin(admin.ModelAdmin):
+    list_display = ['image', 'emotion', 'n_ratings', 'mean_display', 'std_display', 'entropy_display', 'computed_at']
+    list_filter = ['emotion']
+    list_select_related = ['image', 'emotion']
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+    search_fields = ['image__code']
+    ordering = ['-std']
+    actions = ['export_agreement']
+    
+    def has_add_permission(self, request):
+        # Gerado pelo comando compute_agreement
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def mean_display(self, obj):
+        return f"{obj.mean:.3f}"
+    mean_display.short_description = 'Mean'
+    mean_display.admin_order_field = 'mean'
+    
+    def std_display(self, obj):
+        return f"{obj.std:.3f}"
+    std_display.short_description = 'Std'
+    std_display.admin_order_field = 'std'
+    
+    def entropy_display(self, obj):
+        return f"{obj.entropy:.3f}"
+    entropy_display.short_description = 'Entropy (bits)'
+    entropy_display.admin_order_field = 'entropy'
+    
+    def export_agreement(self, request, queryset):
+        """Exporta as estatísticas selecionadas para CSV"""
+        return export_agreement_to_csv(queryset)
+    export_agreement.short_description = 'Export selected statistics to CSV'
+
+
+@admin.register(EmotionReliability)
+class EmotionReliabilityAdmin(admin.ModelAdmin):
+    list_display = ['emotion', 'n_images', 'n_ratings', 'n_raters', 'mean_display', 'alpha_display', 'icc_display', 'computed_at']
+    list_select_related = ['emotion']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def format_statistic(self, value):
+        return '-' if value is None else f"{value:.3f}"
+    
+    def mean_display(self, obj):
+        return self.format_statistic(obj.mean_agreement)
+    mean_display.short_description = 'Mean agreement'
+    mean_display.admin_order_field = 'mean_agreement'
+    
+    def alpha_display(self, obj):
+        return self.format_statistic(obj.krippendorff_alpha)
+    alpha_display.short_description = "Krippendorff's alpha"
+    alpha_display.admin_order_field = 'krippendorff_alpha'
+    
+    def icc_display(self, obj):
+        return self.format_statistic(obj.icc)
+    icc_display.short_description = 'ICC(1)'
+    icc_display.admin_order_field = 'icc'
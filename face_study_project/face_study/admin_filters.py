@@ -0,0 +1,143 @@
+# face_study/admin_filters.py
+from decimal import Decimal
+from django.conf import settings
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Exists, OuterRef
+from django.utils.functional import cached_property
+
+
+class InputFilter(admin.SimpleListFilter):
+    """
+    Filtro com campo de busca em vez de uma lista com todas as opções.
+
+    Útil para chaves estrangeiras com muitos registros (ex.: participantes),
+    que o filtro padrão renderizaria inteiras na barra lateral.
+    """
+    template = 'admin/face_study/input_filter.html'
+    placeholder = ''
+
+    def lookups(self, request, model_admin):
+        # Uma opção fictícia só para o filtro ser exibido
+        return [('', '')]
+
+    def get_facet_counts(self, pk_attname, filtered_qs):
+        return {}
+
+    def choices(self, changelist):
+        # Os outros parâmetros da listagem viram campos ocultos do formulário
+        hidden = [
+            (key, value) for key, value in changelist.params.items()
+            if key != self.parameter_name
+        ]
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'hidden_params': hidden,
+            'placeholder': self.placeholder,
+            'display': 'All',
+        }
+
+
+class ParticipantEmailFilter(InputFilter):
+    """Filtra avaliações pelo início do e-mail do participante"""
+    title = 'participant e-mail'
+    parameter_name = 'participant_email'
+    placeholder = 'e-mail starts with...'
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(participant__email__istartswith=self.value().strip())
+        return queryset
+
+
+class RatedByParticipantFilter(InputFilter):
+    """Filtra imagens avaliadas por participantes cujo e-mail começa com o texto informado"""
+    title = 'rated by'
+    parameter_name = 'rated_by'
+    placeholder = 'e-mail starts with...'
+
+    def queryset(self, request, queryset):
+        from .models import ImageRating
+
+        if self.value():
+            ratings = ImageRating.objects.filter(
+                image=OuterRef('pk'),
+                participant__email__istartswith=self.value().strip(),
+            )
+            return queryset.filter(Exists(ratings))
+        return queryset
+
+
+class AgreementLevelBucketFilter(admin.SimpleListFilter):
+    """Faixas fixas de nível de concordância em vez de um item por valor distinto"""
+    title = 'agreement level'
+    parameter_name = 'agreement_bucket'
+    buckets = [
+        ('0.0-0.2', Decimal('0.00'), Decimal('0.20')),
+        ('0.2-0.4', Decimal('0.20'), Decimal('0.40')),
+        ('0.4-0.6', Decimal('0.40'), Decimal('0.60')),
+        ('0.6-0.8', Decimal('0.60'), Decimal('0.80')),
+        ('0.8-1.0', Decimal('0.80'), Decimal('1.00')),
+    ]
+
+    def lookups(self, request, model_admin):
+        return [(label, label) for label, _, _ in self.buckets]
+
+    def queryset(self, request, queryset):
+        for label, low, high in self.buckets:
+            if self.value() == label:
+                # A última faixa inclui o 1.00
+                if high == Decimal('1.00'):
+                    return queryset.filter(agreement_level__gte=low, agreement_level__lte=high)
+                return queryset.filter(agreement_level__gte=low, agreement_level__lt=high)
+        return queryset
+
+
+def estimated_row_count(model):
+    """
+    Número aproximado de linhas da tabela segundo as estatísticas do banco.
+
+    Retorna None quando o banco não oferece estatísticas (ex.: SQLite).
+    """
+    connection = connections[model.objects.db]
+    table = model._meta.db_table
+
+    if connection.vendor == 'mysql':
+        sql = (
+            'SELECT TABLE_ROWS FROM information_schema.TABLES '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s'
+        )
+    elif connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s'
+    else:
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Paginador que evita COUNT(*) exato em listagens sem filtro de tabelas grandes.
+
+    Sem filtros, usa a estimativa das estatísticas da tabela quando ela passa
+    de ADMIN_APPROXIMATE_COUNT_THRESHOLD; abaixo disso (ou com filtros) faz
+    a contagem exata.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is not None and not query.where:
+            threshold = getattr(settings, 'ADMIN_APPROXIMATE_COUNT_THRESHOLD', 100000)
+            estimate = estimated_row_count(queryset.model)
+            if estimate is not None and estimate > threshold:
+                return estimate
+        return super().count
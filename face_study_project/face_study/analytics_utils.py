@@ -0,0 +1,234 @@
+# face_study/analytics_utils.py
+import logging
+import time
+from django.db import connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Rankings lidos por consulta ao montar os arrays
+ANALYTICS_CHUNK_SIZE = 50000
+
+# Faixas de 0 a 1 usadas na entropia das notas de uma imagem
+AGREEMENT_ENTROPY_BINS = 5
+
+# Linhas por INSERT ao gravar as tabelas de resumo
+SUMMARY_BATCH_SIZE = 5000
+
+
+def load_ranking_arrays(rankings=None, chunk_size=ANALYTICS_CHUNK_SIZE):
+    """
+    Carrega os rankings como arrays NumPy alinhados (imagem x avaliador x emoção).
+
+    Lê em lotes por id direto do cursor (sem instanciar modelos nem os
+    conversores do ORM) e troca as chaves por índices inteiros. Retorna um
+    dict com image_index, participant_index, emotion_index e values, mais
+    as listas image_ids, participant_ids e emotion_ids que os índices
+    referenciam.
+    """
+    import numpy as np
+    from .models import EmotionRanking
+
+    if rankings is None:
+        rankings = EmotionRanking.objects.all()
+
+    images, participants, emotions = {}, {}, {}
+    parts = []
+    last_id = 0
+    while True:
+        chunk = rankings.filter(id__gt=last_id).order_by('id').values_list(
+            'id', 'rating__image_id', 'rating__participant_id', 'emotion_id', 'agreement_level'
+        )[:chunk_size]
+        sql, params = chunk.query.sql_with_params()
+        with connections[chunk.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        _, image_keys, participant_keys, emotion_keys, levels = zip(*rows)
+        count = len(rows)
+        parts.append((
+            np.fromiter((images.setdefault(key, len(images)) for key in image_keys), np.int32, count),
+            np.fromiter((participants.setdefault(key, len(participants)) for key in participant_keys), np.int32, count),
+            np.fromiter((emotions.setdefault(key, len(emotions)) for key in emotion_keys), np.int32, count),
+            np.asarray(levels, dtype=np.float64),
+        ))
+
+    if parts:
+        image_index, participant_index, emotion_index, values = (np.concatenate(column) for column in zip(*parts))
+    else:
+        image_index = participant_index = emotion_index = np.zeros(0, dtype=np.int32)
+        values = np.zeros(0, dtype=np.float64)
+
+    return {
+        'image_index': image_index,
+        'participant_index': participant_index,
+        'emotion_index': emotion_index,
+        'values': values,
+        'image_ids': list(images),
+        'participant_ids': list(participants),
+        'emotion_ids': list(emotions),
+    }
+
+
+def image_emotion_stats(arrays, bins=AGREEMENT_ENTROPY_BINS):
+    """
+    Estatísticas de cada par (imagem, emoção) com pelo menos uma nota.
+
+    Tudo com np.unique/np.bincount sobre os arrays de load_ranking_arrays.
+    Retorna arrays alinhados por grupo: image_index, emotion_index, n, sum,
+    sum_sq, mean, std (amostral, 0 com uma só nota) e entropy (bits, das
+    notas em `bins` faixas iguais de 0 a 1).
+    """
+    import numpy as np
+
+    values = arrays['values']
+    emotion_count = max(len(arrays['emotion_ids']), 1)
+    keys = arrays['image_index'].astype(np.int64) * emotion_count + arrays['emotion_index']
+    group_keys, group = np.unique(keys, return_inverse=True)
+    group_count = len(group_keys)
+
+    n = np.bincount(group, minlength=group_count).astype(np.float64)
+    total = np.bincount(group, weights=values, minlength=group_count)
+    total_sq = np.bincount(group, weights=values * values, minlength=group_count)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / n
+        variance = np.where(n > 1, (total_sq - total * mean) / (n - 1), 0.0)
+    std = np.sqrt(np.clip(variance, 0, None))
+
+    level_bin = np.minimum((values * bins).astype(np.int64), bins - 1)
+    counts = np.bincount(group * bins + level_bin, minlength=group_count * bins).reshape(group_count, bins)
+    probability = counts / n[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entropy = -np.where(probability > 0, probability * np.log2(probability), 0.0).sum(axis=1)
+
+    return {
+        'image_index': (group_keys // emotion_count).astype(np.int32),
+        'emotion_index': (group_keys % emotion_count).astype(np.int32),
+        'n': n,
+        'sum': total,
+        'sum_sq': total_sq,
+        'mean': mean,
+        'std': std,
+        'entropy': entropy,
+    }
+
+
+def emotion_reliability(groups, emotion_count):
+    """
+    Confiabilidade entre avaliadores por emoção, a partir de n, soma e soma
+    dos quadrados de cada (imagem, emoção).
+
+    - alpha de Krippendorff com métrica intervalar: 1 - Do/De, usando só
+      imagens com duas ou mais notas (valores pareáveis);
+    - ICC(1) de efeitos aleatórios de uma via, que admite números
+      diferentes de avaliadores por imagem (cada imagem é avaliada por um
+      subconjunto sorteado de participantes).
+
+    Retorna arrays por emoção: units, n, mean, alpha e icc (NaN quando não
+    há dados suficientes).
+    """
+    import numpy as np
+
+    pairable = groups['n'] >= 2
+    emotion = groups['emotion_index'][pairable]
+    n = groups['n'][pairable]
+    total = groups['sum'][pairable]
+    total_sq = groups['sum_sq'][pairable]
+
+    def per_emotion(weights):
+        return np.bincount(emotion, weights=weights, minlength=emotion_count)
+
+    units = np.bincount(emotion, minlength=emotion_count).astype(np.float64)
+    values = per_emotion(n)
+    grand_sum = per_emotion(total)
+    grand_sum_sq = per_emotion(total_sq)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Soma de (vi - vj)^2 sobre os pares ordenados de cada imagem: 2(n S2 - S1^2)
+        observed = per_emotion(2 * (n * total_sq - total * total) / (n - 1)) / values
+        expected = 2 * (values * grand_sum_sq - grand_sum * grand_sum) / (values * (values - 1))
+        alpha = np.where((values > 1) & (expected > 0), 1 - observed / expected, np.nan)
+
+        between = per_emotion(total * total / n) - grand_sum * grand_sum / values
+        within = grand_sum_sq - per_emotion(total * total / n)
+        ms_between = between / (units - 1)
+        ms_within = within / (values - units)
+        n0 = (values - per_emotion(n * n) / values) / (units - 1)
+        icc = (ms_between - ms_within) / (ms_between + (n0 - 1) * ms_within)
+        icc = np.where((units > 1) & (values > units) & np.isfinite(icc), icc, np.nan)
+
+        mean = grand_sum / values
+
+    return {'units': units, 'n': values, 'mean': mean, 'alpha': alpha, 'icc': icc}
+
+
+def compute_agreement_summaries(chunk_size=ANALYTICS_CHUNK_SIZE):
+    """
+    Recalcula ImageEmotionAgreement e EmotionReliability a partir de todos
+    os rankings e regrava as duas tabelas numa transação.
+
+    Retorna um dict com rankings, groups, emotions e seconds.
+    """
+    import numpy as np
+    from .models import EmotionReliability, ImageEmotionAgreement
+
+    started = time.monotonic()
+    arrays = load_ranking_arrays(chunk_size=chunk_size)
+    loaded = time.monotonic()
+    groups = image_emotion_stats(arrays)
+    reliability = emotion_reliability(groups, len(arrays['emotion_ids']))
+    logger.info(
+        'Loaded %d ranking(s) in %.1fs, statistics in %.1fs',
+        len(arrays['values']), loaded - started, time.monotonic() - loaded,
+    )
+
+    image_ids = arrays['image_ids']
+    emotion_ids = arrays['emotion_ids']
+    participants = arrays['participant_index']
+    now = timezone.now()
+
+    def nullable(value):
+        return None if np.isnan(value) else float(value)
+
+    with transaction.atomic():
+        ImageEmotionAgreement.objects.all().delete()
+        columns = zip(
+            groups['image_index'].tolist(), groups['emotion_index'].tolist(), groups['n'].tolist(),
+            groups['mean'].tolist(), groups['std'].tolist(), groups['entropy'].tolist(),
+        )
+        batch = []
+        for image, emotion, n, mean, std, entropy in columns:
+            batch.append(ImageEmotionAgreement(
+                image_id=image_ids[image], emotion_id=emotion_ids[emotion], n_ratings=int(n),
+                mean=mean, std=std, entropy=entropy, computed_at=now,
+            ))
+            if len(batch) >= SUMMARY_BATCH_SIZE:
+                ImageEmotionAgreement.objects.bulk_create(batch)
+                batch = []
+        ImageEmotionAgreement.objects.bulk_create(batch)
+
+        EmotionReliability.objects.all().delete()
+        EmotionReliability.objects.bulk_create([
+            EmotionReliability(
+                emotion_id=emotion_id,
+                n_images=int(reliability['units'][index]),
+                n_ratings=int(np.count_nonzero(arrays['emotion_index'] == index)),
+                n_raters=len(np.unique(participants[arrays['emotion_index'] == index])),
+                mean_agreement=nullable(reliability['mean'][index]),
+                krippendorff_alpha=nullable(reliability['alpha'][index]),
+                icc=nullable(reliability['icc'][index]),
+                computed_at=now,
+            )
+            for index, emotion_id in enumerate(emotion_ids)
+        ])
+
+    return {
+        'rankings': len(arrays['values']),
+        'groups': len(groups['n']),
+        'emotions': len(emotion_ids),
+        'seconds': time.monotonic() - started,
+    }
@@ -0,0 +1,161 @@
+# face_study/api_views.py
+import json
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.http import require_GET, require_POST
+from .catalog_utils import get_emotion_catalog
+from .config_utils import get_active_config
+from .forms import ParticipantEmailForm
+from .models import FaceImage, ImageRating, Participant
+from .session_utils import (
+    get_session_participant, session_images, session_progress, start_study_session, submit_session_rating,
+)
+
+# API JSON da página de avaliação: uma requisição por nota, sem redirect nem
+# renderização de template, e cada resposta já traz a imagem seguinte para
+# o navegador pré-carregar enquanto o participante avalia a atual.
+
+
+def request_data(request):
+    """Corpo da requisição em JSON ou formulário"""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+def no_session_response():
+    return JsonResponse({
+        'error': 'No active rating session.',
+        'start_url': reverse('faceStudy:start_session'),
+    }, status=409)
+
+
+def invalid_json_response():
+    return JsonResponse({'errors': {'__all__': ['Invalid JSON body.']}}, status=400)
+
+
+def image_payload(image, config, previous_levels=None):
+    """Metadados de uma imagem para o cliente (URL da versão web para exibir/pré-carregar)"""
+    if image is None:
+        return None
+    payload = {
+        'id': str(image.id),
+        'code': image.code,
+        'url': image.web_image_url,
+        'thumbnail_url': image.thumbnail_url,
+        'rating_count': image.rating_count,
+        'max_ratings': config.max_ratings_per_image,
+    }
+    if previous_levels is not None:
+        payload['previous_levels'] = previous_levels
+    return payload
+
+
+def previous_levels(participant, image):
+    """Níveis de uma avaliação anterior do participante para a imagem ({} se não houver)"""
+    rating = ImageRating.objects.filter(participant=participant, image=image).first()
+    if rating is None:
+        return {}
+    return {
+        str(emotion_id): str(level)
+        for emotion_id, level in rating.emotion_rankings.values_list('emotion_id', 'agreement_level')
+    }
+
+
+def session_state(request, participant, config):
+    """Progresso, imagem atual (com níveis anteriores) e imagem seguinte para pré-carregar"""
+    state = request.study_state
+    progress = session_progress(state)
+    current = following = None
+    if not progress['complete']:
+        current, following = session_images(state, participant, config)
+        if current is None:
+            # Não há mais imagens disponíveis para este participante
+            state.end()
+            progress['complete'] = True
+
+    return {
+        'progress': progress,
+        'complete': progress['complete'],
+        'complete_url': reverse('faceStudy:session_complete'),
+        'image': image_payload(current, config, previous_levels(participant, current) if current else None),
+        'next_image': image_payload(following, config),
+    }
+
+
+@require_POST
+def api_start_session(request):
+    data = request_data(request)
+    if data is None:
+        return invalid_json_response()
+    form = ParticipantEmailForm(data)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+
+    participant, _ = Participant.objects.get_or_create(email=form.cleaned_data['email'])
+    participant.last_session_at = timezone.now()
+    participant.save(update_fields=['last_session_at'])
+
+    config = get_active_config()
+    start_study_session(request, participant, config)
+
+    state = session_state(request, participant, config)
+    state['emotions'] = [
+        {'id': emotion.id, 'name': emotion.name, 'field': f'emotion_{emotion.id}'}
+        for emotion in get_emotion_catalog().emotions
+    ]
+    return JsonResponse(state)
+
+
+@require_GET
+def api_next_image(request):
+    participant = get_session_participant(request)
+    if participant is None:
+        return no_session_response()
+    return JsonResponse(session_state(request, participant, get_active_config()))
+
+
+@require_POST
+def api_submit_rating(request):
+    """
+    Grava a nota da imagem atual e responde com a próxima.
+
+    Corpo: image_id e os campos emotion_<id>. A resposta traz a nova imagem
+    atual e a seguinte (next_image) para o cliente pré-carregar.
+    """
+    participant = get_session_participant(request)
+    if participant is None:
+        return no_session_response()
+
+    data = request_data(request)
+    if data is None:
+        return invalid_json_response()
+
+    image = FaceImage.objects.filter(id=data.get('image_id')).first() if data.get('image_id') else None
+    if image is None:
+        return JsonResponse({'errors': {'image_id': ['Unknown image.']}}, status=400)
+
+    rating, errors, position = submit_session_rating(
+        participant, image, data, get_emotion_catalog().emotions, request.study_state.token
+    )
+
+    if errors:
+        # Nada foi gravado
+        return JsonResponse({'errors': errors}, status=400)
+
+    request.study_state.mark_rated(position)
+    state = session_state(request, participant, get_active_config())
+    state['saved'] = str(image.id)
+    return JsonResponse(state)
+
+
+@require_GET
+def api_progress(request):
+    if get_session_participant(request) is None:
+        return no_session_response()
+    return JsonResponse({'progress': session_progress(request.study_state)})
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FaceStudyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'face_study'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,116 @@
+# face_study/async_views.py
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.utils import timezone
+from .catalog_utils import get_emotion_catalog
+from .config_utils import get_active_config
+from .forms import ParticipantEmailForm
+from .models import FaceImage, ImageRating, Participant
+from .session_utils import (
+    aend_study_session, aget_session_participant, asession_images, astart_study_session, submit_session_rating,
+)
+
+# Versões async das páginas da sessão de avaliação (start_session,
+# rate_images e session_complete), usadas quando o projeto é servido por
+# ASGI (ver STUDY_ASYNC_VIEWS). Enquanto uma requisição espera o banco o
+# worker atende outras, em vez de prender uma thread por participante.
+#
+# O estado da sessão vem do cookie (request.study_state), sem acesso ao
+# banco; o contexto dos templates é montado por completo antes de
+# renderizar, e a renderização roda numa thread porque as mensagens podem
+# carregar a sessão do Django do banco.
+
+aget_active_config = sync_to_async(get_active_config)
+aget_emotion_catalog = sync_to_async(get_emotion_catalog)
+arender = sync_to_async(render)
+
+
+async def start_session(request):
+    if request.method == 'POST':
+        form = ParticipantEmailForm(request.POST)
+        if form.is_valid():
+            participant, _ = await Participant.objects.aget_or_create(email=form.cleaned_data['email'])
+            participant.last_session_at = timezone.now()
+            await participant.asave(update_fields=['last_session_at'])
+
+            await astart_study_session(request, participant, await aget_active_config())
+            return redirect('faceStudy:rate_images')
+    else:
+        form = ParticipantEmailForm()
+
+    return await arender(request, 'studyInterfaces/start_session.html', {
+        'form': form,
+        'study_config': await aget_active_config(),
+    })
+
+
+async def rate_images(request):
+    participant = await aget_session_participant(request)
+    if participant is None:
+        return redirect('faceStudy:start_session')
+
+    state = request.study_state
+    config = await aget_active_config()
+    catalog = await aget_emotion_catalog()
+    emotions = catalog.emotions
+
+    if request.method == 'POST':
+        image = await aget_object_or_404(FaceImage, id=request.POST.get('image_id'))
+        rating, errors, position = await sync_to_async(submit_session_rating)(
+            participant, image, request.POST, emotions, state.token
+        )
+
+        if errors:
+            for error in errors.values():
+                messages.error(request, error)
+            return redirect('faceStudy:rate_images')
+
+        if state.mark_rated(position):
+            return redirect('faceStudy:session_complete')
+        return redirect('faceStudy:rate_images')
+
+    if state.complete:
+        state.end()
+        return redirect('faceStudy:session_complete')
+
+    current_image, following_image = await asession_images(state, participant, config)
+    if not current_image:
+        state.end()
+        return redirect('faceStudy:session_complete')
+
+    previous_rating = await ImageRating.objects.filter(participant=participant, image=current_image).afirst()
+    form = catalog.form_class()
+    if previous_rating:
+        form = catalog.form_class(initial={
+            f'emotion_{emotion_id}': str(level)
+            async for emotion_id, level in previous_rating.emotion_rankings.values_list('emotion_id', 'agreement_level')
+        })
+
+    image_rating_count = current_image.rating_count
+    return await arender(request, 'studyInterfaces/rate_images.html', {
+        'image': current_image,
+        'next_image': following_image,
+        'emotions': emotions,
+        'form': form,
+        'config': config,
+        'has_previous_rating': previous_rating is not None,
+        'image_rating_info': {
+            'current_count': image_rating_count,
+            'max_allowed': config.max_ratings_per_image,
+            'progress_percent': (image_rating_count / config.max_ratings_per_image) * 100,
+            'remaining': config.max_ratings_per_image - image_rating_count,
+        },
+        'progress': {
+            'current': state.rated + 1,
+            'total': state.image_count,
+            'min_images': state.min_images,
+            'max_images': state.max_images,
+            'estimated_time': state.image_count * 2,
+        },
+    })
+
+
+async def session_complete(request):
+    await aend_study_session(request)
+    return await arender(request, 'studyInterfaces/session_complete.html')
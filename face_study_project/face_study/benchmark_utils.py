@@ -0,0 +1,607 @@
+# face_study/benchmark_utils.py
+import asyncio
+import contextvars
+import random
+import re
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.cookies import SimpleCookie
+from io import BytesIO
+from urllib.parse import urlencode, urlsplit
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.urls import path
+
+# Páginas da sessão de avaliação, que existem em versão sync e async
+SESSION_VIEW_NAMES = ('start_session', 'rate_images', 'session_complete')
+
+IMAGE_ID_PATTERN = re.compile(r'name="image_id" id="imageIdInput" value="([^"]+)"')
+
+# Hosts tentados nas requisições simuladas, antes dos de ALLOWED_HOSTS
+BENCHMARK_HOSTS = ('localhost', 'testserver')
+
+# Contador de consultas da requisição em andamento ([n]); sync_to_async
+# copia o contexto para as threads, então as consultas feitas nelas contam
+_request_queries = contextvars.ContextVar('face_study_benchmark_queries', default=None)
+
+
+def session_urlconf(use_async):
+    """
+    URLconf do app com as páginas da sessão na versão pedida.
+
+    Usado como ROOT_URLCONF (é um módulo) para medir as duas versões no
+    mesmo processo, independente de STUDY_ASYNC_VIEWS.
+    """
+    from django.urls import include
+    from . import async_views, urls, views
+
+    source = async_views if use_async else views
+    patterns = [pattern for pattern in urls.urlpatterns if getattr(pattern, 'name', None) not in SESSION_VIEW_NAMES]
+    patterns += [
+        path(f'{route}/', getattr(source, name), name=name)
+        for route, name in zip(('start', 'rate', 'complete'), SESSION_VIEW_NAMES)
+    ]
+    module = types.ModuleType(f'face_study_{"async" if use_async else "sync"}_session_urls')
+    module.urlpatterns = [path('', include((patterns, urls.app_name)))]
+    return module
+
+
+def percentile(values, percent):
+    """Percentil por posição (nearest rank) de uma lista de números"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(int(round(percent / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def benchmark_host():
+    """
+    Host das requisições simuladas que o ALLOWED_HOSTS atual aceita.
+
+    O Django recusa (400) qualquer outro; com DEBUG e ALLOWED_HOSTS vazio
+    valem os hosts locais, e o executor de testes acrescenta 'testserver'.
+    """
+    from django.conf import settings
+    from django.http.request import validate_host
+
+    allowed = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed:
+        allowed = ['.localhost', '127.0.0.1', '[::1]']
+    candidates = [*BENCHMARK_HOSTS, *(host.lstrip('.') for host in allowed if host != '*')]
+    for host in candidates:
+        if validate_host(host, allowed):
+            return host
+    raise RuntimeError(f'No host accepted by ALLOWED_HOSTS={settings.ALLOWED_HOSTS!r}.')
+
+
+@contextmanager
+def instrument_connections(wrapper):
+    """
+    Instala um execute_wrapper em todas as conexões abertas enquanto o bloco roda.
+
+    As threads do handler abrem conexões próprias, que o execute_wrapper()
+    do Django (só a conexão da thread atual) não alcançaria. A mesma
+    conexão reaberta não recebe o wrapper duas vezes.
+    """
+    def install(sender, connection, **kwargs):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
+
+    connection_created.connect(install)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(install)
+        for connection in connections.all(initialized_only=True):
+            if wrapper in connection.execute_wrappers:
+                connection.execute_wrappers.remove(wrapper)
+
+
+@contextmanager
+def simulated_db_latency(seconds):
+    """
+    Acrescenta `seconds` de espera a cada consulta.
+
+    Aproxima um banco na rede (o SQLite local responde rápido demais para
+    que a espera pelo banco apareça na comparação sync x async).
+    """
+    if not seconds:
+        yield
+        return
+
+    def wrapper(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    with instrument_connections(wrapper):
+        yield
+
+
+def count_request_query(execute, sql, params, many, context):
+    counter = _request_queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def counting_queries():
+    """Conta as consultas de cada requisição do BenchmarkBrowser (HttpResult.queries)"""
+    return instrument_connections(count_request_query)
+
+
+class HttpResult:
+    def __init__(self, method, path, status, headers, body, seconds, queries):
+        self.method = method
+        self.path = path
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.seconds = seconds
+        self.queries = queries
+
+    @property
+    def location(self):
+        for name, value in self.headers:
+            if name.lower() == 'location':
+                return urlsplit(value).path
+        return None
+
+
+class BenchmarkBrowser:
+    """
+    Um participante falando direto com o handler WSGI ou ASGI do Django.
+
+    Guarda os cookies (sessão, CSRF, mensagens) entre as requisições, como
+    um navegador, e anota o tempo de cada resposta.
+    """
+
+    def __init__(self):
+        self.host = benchmark_host()
+        self.cookies = {}
+        self.results = []
+        self.completed = False
+
+    def _prepare(self, method, data):
+        body = urlencode(data).encode() if data is not None else b''
+        headers = [('host', self.host)]
+        if self.cookies:
+            headers.append(('cookie', '; '.join(f'{name}={value}' for name, value in self.cookies.items())))
+        if method == 'POST':
+            headers.append(('content-type', 'application/x-www-form-urlencoded'))
+            headers.append(('content-length', str(len(body))))
+            headers.append(('x-csrftoken', self.cookies.get('csrftoken', '')))
+        return body, headers
+
+    def _finish(self, method, path, status, headers, body, started, queries):
+        for name, value in headers:
+            if name.lower() == 'set-cookie':
+                for morsel in SimpleCookie(value).values():
+                    if morsel['max-age'] == '0':
+                        self.cookies.pop(morsel.key, None)
+                    else:
+                        self.cookies[morsel.key] = morsel.value
+        result = HttpResult(method, path, status, headers, body, time.perf_counter() - started, queries)
+        self.results.append(result)
+        return result
+
+    def wsgi_request(self, application, method, path, data=None):
+        body, headers = self._prepare(method, data)
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'SCRIPT_NAME': '',
+            'QUERY_STRING': '',
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': BytesIO(),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers:
+            key = name.upper().replace('-', '_')
+            environ[key if key in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{key}'] = value
+
+        response = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            response['status'] = int(status.split()[0])
+            response['headers'] = response_headers
+
+        queries = [0]
+        reset = _request_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            chunks = application(environ, start_response)
+            try:
+                content = b''.join(chunks)
+            finally:
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+        finally:
+            _request_queries.reset(reset)
+        return self._finish(method, path, response['status'], response['headers'], content, started, queries[0])
+
+    async def asgi_request(self, application, method, path, data=None):
+        body, headers = self._prepare(method, data)
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': [(name.encode(), value.encode()) for name, value in headers],
+            'client': ('127.0.0.1', 0),
+            'server': (self.host, 80),
+        }
+        sent = asyncio.Event()
+        response = {'body': []}
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            # O Django espera uma desconexão enquanto responde
+            await sent.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = [(name.decode(), value.decode()) for name, value in message['headers']]
+            elif message['type'] == 'http.response.body':
+                response['body'].append(message.get('body', b''))
+                if not message.get('more_body'):
+                    sent.set()
+
+        queries = [0]
+        reset = _request_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            await application(scope, receive, send)
+        finally:
+            _request_queries.reset(reset)
+        return self._finish(
+            method, path, response['status'], response['headers'], b''.join(response['body']), started, queries[0]
+        )
+
+
+def participant_requests(browser, email, emotion_ids, paths):
+    """
+    Roteiro de um participante: início, uma nota por imagem até o fim da sessão.
+
+    Gerador de (método, caminho, dados); cada resposta volta por send(). O
+    mesmo roteiro é usado pelos dois handlers.
+    """
+    yield 'GET', paths['start_session'], None
+    response = yield 'POST', paths['start_session'], {'email': email}
+    while response.status == 302 and response.location == paths['rate_images']:
+        response = yield 'GET', paths['rate_images'], None
+        match = IMAGE_ID_PATTERN.search(response.body.decode()) if response.status == 200 else None
+        if match is None:
+            break
+        levels = {f'emotion_{emotion_id}': f'{random.randint(0, 100) / 100:.2f}' for emotion_id in emotion_ids}
+        response = yield 'POST', paths['rate_images'], {'image_id': match.group(1), **levels}
+    if response.status == 302 and response.location == paths['session_complete']:
+        response = yield 'GET', paths['session_complete'], None
+        browser.completed = response.status == 200
+
+
+def run_wsgi_participant(application, email, emotion_ids, paths):
+    browser = BenchmarkBrowser()
+    script = participant_requests(browser, email, emotion_ids, paths)
+    try:
+        step = next(script)
+        while True:
+            step = script.send(browser.wsgi_request(application, *step))
+    except StopIteration:
+        pass
+    return browser
+
+
+async def run_asgi_participant(application, email, emotion_ids, paths):
+    browser = BenchmarkBrowser()
+    script = participant_requests(browser, email, emotion_ids, paths)
+    try:
+        step = next(script)
+        while True:
+            step = script.send(await browser.asgi_request(application, *step))
+    except StopIteration:
+        pass
+    return browser
+
+
+def run_wsgi_load(emails, emotion_ids, paths, concurrency):
+    """Participantes atendidos pelo WSGIHandler com uma thread por requisição simultânea"""
+    from django.core.handlers.wsgi import WSGIHandler
+
+    application = WSGIHandler()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(run_wsgi_participant, application, email, emotion_ids, paths)
+            for email in emails
+        ]
+        return [future.result() for future in futures]
+
+
+async def run_asgi_load(emails, emotion_ids, paths, concurrency):
+    """Os mesmos participantes no ASGIHandler, num único event loop"""
+    from django.core.handlers.asgi import ASGIHandler
+
+    application = ASGIHandler()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def participant(email):
+        async with semaphore:
+            return await run_asgi_participant(application, email, emotion_ids, paths)
+
+    return await asyncio.gather(*(participant(email) for email in emails))
+
+
+def results_summary(results):
+    """Requisições, erros, latências (ms) e consultas por requisição de uma lista de HttpResult"""
+    latencies = [result.seconds * 1000 for result in results]
+    return {
+        'requests': len(results),
+        'errors': sum(1 for result in results if result.status >= 400),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'queries_per_request': sum(result.queries for result in results) / len(results) if results else 0.0,
+    }
+
+
+def load_summary(browsers, seconds):
+    """Resumo de uma rodada de carga: participantes, vazão e o resumo das requisições"""
+    results = [result for browser in browsers for result in browser.results]
+    return {
+        'participants': len(browsers),
+        'completed': sum(1 for browser in browsers if browser.completed),
+        'seconds': seconds,
+        'requests_per_second': len(results) / seconds if seconds else 0.0,
+        **results_summary(results),
+    }
+
+
+def endpoint_summaries(browsers, paths):
+    """{"MÉTODO nome": resumo} por endpoint, com os nomes de `paths` ({nome: caminho})"""
+    names = {route: name for name, route in paths.items()}
+    by_endpoint = {}
+    for browser in browsers:
+        for result in browser.results:
+            endpoint = f'{result.method} {names.get(result.path, result.path)}'
+            by_endpoint.setdefault(endpoint, []).append(result)
+    return {endpoint: results_summary(results) for endpoint, results in sorted(by_endpoint.items())}
+
+
+def check_invariants():
+    """
+    Violações dos invariantes do estudo, contadas direto nas tabelas ({nome: violações}).
+
+    - over_max_ratings: imagens com mais avaliações que max_ratings_per_image;
+    - duplicate_ratings: pares (participante, imagem) avaliados mais de uma vez;
+    - rating_count / reserved_count: contadores desnormalizados de FaceImage errados;
+    - study_stats_ratings: total de avaliações do StudyStats diferente da tabela;
+    - summary_rankings: rankings somados em FaceEmotionSummary diferente da tabela.
+    """
+    from django.db.models import Count, F, Sum
+    from .config_utils import get_active_config
+    from .models import EmotionRanking, FaceEmotionSummary, FaceImage, ImageRating
+    from .stats_utils import get_study_stats
+
+    max_ratings = get_active_config().max_ratings_per_image
+    images = FaceImage.objects.with_actual_rating_count()
+    summarized = FaceEmotionSummary.objects.aggregate(total=Sum('count'))['total'] or 0
+    return {
+        'over_max_ratings': images.filter(actual_rating_count__gt=max_ratings).count(),
+        'duplicate_ratings': ImageRating.objects.order_by().values('participant_id', 'image_id').annotate(
+            ratings=Count('id')
+        ).filter(ratings__gt=1).count(),
+        'rating_count': images.exclude(rating_count=F('actual_rating_count')).count(),
+        'reserved_count': FaceImage.objects.with_actual_reserved_count().exclude(
+            reserved_count=F('actual_reserved_count')
+        ).count(),
+        'study_stats_ratings': abs(get_study_stats()['total_ratings'] - ImageRating.objects.count()),
+        'summary_rankings': abs(summarized - EmotionRanking.objects.count()),
+    }
+
+
+def delete_benchmark_data(email_prefix, browsers):
+    """
+    Remove os participantes de uma rodada (e-mails com o prefixo), as avaliações e as sessões deles.
+
+    delete_ratings_in_chunks mantém contadores, StudyStats e resumos em dia.
+    """
+    from django.conf import settings
+    from django.contrib.sessions.models import Session
+    from .bulk_utils import delete_ratings_in_chunks
+    from .models import ImageRating, Participant
+
+    participants = Participant.objects.filter(email__startswith=email_prefix)
+    delete_ratings_in_chunks(ImageRating.objects.filter(participant__in=participants))
+    participants.delete()
+    session_keys = {browser.cookies.get(settings.SESSION_COOKIE_NAME) for browser in browsers}
+    Session.objects.filter(session_key__in=session_keys - {None}).delete()
+
+
+# Changelists do admin medidos pela suíte (model_name de cada modelo)
+SUITE_ADMIN_MODELS = ('faceimage', 'participant', 'imagerating', 'emotionranking')
+
+
+def rolled_back(function):
+    """Versão de `function` que roda numa transação desfeita no fim (não deixa rastros no banco)"""
+    from django.db import transaction
+
+    def run():
+        with transaction.atomic():
+            function()
+            transaction.set_rollback(True)
+    return run
+
+
+def fetch_page(client, path):
+    """GET pelo test client; erro se a página não responder 200"""
+    response = client.get(path)
+    if response.status_code != 200:
+        raise RuntimeError(f'GET {path} returned {response.status_code}.')
+    return response
+
+
+def consume_export():
+    """Gera o CSV de export_ratings_to_csv inteiro; retorna o número de bytes"""
+    from .export_utils import export_ratings_to_csv
+
+    response = export_ratings_to_csv()
+    return sum(len(chunk) for chunk in response.streaming_content)
+
+
+def suite_cases(client, participant, config):
+    """
+    {nome: função} dos casos da suíte de benchmark, na ordem do relatório.
+
+    As páginas passam por todo o stack (middleware, views, templates) com o
+    test client logado; a seleção e a reserva de imagens para o participante
+    rodam em transações desfeitas, para que as medidas se repitam sobre os
+    mesmos dados.
+    """
+    from django.urls import reverse
+    from .selection_utils import reserve_images, select_next_image
+
+    cases = {'dashboard': lambda: fetch_page(client, reverse('faceStudy:dashboard'))}
+    for model_name in SUITE_ADMIN_MODELS:
+        path = reverse(f'admin:face_study_{model_name}_changelist')
+        cases[f'admin_{model_name}_changelist'] = lambda path=path: fetch_page(client, path)
+    cases['select_next_image'] = rolled_back(lambda: select_next_image(participant, config))
+    cases['reserve_images'] = rolled_back(
+        lambda: reserve_images(participant, config, config.max_images_per_session)
+    )
+    cases['export_ratings_csv'] = consume_export
+    return cases
+
+
+def time_case(function, repeat):
+    """Tempos (ms) de `repeat` execuções de function e as consultas da última"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'runs': repeat,
+        'min_ms': min(timings),
+        'median_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'max_ms': max(timings),
+        'queries': len(captured),
+    }
+
+
+def git_commit():
+    """Commit do código medido (None fora de um repositório git)"""
+    import subprocess
+    from django.conf import settings
+
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def dataset_summary():
+    """Tamanho dos dados medidos, lido das tabelas desnormalizadas (sem COUNT(*) nas grandes)"""
+    from django.db.models import Sum
+    from .models import FaceEmotionSummary
+    from .stats_utils import get_study_stats
+
+    stats = get_study_stats()
+    return {
+        'images': stats['total_images'],
+        'participants': stats['total_participants'],
+        'ratings': stats['total_ratings'],
+        'rankings': FaceEmotionSummary.objects.aggregate(total=Sum('count'))['total'] or 0,
+    }
+
+
+def run_benchmark_suite(repeat=5, only=None, progress=None):
+    """
+    Roda a suíte de benchmark sobre os dados atuais e retorna o relatório.
+
+    Um superusuário e, se não houver participantes, um participante
+    temporários são criados e removidos no fim. O relatório leva o commit,
+    o banco e o tamanho dos dados, para comparar rodadas
+    (ver compare_reports).
+    """
+    import uuid
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import override_settings
+    from django.utils import timezone
+    from .config_utils import get_active_config
+    from .models import Participant
+
+    run = uuid.uuid4().hex[:8]
+    user = get_user_model().objects.create_superuser(username=f'benchmark-{run}', email='', password=None)
+    participant = Participant.objects.order_by('id').first()
+    temporary_participant = participant is None
+    if temporary_participant:
+        participant = Participant.objects.create(email=f'benchmark-{run}@example.invalid')
+
+    client = Client()
+    results = {}
+    try:
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            client.force_login(user)
+            for name, function in suite_cases(client, participant, get_active_config()).items():
+                if only and name not in only:
+                    continue
+                results[name] = time_case(function, repeat)
+                if progress:
+                    progress(name, results[name])
+            client.logout()
+    finally:
+        user.delete()
+        if temporary_participant:
+            participant.delete()
+
+    return {
+        'commit': git_commit(),
+        'created_at': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'repeat': repeat,
+        'dataset': dataset_summary(),
+        'benchmarks': results,
+    }
+
+
+def compare_reports(previous, current):
+    """{caso: (mediana anterior, mediana atual, variação relativa)} dos casos presentes nos dois relatórios"""
+    comparison = {}
+    for name, stats in current['benchmarks'].items():
+        before = previous.get('benchmarks', {}).get(name)
+        if before is None:
+            continue
+        change = (stats['median_ms'] - before['median_ms']) / before['median_ms'] if before['median_ms'] else 0.0
+        comparison[name] = (before['median_ms'], stats['median_ms'], change)
+    return comparison
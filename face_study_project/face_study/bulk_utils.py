@@ -0,0 +1,142 @@
+# face_study/bulk_utils.py
+import logging
+import time
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Linhas apagadas por transação nas ações em massa
+BULK_CHUNK_SIZE = 1000
+
+
+class BulkResult:
+    """Totais de uma operação em massa, para a mensagem do admin"""
+
+    def __init__(self):
+        self.ratings = 0
+        self.rankings = 0
+        self.started = time.monotonic()
+
+    @property
+    def rows(self):
+        return self.ratings + self.rankings
+
+    @property
+    def seconds(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / max(self.seconds, 1e-6)
+
+    def summary(self):
+        return (
+            f'{self.ratings} rating(s) and {self.rankings} ranking(s) deleted '
+            f'in {self.seconds:.1f}s ({self.rows_per_second:.0f} rows/s)'
+        )
+
+
+def iter_id_chunks(queryset, chunk_size=BULK_CHUNK_SIZE):
+    """Gera listas de ids do queryset em ordem crescente, em lotes (keyset)"""
+    last_id = 0
+    while True:
+        ids = list(
+            queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            break
+        last_id = ids[-1]
+        yield ids
+
+
+def delete_ratings_in_chunks(ratings, chunk_size=BULK_CHUNK_SIZE, result=None):
+    """
+    Apaga avaliações e seus rankings em lotes de ids, um lote por transação.
+
+    Os DELETEs são feitos direto no banco (sem o coletor de cascata e os
+    sinais do Django), então os contadores desnormalizados das imagens
+    afetadas e o StudyStats são corrigidos dentro da mesma transação de
+    cada lote.
+    """
+    from .models import EmotionRanking, FaceImage, ImageRating
+    from .stats_utils import rating_hour_histogram, record_hourly_change
+    from .summary_utils import subtract_rankings
+
+    result = result or BulkResult()
+
+    for ids in iter_id_chunks(ratings, chunk_size):
+        with transaction.atomic():
+            image_ids = set(
+                ImageRating.objects.filter(id__in=ids).values_list('image_id', flat=True)
+            )
+            record_hourly_change(rating_hour_histogram(ImageRating.objects.filter(id__in=ids)), sign=-1)
+            rankings = EmotionRanking.objects.filter(rating_id__in=ids)
+            subtract_rankings(rankings)
+            result.rankings += rankings._raw_delete(rankings.db)
+            chunk = ImageRating.objects.filter(id__in=ids)
+            result.ratings += chunk._raw_delete(chunk.db)
+            FaceImage.objects.filter(id__in=image_ids).rebuild_rating_counts()
+
+        logger.info('Bulk delete progress: %s', result.summary())
+
+    return result
+
+
+def delete_rankings_in_chunks(rankings, chunk_size=BULK_CHUNK_SIZE, result=None):
+    """Apaga rankings em lotes de ids, um lote por transação, direto no banco"""
+    from .models import EmotionRanking
+    from .summary_utils import subtract_rankings
+
+    result = result or BulkResult()
+
+    for ids in iter_id_chunks(rankings, chunk_size):
+        with transaction.atomic():
+            chunk = EmotionRanking.objects.filter(id__in=ids)
+            subtract_rankings(chunk)
+            result.rankings += chunk._raw_delete(chunk.db)
+
+        logger.info('Bulk delete progress: %s', result.summary())
+
+    return result
+
+
+def merge_duplicate_images(keeper_id, duplicate_ids):
+    """
+    Junta imagens de conteúdo repetido numa só (keeper_id).
+
+    As avaliações das duplicatas passam para a imagem mantida; se o
+    participante já avaliou a mantida, a avaliação da duplicata é apagada.
+    Reservas das duplicatas são descartadas e as duplicatas removidas.
+    Retorna (avaliações movidas, BulkResult das apagadas).
+    """
+    from .models import FaceImage, ImageRating, ImageReservation
+    from .summary_utils import rebuild_face_emotion_summaries
+
+    result = BulkResult()
+    with transaction.atomic():
+        duplicate_ratings = ImageRating.objects.filter(image_id__in=duplicate_ids)
+        conflicting = duplicate_ratings.filter(
+            participant_id__in=ImageRating.objects.filter(image_id=keeper_id).values('participant_id')
+        )
+        delete_ratings_in_chunks(conflicting, result=result)
+
+        # Um participante pode ter avaliado mais de uma duplicata: fica a mais antiga
+        seen = set(ImageRating.objects.filter(image_id=keeper_id).values_list('participant_id', flat=True))
+        extra = []
+        for rating_id, participant_id in duplicate_ratings.order_by('id').values_list('id', 'participant_id'):
+            if participant_id in seen:
+                extra.append(rating_id)
+            else:
+                seen.add(participant_id)
+        if extra:
+            delete_ratings_in_chunks(ImageRating.objects.filter(id__in=extra), result=result)
+        moved = duplicate_ratings.update(image_id=keeper_id)
+
+        reservations = ImageReservation.objects.filter(image_id__in=duplicate_ids)
+        reservations._raw_delete(reservations.db)
+        # Zera as duplicatas antes de apagá-las (o sinal de delete as tira da faixa zero)
+        FaceImage.objects.filter(id__in=[keeper_id, *duplicate_ids]).rebuild_rating_counts()
+        FaceImage.objects.filter(id__in=duplicate_ids).delete()
+        rebuild_face_emotion_summaries(FaceImage.objects.filter(id=keeper_id))
+
+    return moved, result
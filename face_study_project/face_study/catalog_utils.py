@@ -0,0 +1,70 @@
+# face_study/catalog_utils.py
+from .version_utils import bump_version, current_version
+
+CATALOG_VERSION_NAME = 'emotion_catalog'
+
+# Último catálogo montado neste processo
+_local_catalog = None
+
+
+def emotion_column_name(emotion):
+    """Nome da coluna de uma emoção nos arquivos exportados"""
+    return f'emotion_{emotion.name.lower().replace(" ", "_")}'
+
+
+class EmotionCatalog:
+    """
+    Emoções ordenadas por nome, com ids e nomes de coluna, congeladas em uma versão.
+
+    O formulário de concordância é montado uma única vez por versão.
+    """
+
+    def __init__(self, version, emotions):
+        self.version = version
+        self.emotions = tuple(emotions)
+        self.ids = tuple(emotion.id for emotion in self.emotions)
+        self.columns = tuple(emotion_column_name(emotion) for emotion in self.emotions)
+        self._form_class = None
+
+    def __iter__(self):
+        return iter(self.emotions)
+
+    def __len__(self):
+        return len(self.emotions)
+
+    @property
+    def form_class(self):
+        """Subclasse de EmotionAgreementForm com um campo por emoção"""
+        if self._form_class is None:
+            from .forms import EmotionAgreementForm
+            self._form_class = EmotionAgreementForm.for_emotions(self.emotions)
+        return self._form_class
+
+
+def get_emotion_catalog():
+    """
+    Retorna o catálogo de emoções atual.
+
+    O catálogo fica em cache no processo e é revalidado pela versão guardada
+    no banco (ver version_utils), trocada pelos sinais de EmotionalState
+    (ver bump_catalog_version).
+    """
+    global _local_catalog
+    from .models import EmotionalState
+
+    version = current_version(CATALOG_VERSION_NAME)
+
+    catalog = _local_catalog
+    if catalog is not None and catalog.version == version:
+        return catalog
+
+    catalog = EmotionCatalog(version, EmotionalState.objects.all().order_by('name'))
+    _local_catalog = catalog
+    return catalog
+
+
+def bump_catalog_version():
+    """Descarta o catálogo em cache neste processo e, após o commit, em todos os outros"""
+    global _local_catalog
+    _local_catalog = None
+    bump_version(CATALOG_VERSION_NAME)
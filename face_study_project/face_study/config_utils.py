@@ -0,0 +1,39 @@
+# face_study/config_utils.py
+from .version_utils import bump_version, current_version
+
+CONFIG_VERSION_NAME = 'active_config'
+
+# (versão, configuração) da última leitura feita neste processo
+_local_config = (None, None)
+
+
+def get_active_config():
+    """
+    Retorna a StudyConfiguration ativa, criando uma padrão se não existir.
+
+    A configuração fica em cache no processo e é revalidada pela versão
+    guardada no banco (ver version_utils), que os sinais de
+    StudyConfiguration trocam a cada alteração (ver invalidate_active_config).
+    O objeto retornado é compartilhado: não deve ser alterado por quem o usa.
+    """
+    global _local_config
+    from .models import StudyConfiguration
+
+    version = current_version(CONFIG_VERSION_NAME)
+    cached_version, config = _local_config
+    if config is not None and cached_version == version:
+        return config
+
+    config = StudyConfiguration.objects.filter(is_active=True).first()
+    if not config:
+        config = StudyConfiguration.objects.create()
+
+    _local_config = (version, config)
+    return config
+
+
+def invalidate_active_config():
+    """Descarta a configuração em cache neste processo e, após o commit, em todos os outros"""
+    global _local_config
+    _local_config = (None, None)
+    bump_version(CONFIG_VERSION_NAME)
@@ -1,33 +1,37 @@
 # face_study/export_utils.py
 import csv
-import io
-from django.http import HttpResponse
-from decimal import Decimal
-from datetime import datetime
 import json
+import os
+import secrets
+import tempfile
+import time
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.http import FileResponse, StreamingHttpResponse
+from datetime import datetime
 
-def export_ratings_to_csv(queryset=None, include_all_emotions=True):
-    """
-    Exporta avaliações para CSV com uma coluna para cada emoção
-    e a URL da imagem na última coluna.
-    """
-    from .models import ImageRating, EmotionalState
-    
-    if queryset is None:
-        queryset = ImageRating.objects.all()
-    
-    queryset = queryset.select_related(
-        'participant', 'image'
-    ).prefetch_related(
-        'emotion_rankings__emotion'
-    ).order_by('created_at')
-    
-    all_emotions = EmotionalState.objects.all().order_by('name')
-    
-    buffer = io.StringIO()
-    writer = csv.writer(buffer)
-    
-    # Cabeçalho
+# Avaliações lidas por consulta durante a exportação
+EXPORT_CHUNK_SIZE = 2000
+
+# Formatos da exportação em matriz densa (avaliações x emoções)
+MATRIX_FORMATS = {
+    'npz': ('application/octet-stream', 'npz'),
+    'arrow': ('application/vnd.apache.arrow.file', 'arrow'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+class Echo:
+    """Pseudo-buffer para o csv.writer: devolve a linha em vez de guardá-la"""
+    def write(self, value):
+        return value
+
+
+def rating_csv_headers(catalog):
+    """Cabeçalho do CSV: dados da avaliação, uma coluna por emoção e a URL da imagem"""
     headers = [
         'rating_id',
         'participant_email',
@@ -35,41 +39,479 @@ def export_ratings_to_csv(queryset=None, include_all_emotions=True):
         'image_filename',
         'rating_created_at',
     ]
-    
+
     # Colunas para cada emoção
-    emotion_columns = [f'emotion_{emotion.name.lower().replace(" ", "_")}' for emotion in all_emotions]
-    headers.extend(emotion_columns)
-    
+    headers.extend(catalog.columns)
+
     # URL da imagem como última coluna
     headers.append('image_url')
-    
-    writer.writerow(headers)
-    
-    for rating in queryset:
-        emotion_values = {emotion.name: '' for emotion in all_emotions}
-        
-        for emotion_ranking in rating.emotion_rankings.all():
-            emotion_values[emotion_ranking.emotion.name] = str(emotion_ranking.agreement_level)
-        
-        row = [
-            str(rating.id),
-            rating.participant.email,
-            rating.image.code,
-            rating.image.image.name.split('/')[-1],
-            rating.created_at.isoformat(),
-        ]
-        
-        for emotion in all_emotions:
-            row.append(emotion_values[emotion.name])
-        
-        image_url = rating.image.image.url if rating.image.image else ''
-        row.append(image_url)
-        
-        writer.writerow(row)
-    
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='text/csv')
+    return headers
+
+
+def iter_rating_chunks(queryset, catalog, chunk_size=EXPORT_CHUNK_SIZE, start_after=0):
+    """
+    Gera as linhas do CSV em lotes, lendo as avaliações por id (keyset).
+
+    Cada lote faz uma consulta de avaliações e uma de rankings (pelos ids do
+    lote), então a memória usada não depende do tamanho da exportação.
+    Gera listas de tuplas (rating_id, row); start_after permite retomar uma
+    exportação depois do último id já gravado.
+    """
+    from .models import EmotionRanking, FaceImage
+
+    storage = FaceImage._meta.get_field('image').storage
+    last_id = start_after
+
+    while True:
+        ratings = list(
+            queryset.filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'participant__email', 'image__code', 'image__image', 'created_at'
+            )[:chunk_size]
+        )
+        if not ratings:
+            break
+        last_id = ratings[-1][0]
+
+        levels = defaultdict(dict)
+        rankings = EmotionRanking.objects.filter(
+            rating_id__in=[rating[0] for rating in ratings]
+        ).order_by().values_list('rating_id', 'emotion_id', 'agreement_level')
+        for rating_id, emotion_id, agreement_level in rankings:
+            levels[rating_id][emotion_id] = str(agreement_level)
+
+        chunk = []
+        for rating_id, email, code, image_name, created_at in ratings:
+            rating_levels = levels.get(rating_id, {})
+            row = [
+                str(rating_id),
+                email,
+                code,
+                image_name.split('/')[-1],
+                created_at.isoformat(),
+            ]
+            row.extend(rating_levels.get(emotion_id, '') for emotion_id in catalog.ids)
+            row.append(storage.url(image_name) if image_name else '')
+            chunk.append((rating_id, row))
+        yield chunk
+
+
+def iter_rating_rows(queryset, catalog, chunk_size=EXPORT_CHUNK_SIZE):
+    """Gera as linhas do CSV uma a uma como tuplas (rating_id, row)"""
+    for chunk in iter_rating_chunks(queryset, catalog, chunk_size):
+        yield from chunk
+
+
+def iter_ratings_csv(queryset, catalog, chunk_size=EXPORT_CHUNK_SIZE):
+    """Gera o CSV linha a linha (já formatado como texto)"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(rating_csv_headers(catalog))
+    for _, row in iter_rating_rows(queryset, catalog, chunk_size):
+        yield writer.writerow(row)
+
+
+class ExportJobLost(Exception):
+    """O job foi retomado por outro worker (checkpoint atrasado demais)"""
+
+
+def claimable_export_jobs(now=None):
+    """Jobs na fila e jobs "running" sem checkpoint há mais de EXPORT_JOB_STALE_AFTER"""
+    from .models import ExportJob
+
+    stale = (now or timezone.now()) - timedelta(seconds=settings.EXPORT_JOB_STALE_AFTER)
+    return ExportJob.objects.filter(
+        Q(status=ExportJob.STATUS_PENDING)
+        | Q(status=ExportJob.STATUS_RUNNING) & (Q(heartbeat_at__isnull=True) | Q(heartbeat_at__lt=stale))
+    )
+
+
+def claim_export_job():
+    """
+    Reserva o próximo job para este worker, ou None se não houver.
+
+    A reserva é um UPDATE condicional (só um worker consegue) que marca o
+    job como running e renova heartbeat_at. Um job running só é tomado de
+    outro worker quando o heartbeat está vencido.
+    """
+    from .models import ExportJob
+
+    for pk in claimable_export_jobs().order_by('created_at').values_list('pk', flat=True)[:10]:
+        now = timezone.now()
+        if claimable_export_jobs(now).filter(pk=pk).update(status=ExportJob.STATUS_RUNNING, heartbeat_at=now):
+            return ExportJob.objects.get(pk=pk)
+    return None
+
+
+def save_export_checkpoint(job, fields):
+    """
+    Grava `fields` do job e renova o heartbeat, se o job ainda for deste worker.
+
+    O UPDATE só acontece se heartbeat_at ainda for o último gravado por este
+    worker; se outro worker tomou o job, levanta ExportJobLost.
+    """
+    from .models import ExportJob
+
+    previous = job.heartbeat_at
+    job.heartbeat_at = timezone.now()
+    updated = ExportJob.objects.filter(
+        pk=job.pk, status=ExportJob.STATUS_RUNNING, heartbeat_at=previous
+    ).update(heartbeat_at=job.heartbeat_at, **{field: getattr(job, field) for field in fields})
+    if not updated:
+        raise ExportJobLost(f'Export #{job.pk} was taken over by another worker.')
+
+
+def run_export_job(job, chunk_size=EXPORT_CHUNK_SIZE, progress=None):
+    """
+    Executa (ou retoma) uma ExportJob gravando o CSV em disco lote a lote.
+
+    Depois de cada lote o arquivo é sincronizado e o checkpoint
+    (last_rating_id, bytes_written, rows_written) é salvo no job. Ao retomar,
+    o arquivo é truncado no último checkpoint, descartando um lote que tenha
+    sido gravado só pela metade. Se o catálogo de emoções mudou desde o
+    início, a exportação recomeça do zero para manter as colunas coerentes.
+    progress(job) é chamado a cada lote.
+
+    O job deve ter sido reservado com claim_export_job. O arquivo fica no
+    storage privado (STUDY_EXPORT_ROOT) com um nome não adivinhável e é
+    baixado pela view download_export.
+    """
+    from .catalog_utils import get_emotion_catalog
+
+    catalog = get_emotion_catalog()
+    queryset = job.ratings_queryset()
+
+    if job.emotion_ids != list(catalog.ids) or not job.file:
+        job.emotion_ids = list(catalog.ids)
+        job.file.name = f'ratings_export_{job.pk}_{secrets.token_hex(16)}.csv'
+        job.last_rating_id = 0
+        job.bytes_written = 0
+        job.rows_written = 0
+
+    path = job.file.path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    job.started_at = job.started_at or timezone.now()
+    job.total_rows = queryset.count()
+    job.error = ''
+    save_export_checkpoint(job, [
+        'emotion_ids', 'file', 'last_rating_id', 'bytes_written', 'rows_written',
+        'started_at', 'total_rows', 'error',
+    ])
+
+    started = time.monotonic()
+    rows_this_run = 0
+
+    with open(path, 'a+', newline='', encoding='utf-8') as output:
+        output.truncate(job.bytes_written)
+        output.seek(job.bytes_written)
+        writer = csv.writer(output)
+
+        if job.bytes_written == 0:
+            writer.writerow(rating_csv_headers(catalog))
+
+        for chunk in iter_rating_chunks(queryset, catalog, chunk_size, start_after=job.last_rating_id):
+            writer.writerows(row for _, row in chunk)
+            output.flush()
+            os.fsync(output.fileno())
+
+            rows_this_run += len(chunk)
+            job.last_rating_id = chunk[-1][0]
+            job.bytes_written = output.tell()
+            job.rows_written += len(chunk)
+            job.rows_per_second = rows_this_run / max(time.monotonic() - started, 1e-6)
+            save_export_checkpoint(job, [
+                'last_rating_id', 'bytes_written', 'rows_written', 'rows_per_second',
+            ])
+            if progress:
+                progress(job)
+
+        job.bytes_written = output.tell()
+
+    job.status = job.STATUS_DONE
+    job.finished_at = timezone.now()
+    save_export_checkpoint(job, ['bytes_written', 'status', 'finished_at'])
+    return job
+
+
+def export_ratings_to_csv(queryset=None):
+    """
+    Exporta avaliações para CSV com uma coluna para cada emoção
+    e a URL da imagem na última coluna.
+
+    A resposta é um StreamingHttpResponse que gera as linhas em lotes
+    (ordenadas por id da avaliação), com memória constante.
+    """
+    from .models import ImageRating
+    from .catalog_utils import get_emotion_catalog
+
+    if queryset is None:
+        queryset = ImageRating.objects.all()
+
+    catalog = get_emotion_catalog()
+    rows = iter_ratings_csv(queryset, catalog)
+
+    response = StreamingHttpResponse(rows, content_type='text/csv')
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     response['Content-Disposition'] = f'attachment; filename="ratings_export_{timestamp}.csv"'
-    
-    return response
\ No newline at end of file
+
+    return response
+
+
+AGREEMENT_CSV_HEADERS = [
+    'image_code', 'emotion', 'n_ratings', 'mean', 'std', 'entropy', 'computed_at',
+]
+
+
+def iter_agreement_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Gera as linhas CSV das estatísticas por imagem e emoção, em lotes por id"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(AGREEMENT_CSV_HEADERS)
+
+    last_id = 0
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'image__code', 'emotion__name', 'n_ratings', 'mean', 'std', 'entropy', 'computed_at'
+            )[:chunk_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        for _, code, emotion, n_ratings, mean, std, entropy, computed_at in rows:
+            yield writer.writerow([
+                code, emotion, n_ratings, f'{mean:.4f}', f'{std:.4f}', f'{entropy:.4f}', computed_at.isoformat(),
+            ])
+
+
+def export_agreement_to_csv(queryset=None):
+    """Exporta (em streaming) as estatísticas de concordância por imagem e emoção"""
+    from .models import ImageEmotionAgreement
+
+    if queryset is None:
+        queryset = ImageEmotionAgreement.objects.all()
+
+    response = StreamingHttpResponse(iter_agreement_csv(queryset), content_type='text/csv')
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    response['Content-Disposition'] = f'attachment; filename="agreement_export_{timestamp}.csv"'
+    return response
+
+
+def consensus_csv_headers(catalog):
+    """Cabeçalho do CSV de consenso: média e desvio de cada emoção e o rótulo de maior média"""
+    headers = ['image_code', 'rating_count']
+    for column in catalog.columns:
+        headers.extend([f'{column}_mean', f'{column}_std'])
+    headers.append('consensus_label')
+    return headers
+
+
+def iter_consensus_csv(catalog, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Gera as linhas do CSV de consenso, uma por imagem avaliada.
+
+    Lê só FaceImage e FaceEmotionSummary, em lotes de imagens por id: uma
+    consulta de imagens e uma de resumos por lote, sem varrer EmotionRanking.
+    """
+    from .models import FaceEmotionSummary, FaceImage
+
+    writer = csv.writer(Echo())
+    yield writer.writerow(consensus_csv_headers(catalog))
+
+    names = {emotion.id: emotion.name for emotion in catalog.emotions}
+    last_id = None
+    while True:
+        images = FaceImage.objects.filter(rating_count__gt=0).order_by('id')
+        if last_id is not None:
+            images = images.filter(id__gt=last_id)
+        images = list(images.values_list('id', 'code', 'rating_count')[:chunk_size])
+        if not images:
+            break
+        last_id = images[-1][0]
+
+        summaries = defaultdict(dict)
+        for summary in FaceEmotionSummary.objects.filter(
+            image_id__in=[image_id for image_id, _, _ in images], count__gt=0
+        ).only('image_id', 'emotion_id', 'count', 'total', 'total_sq'):
+            summaries[summary.image_id][summary.emotion_id] = summary
+
+        for image_id, code, rating_count in images:
+            by_emotion = summaries.get(image_id, {})
+            row = [code, rating_count]
+            for emotion_id in catalog.ids:
+                summary = by_emotion.get(emotion_id)
+                row.extend([f'{summary.mean:.4f}', f'{summary.std:.4f}'] if summary else ['', ''])
+            best = max(by_emotion.values(), key=lambda summary: summary.mean, default=None)
+            row.append(names.get(best.emotion_id, '') if best else '')
+            yield writer.writerow(row)
+
+
+def export_consensus_to_csv():
+    """Exporta (em streaming) os rótulos de consenso de todas as imagens avaliadas"""
+    from .catalog_utils import get_emotion_catalog
+
+    response = StreamingHttpResponse(iter_consensus_csv(get_emotion_catalog()), content_type='text/csv')
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    response['Content-Disposition'] = f'attachment; filename="consensus_labels_{timestamp}.csv"'
+    return response
+
+
+def build_rating_matrix(queryset, catalog, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Monta a matriz densa float32 avaliações x emoções (NaN onde não há valor).
+
+    Retorna um dict de arrays NumPy alinhados por linha: values, rating_id,
+    participant_index, image_index e created_at, mais as tabelas pequenas
+    de metadados (participants, image_codes, image_names, emotion_ids,
+    emotion_names e emotion_columns) que os índices inteiros referenciam.
+    """
+    import numpy as np
+    from .models import EmotionRanking, Participant, FaceImage
+
+    # Fixa o conjunto exportado para que a pré-alocação não mude no meio
+    max_id = queryset.aggregate(max_id=Max('id'))['max_id'] or 0
+    queryset = queryset.filter(id__lte=max_id)
+    total = queryset.count()
+
+    values = np.full((total, len(catalog)), np.nan, dtype=np.float32)
+    rating_ids = np.zeros(total, dtype=np.int64)
+    participant_index = np.zeros(total, dtype=np.int32)
+    image_index = np.zeros(total, dtype=np.int32)
+    created_at = np.zeros(total, dtype='datetime64[us]')
+
+    emotion_columns = {emotion_id: column for column, emotion_id in enumerate(catalog.ids)}
+    participants = {}
+    images = {}
+
+    row = 0
+    last_id = 0
+    while row < total:
+        ratings = list(
+            queryset.filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'participant_id', 'image_id', 'created_at'
+            )[:chunk_size]
+        )
+        if not ratings:
+            break
+        last_id = ratings[-1][0]
+
+        rows_by_rating = {}
+        for rating_id, participant_id, image_id, rating_created_at in ratings[:total - row]:
+            rating_ids[row] = rating_id
+            participant_index[row] = participants.setdefault(participant_id, len(participants))
+            image_index[row] = images.setdefault(image_id, len(images))
+            created_at[row] = np.datetime64(rating_created_at.replace(tzinfo=None), 'us')
+            rows_by_rating[rating_id] = row
+            row += 1
+
+        rankings = EmotionRanking.objects.filter(
+            rating_id__in=list(rows_by_rating)
+        ).order_by().values_list('rating_id', 'emotion_id', 'agreement_level')
+        for rating_id, emotion_id, agreement_level in rankings:
+            column = emotion_columns.get(emotion_id)
+            if column is not None:
+                values[rows_by_rating[rating_id], column] = agreement_level
+
+    emails = dict(Participant.objects.filter(id__in=list(participants)).values_list('id', 'email'))
+    image_rows = {
+        image_id: (code, name)
+        for image_id, code, name in FaceImage.objects.filter(
+            id__in=list(images)
+        ).values_list('id', 'code', 'image')
+    }
+
+    # Avaliações removidas durante a leitura deixam linhas sobrando no fim, e
+    # as de participantes ou imagens removidos nesse meio tempo são descartadas
+    participant_kept = np.array([pid in emails for pid in participants], dtype=bool)
+    image_kept = np.array([iid in image_rows for iid in images], dtype=bool)
+    keep = participant_kept[participant_index[:row]] & image_kept[image_index[:row]]
+    # Índices renumerados sem os participantes e imagens descartados
+    participant_renumber = (np.cumsum(participant_kept) - 1).astype(np.int32)
+    image_renumber = (np.cumsum(image_kept) - 1).astype(np.int32)
+    kept_images = [iid for iid in images if iid in image_rows]
+
+    return {
+        'values': values[:row][keep],
+        'rating_id': rating_ids[:row][keep],
+        'participant_index': participant_renumber[participant_index[:row][keep]],
+        'image_index': image_renumber[image_index[:row][keep]],
+        'created_at': created_at[:row][keep],
+        'participants': np.array([emails[pid] for pid in participants if pid in emails], dtype=str),
+        'image_codes': np.array([image_rows[iid][0] for iid in kept_images], dtype=str),
+        'image_names': np.array([image_rows[iid][1] for iid in kept_images], dtype=str),
+        'emotion_ids': np.array(catalog.ids, dtype=np.int64),
+        'emotion_names': np.array([emotion.name for emotion in catalog.emotions], dtype=str),
+        'emotion_columns': np.array(catalog.columns, dtype=str),
+    }
+
+
+def write_rating_matrix(matrix, file, fmt='npz'):
+    """
+    Grava a matriz no arquivo (caminho ou objeto binário).
+
+    npz: arquivo NumPy não comprimido (np.load). arrow/parquet: tabela com
+    rating_id, participant_index, image_index, created_at e uma coluna
+    float32 por emoção (mesmos nomes do CSV); as tabelas de metadados vão em JSON nos metadados
+    do schema. O formato arrow (IPC) pode ser aberto com memory map sem
+    cópia. arrow e parquet exigem o pacote pyarrow.
+    """
+    if fmt == 'npz':
+        import numpy as np
+        np.savez(file, **matrix)
+        return
+
+    if fmt not in MATRIX_FORMATS:
+        raise ValueError(f'Unknown matrix format: {fmt}')
+
+    import pyarrow as pa
+
+    columns = {
+        'rating_id': pa.array(matrix['rating_id']),
+        'participant_index': pa.array(matrix['participant_index']),
+        'image_index': pa.array(matrix['image_index']),
+        'created_at': pa.array(matrix['created_at']),
+    }
+    for column, name in enumerate(matrix['emotion_columns']):
+        columns[str(name)] = pa.array(matrix['values'][:, column])
+
+    metadata = {
+        'participants': json.dumps(matrix['participants'].tolist()),
+        'image_codes': json.dumps(matrix['image_codes'].tolist()),
+        'image_names': json.dumps(matrix['image_names'].tolist()),
+        'emotion_ids': json.dumps(matrix['emotion_ids'].tolist()),
+        'emotion_names': json.dumps(matrix['emotion_names'].tolist()),
+    }
+    table = pa.table(columns).replace_schema_metadata(metadata)
+
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, file)
+    else:
+        with pa.ipc.new_file(file, table.schema) as writer:
+            writer.write_table(table)
+
+
+def export_ratings_to_matrix(queryset=None, fmt='npz'):
+    """
+    Exporta avaliações como matriz densa avaliações x emoções (ver build_rating_matrix).
+
+    O arquivo é gerado em um arquivo temporário e enviado como download.
+    """
+    from .models import ImageRating
+    from .catalog_utils import get_emotion_catalog
+
+    if queryset is None:
+        queryset = ImageRating.objects.all()
+
+    content_type, extension = MATRIX_FORMATS[fmt]
+    matrix = build_rating_matrix(queryset, get_emotion_catalog())
+
+    output = tempfile.TemporaryFile()
+    write_rating_matrix(matrix, output, fmt)
+    output.seek(0)
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f'ratings_matrix_{timestamp}.{extension}',
+        content_type=content_type,
+    )
@@ -0,0 +1,251 @@
+# face_study/fixture_utils.py
+import io
+import os
+import random
+import time
+import uuid
+from decimal import Decimal
+from django.db import transaction
+
+# Linhas por INSERT ao gerar os dados sintéticos
+FIXTURE_BATCH_SIZE = 5000
+
+# Imagens por diretório de arquivos de exemplo
+FIXTURE_FILES_PER_DIRECTORY = 5000
+
+# Níveis possíveis (0.00 a 1.00), criados uma vez: gerar milhões de Decimal custa caro
+AGREEMENT_LEVELS = [Decimal(value) / 100 for value in range(101)]
+
+
+def placeholder_image_bytes(size=64):
+    """JPEG cinza pequeno usado como arquivo de todas as imagens sintéticas"""
+    from PIL import Image
+
+    output = io.BytesIO()
+    Image.new('L', (size, size), color=128).save(output, format='JPEG')
+    return output.getvalue()
+
+
+def ensure_emotions(count):
+    """As `count` primeiras emoções por nome, criando emoções sintéticas se faltarem"""
+    from .models import EmotionalState
+
+    emotions = list(EmotionalState.objects.order_by('name')[:count])
+    for index in range(len(emotions), count):
+        emotion, _ = EmotionalState.objects.get_or_create(name=f'fixture-emotion-{index:02d}')
+        emotions.append(emotion)
+    return emotions
+
+
+def spread_ratings(images, ratings, max_ratings, rng):
+    """
+    Avaliações por imagem somando `ratings`, nenhuma acima de max_ratings.
+
+    Cada avaliação vai para uma imagem sorteada entre as que ainda têm vaga,
+    o que deixa a cobertura parecida com a do estudo (imagens sem nota,
+    parciais e completas).
+    """
+    if ratings > images * max_ratings:
+        raise ValueError(
+            f'{ratings} rating(s) do not fit in {images} image(s) with max_ratings_per_image={max_ratings}.'
+        )
+    counts = [0] * images
+    open_images = list(range(images))
+    for _ in range(ratings):
+        index = rng.randrange(len(open_images))
+        image = open_images[index]
+        counts[image] += 1
+        if counts[image] == max_ratings:
+            open_images[index] = open_images[-1]
+            open_images.pop()
+    return counts
+
+
+class FixturePlan:
+    """Volumes pedidos e o rótulo que identifica as linhas de uma geração"""
+
+    def __init__(self, images, participants, ratings, emotions, label=None,
+                 batch_size=FIXTURE_BATCH_SIZE, files=True, seed=None):
+        self.images = images
+        self.participants = participants
+        self.ratings = ratings
+        self.emotions = emotions
+        self.label = label or uuid.uuid4().hex[:8]
+        self.batch_size = batch_size
+        self.files = files
+        self.rng = random.Random(seed)
+
+
+def create_fixture_images(plan, progress=None):
+    """
+    Cria plan.images FaceImage em lotes; retorna os ids na ordem de criação.
+
+    Com plan.files, um único JPEG é gravado no storage e cada imagem recebe
+    um hard link para ele (um caminho próprio por imagem, sem ocupar disco).
+    Sem suporte a hard link (ou a path() no storage) todas usam o mesmo arquivo.
+    """
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+    from .models import FaceImage, generate_image_code, random_sampling_key
+
+    directory = f'faces/fixtures/{plan.label}'
+    placeholder = None
+    placeholder_path = None
+    if plan.files:
+        placeholder = default_storage.save(f'{directory}/placeholder.jpg', ContentFile(placeholder_image_bytes()))
+        try:
+            placeholder_path = default_storage.path(placeholder)
+        except NotImplementedError:
+            pass
+
+    ids = []
+    for start in range(0, plan.images, plan.batch_size):
+        batch = []
+        for index in range(start, min(start + plan.batch_size, plan.images)):
+            code = generate_image_code()
+            name = placeholder or ''
+            if placeholder_path:
+                name = f'{directory}/{index // FIXTURE_FILES_PER_DIRECTORY:04d}/{code}.jpg'
+                target = default_storage.path(name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                try:
+                    os.link(placeholder_path, target)
+                except OSError:
+                    name = placeholder
+            batch.append(FaceImage(
+                id=uuid.uuid4(), image=name, code=code, random_key=random_sampling_key(),
+                source_name=f'fixtures/{plan.label}/{index}',
+            ))
+        FaceImage.objects.bulk_create(batch)
+        ids.extend(image.id for image in batch)
+        if progress:
+            progress('images', len(ids))
+    return ids
+
+
+def create_fixture_participants(plan, progress=None):
+    """Cria plan.participants Participant em lotes; retorna os ids"""
+    from .models import Participant
+
+    prefix = f'fixture-{plan.label}-'
+    for start in range(0, plan.participants, plan.batch_size):
+        Participant.objects.bulk_create([
+            Participant(email=f'{prefix}{index}@example.invalid')
+            for index in range(start, min(start + plan.batch_size, plan.participants))
+        ])
+        if progress:
+            progress('participants', min(start + plan.batch_size, plan.participants))
+    return list(
+        Participant.objects.filter(email__startswith=prefix).order_by('id').values_list('id', flat=True)
+    )
+
+
+def create_fixture_ratings(plan, image_ids, participant_ids, emotions, max_ratings, progress=None):
+    """
+    Cria as avaliações e um ranking por emoção para cada uma, um lote por transação.
+
+    Cada (imagem, emoção) tem um nível de base sorteado e as notas dos
+    avaliadores variam em torno dele, para que médias, desvios e a
+    concordância calculada tenham valores plausíveis. Os ids das avaliações
+    de cada lote são lidos de volta depois do INSERT (o MySQL não os
+    devolve no bulk_create). Retorna (avaliações, rankings).
+    """
+    from .models import EmotionRanking, ImageRating
+
+    rng = plan.rng
+    counts = spread_ratings(len(image_ids), plan.ratings, max_ratings, rng)
+    if max(counts, default=0) > len(participant_ids):
+        raise ValueError('Not enough participants to give each image distinct raters.')
+
+    emotion_ids = [emotion.id for emotion in emotions]
+    ratings_created = rankings_created = 0
+    pending = []
+
+    def flush():
+        nonlocal ratings_created, rankings_created
+        with transaction.atomic():
+            last_id = ImageRating.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            ImageRating.objects.bulk_create([
+                ImageRating(participant_id=participant_id, image_id=image_id)
+                for image_id, participant_id, _ in pending
+            ])
+            created = ImageRating.objects.filter(id__gt=last_id).values_list('id', 'participant_id', 'image_id')
+            rating_ids = {(participant_id, image_id): rating_id for rating_id, participant_id, image_id in created}
+            rankings = []
+            for image_id, participant_id, base in pending:
+                rating_id = rating_ids[(participant_id, image_id)]
+                for emotion_id, level in zip(emotion_ids, base):
+                    noisy = min(max(level + rng.randint(-20, 20), 0), 100)
+                    rankings.append(EmotionRanking(
+                        rating_id=rating_id, emotion_id=emotion_id, agreement_level=AGREEMENT_LEVELS[noisy],
+                    ))
+            EmotionRanking.objects.bulk_create(rankings, batch_size=plan.batch_size)
+        ratings_created += len(pending)
+        rankings_created += len(rankings)
+        pending.clear()
+        if progress:
+            progress('ratings', ratings_created)
+
+    for image_id, count in zip(image_ids, counts):
+        if not count:
+            continue
+        base = [rng.randint(0, 100) for _ in emotion_ids]
+        for participant_id in rng.sample(participant_ids, count):
+            pending.append((image_id, participant_id, base))
+        if len(pending) >= plan.batch_size:
+            flush()
+    if pending:
+        flush()
+    return ratings_created, rankings_created
+
+
+def generate_scale_fixtures(plan, progress=None):
+    """
+    Gera os dados sintéticos do plano e refaz os dados desnormalizados.
+
+    bulk_create não dispara sinais: no fim são recalculados os contadores
+    das imagens, o StudyStats e os resumos por imagem e emoção, como
+    fariam os comandos rebuild_*. Retorna um dict com as linhas criadas e
+    o tempo de cada etapa.
+    """
+    from .config_utils import get_active_config
+    from .models import FaceImage
+    from .stats_utils import recompute_study_stats
+    from .summary_utils import rebuild_face_emotion_summaries
+
+    max_ratings = get_active_config().max_ratings_per_image
+    if plan.ratings > plan.images * max_ratings:
+        raise ValueError(
+            f'{plan.ratings} rating(s) do not fit in {plan.images} image(s) with '
+            f'max_ratings_per_image={max_ratings}; raise it in the study configuration.'
+        )
+
+    timings = {}
+    started = time.monotonic()
+    emotions = ensure_emotions(plan.emotions)
+    image_ids = create_fixture_images(plan, progress)
+    timings['images'] = time.monotonic() - started
+
+    started = time.monotonic()
+    participant_ids = create_fixture_participants(plan, progress)
+    timings['participants'] = time.monotonic() - started
+
+    started = time.monotonic()
+    ratings, rankings = create_fixture_ratings(plan, image_ids, participant_ids, emotions, max_ratings, progress)
+    timings['ratings'] = time.monotonic() - started
+
+    started = time.monotonic()
+    FaceImage.objects.rebuild_rating_counts()
+    recompute_study_stats()
+    rebuild_face_emotion_summaries()
+    timings['denormalized'] = time.monotonic() - started
+
+    return {
+        'label': plan.label,
+        'images': len(image_ids),
+        'participants': len(participant_ids),
+        'ratings': ratings,
+        'rankings': rankings,
+        'emotions': len(emotions),
+        'seconds': timings,
+    }
@@ -1,6 +1,7 @@
 from django import forms
 from .models import FaceImage, StudyConfiguration
 from django.core.validators import FileExtensionValidator
+from .image_utils import file_content_hash, perceptual_hash
 
 class ParticipantEmailForm(forms.Form):
     email = forms.EmailField(
@@ -11,7 +12,34 @@ class ParticipantEmailForm(forms.Form):
         })
     )
 
-class ImageUploadForm(forms.ModelForm):
+class ContentHashedImageMixin:
+    """
+    Preenche content_hash e perceptual_hash do FaceImage a partir do arquivo enviado.
+
+    Usado pelo upload e pelo admin, para que toda imagem criada ou trocada
+    tenha o hash do conteúdo e duplicatas sejam recusadas no formulário.
+    """
+    content_hashes = {}
+    
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if 'image' not in self.changed_data:
+            return image
+        content_hash = self.content_hashes.get('image') or file_content_hash(image)
+        
+        duplicates = FaceImage.objects.filter(content_hash=content_hash)
+        if self.instance.pk:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        duplicate = duplicates.values_list('code', flat=True).first()
+        if duplicate:
+            raise forms.ValidationError(f"Esta imagem já foi enviada (código {duplicate}).")
+        
+        self.instance.content_hash = content_hash
+        self.instance.perceptual_hash = perceptual_hash(image)
+        image.seek(0)
+        return image
+
+class ImageUploadForm(ContentHashedImageMixin, forms.ModelForm):
     class Meta:
         model = FaceImage
         fields = ['image']
@@ -21,6 +49,34 @@ class ImageUploadForm(forms.ModelForm):
                 'accept': 'image/*'
             })
         }
+    
+    def __init__(self, *args, **kwargs):
+        # Hashes calculados pelo ContentHashUploadHandler durante o upload
+        self.content_hashes = kwargs.pop('content_hashes', None) or {}
+        super().__init__(*args, **kwargs)
+
+class FaceImageAdminForm(ContentHashedImageMixin, forms.ModelForm):
+    class Meta:
+        model = FaceImage
+        fields = ['image']
+
+def agreement_field(emotion):
+    return forms.DecimalField(
+        label=emotion.name,
+        min_value=0,
+        max_value=1,
+        decimal_places=2,
+        widget=forms.NumberInput(attrs={
+            'class': 'form-control agreement-input',
+            'min': '0',
+            'max': '1',
+            'step': '0.01',
+            'data-emotion-id': emotion.id,
+            'data-emotion-name': emotion.name,
+        }),
+        required=True,
+        initial=0.5  # Valor padrão
+    )
 
 class EmotionAgreementForm(forms.Form):
     def __init__(self, *args, **kwargs):
@@ -28,22 +84,13 @@ class EmotionAgreementForm(forms.Form):
         super().__init__(*args, **kwargs)
         
         for emotion in emotions:
-            self.fields[f'emotion_{emotion.id}'] = forms.DecimalField(
-                label=emotion.name,
-                min_value=0,
-                max_value=1,
-                decimal_places=2,
-                widget=forms.NumberInput(attrs={
-                    'class': 'form-control agreement-input',
-                    'min': '0',
-                    'max': '1',
-                    'step': '0.01',
-                    'data-emotion-id': emotion.id,
-                    'data-emotion-name': emotion.name,
-                }),
-                required=True,
-                initial=0.5  # Valor padrão
-            )
+            self.fields[f'emotion_{emotion.id}'] = agreement_field(emotion)
+    
+    @classmethod
+    def for_emotions(cls, emotions):
+        """Cria uma subclasse com os campos já declarados (ver catalog_utils.EmotionCatalog)"""
+        attrs = {f'emotion_{emotion.id}': agreement_field(emotion) for emotion in emotions}
+        return type('CatalogEmotionAgreementForm', (cls,), attrs)
 
 
 class EmotionRankingForm(forms.Form):
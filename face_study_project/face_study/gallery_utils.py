@@ -0,0 +1,73 @@
+# face_study/gallery_utils.py
+import base64
+from datetime import datetime
+import uuid
+from django.conf import settings
+from django.db.models import Q
+
+
+def encode_cursor(image):
+    """Cursor opaco com a posição (uploaded_at, id) da última imagem da página"""
+    raw = f'{image.uploaded_at.isoformat()}|{image.pk.hex}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Retorna (uploaded_at, id) do cursor, ou levanta ValueError se for inválido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        uploaded_at, image_id = raw.split('|')
+        return datetime.fromisoformat(uploaded_at), uuid.UUID(image_id)
+    except (TypeError, UnicodeDecodeError, ValueError) as exc:
+        raise ValueError('invalid cursor') from exc
+
+
+def gallery_page(cursor=None, page_size=None):
+    """
+    Uma página da galeria de imagens enviadas, da mais nova para a mais antiga.
+
+    Paginação por chave (uploaded_at, id) sobre o índice composto, sem
+    OFFSET nem COUNT(*): o custo de cada página não depende de quantas
+    imagens existem. Retorna (imagens, cursor da próxima página ou None).
+    """
+    from .models import FaceImage
+
+    page_size = page_size or settings.UPLOAD_GALLERY_PAGE_SIZE
+    images = FaceImage.objects.only(
+        'id', 'code', 'image', 'thumbnail', 'uploaded_at', 'rating_count'
+    ).order_by('-uploaded_at', '-id')
+
+    if cursor:
+        uploaded_at, image_id = decode_cursor(cursor)
+        images = images.filter(
+            Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=image_id)
+        )
+
+    # Uma linha a mais indica se existe próxima página
+    page = list(images[:page_size + 1])
+    next_cursor = encode_cursor(page[page_size - 1]) if len(page) > page_size else None
+    return page[:page_size], next_cursor
+
+
+def gallery_status(image, max_ratings):
+    """Situação da imagem a partir do contador rating_count: (chave, rótulo)"""
+    if image.rating_count >= max_ratings:
+        return 'full', 'Completa'
+    if image.rating_count > 0:
+        return 'partial', 'Parcial'
+    return 'pending', 'Pendente'
+
+
+def gallery_item(image, max_ratings):
+    """Representação de uma imagem da galeria para o template e para o JSON"""
+    status, status_label = gallery_status(image, max_ratings)
+    return {
+        'code': image.code,
+        'file': image.image.name.rsplit('/', 1)[-1],
+        'thumbnail_url': image.thumbnail_url,
+        'uploaded_at': image.uploaded_at.isoformat(),
+        'rating_count': image.rating_count,
+        'max_ratings': max_ratings,
+        'status': status,
+        'status_label': status_label,
+    }
@@ -0,0 +1,124 @@
+# face_study/image_utils.py
+import hashlib
+import logging
+import os
+from django.core.files.uploadhandler import FileUploadHandler
+
+logger = logging.getLogger(__name__)
+
+# Versões geradas para cada imagem: campo do FaceImage -> maior lado em pixels
+DERIVATIVE_SIZES = {
+    'thumbnail': 100,   # Pré-visualização do admin (exibida a 50px)
+    'web_image': 800,   # Página de avaliação (exibida até 400px)
+}
+DERIVATIVE_QUALITY = 80
+DERIVATIVES_DIR = 'faces/derivatives'
+
+
+def content_addressed_name(digest, filename):
+    """Nome do arquivo derivado do hash do conteúdo: faces/ab/cd/<sha256>.<ext>"""
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else 'bin'
+    return f'faces/{digest[:2]}/{digest[2:4]}/{digest}.{ext}'
+
+
+def file_content_hash(file):
+    """SHA-256 de um arquivo do Django, lido em blocos"""
+    sha = hashlib.sha256()
+    for chunk in file.chunks():
+        sha.update(chunk)
+    file.seek(0)
+    return sha.hexdigest()
+
+
+def perceptual_hash(source):
+    """
+    dHash de 64 bits (16 hex) da imagem (caminho ou objeto de arquivo).
+
+    Imagens visualmente iguais (reencodadas, redimensionadas) tendem a ter o
+    mesmo valor; serve para apontar quase-duplicatas, não para rejeitar.
+    """
+    from PIL import Image
+
+    with Image.open(source) as image:
+        pixels = list(image.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            right = pixels[row * 9 + column + 1]
+            bits = (bits << 1) | (left > right)
+    return f'{bits:016x}'
+
+
+class ContentHashUploadHandler(FileUploadHandler):
+    """
+    Calcula o SHA-256 dos arquivos enviados enquanto eles chegam.
+
+    Deve ser o primeiro de FILE_UPLOAD_HANDLERS: repassa os blocos para os
+    handlers seguintes e guarda o hash em request.upload_content_hashes,
+    indexado pelo nome do campo.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request.upload_content_hashes = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.request.upload_content_hashes[self.field_name] = self.sha.hexdigest()
+        return None
+
+
+def derivative_format():
+    """WebP quando o Pillow tem suporte, senão JPEG"""
+    from PIL import features
+    return ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+
+def render_derivatives(source_path, media_root, stem):
+    """
+    Gera as versões redimensionadas de uma imagem.
+
+    Roda nos processos do pool de build_image_derivatives (ou direto no
+    ingest_faces): recebe só caminhos, não usa o ORM, e retorna
+    {campo: nome relativo ao MEDIA_ROOT} para quem chamou gravar no FaceImage.
+    """
+    from PIL import Image, ImageOps
+
+    image_format, extension = derivative_format()
+    output_dir = os.path.join(media_root, DERIVATIVES_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+
+    names = {}
+    with Image.open(source_path) as source:
+        source = ImageOps.exif_transpose(source).convert('RGB')
+        for field, size in DERIVATIVE_SIZES.items():
+            rendition = source.copy()
+            rendition.thumbnail((size, size), Image.LANCZOS)
+            name = f'{DERIVATIVES_DIR}/{stem}_{field}.{extension}'
+            rendition.save(os.path.join(media_root, name), image_format, quality=DERIVATIVE_QUALITY)
+            names[field] = name
+    return names
+
+
+def derivative_stem(face_image):
+    """Prefixo dos arquivos derivados: o hash do conteúdo, que muda quando a imagem é trocada"""
+    return face_image.content_hash or face_image.pk.hex
+
+
+def delete_derivatives(names):
+    """Remove do storage os arquivos derivados listados (nomes vazios são ignorados)"""
+    from django.core.files.storage import default_storage
+
+    for name in names:
+        if name:
+            try:
+                default_storage.delete(name)
+            except OSError:
+                logger.warning('Could not delete derivative %s', name, exc_info=True)
@@ -0,0 +1,108 @@
+# face_study/ingest_utils.py
+import hashlib
+import os
+import tarfile
+import uuid
+import zipfile
+from io import BytesIO
+
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp', 'bmp', 'gif', 'tif', 'tiff'}
+
+# Arquivos compactados abertos em cada processo do pool
+_open_archives = {}
+
+
+def is_image_name(name):
+    return '.' in name and name.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS
+
+
+def list_source_entries(source):
+    """
+    Lista as imagens de um diretório, .zip ou .tar(.gz/.bz2/.xz).
+
+    Retorna nomes relativos à origem, em ordem, para que a importação
+    seja determinística e possa ser retomada.
+    """
+    if os.path.isdir(source):
+        entries = []
+        for root, _, files in os.walk(source):
+            for filename in files:
+                if is_image_name(filename):
+                    entries.append(os.path.relpath(os.path.join(root, filename), source))
+        return sorted(entries)
+
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            return sorted(
+                info.filename for info in archive.infolist()
+                if not info.is_dir() and is_image_name(info.filename)
+            )
+
+    if tarfile.is_tarfile(source):
+        with tarfile.open(source) as archive:
+            return sorted(
+                member.name for member in archive.getmembers()
+                if member.isfile() and is_image_name(member.name)
+            )
+
+    raise ValueError(f'{source} is not a directory, zip or tar archive')
+
+
+def read_entry(source, entry):
+    """Lê os bytes de uma imagem da origem (reaproveita o arquivo compactado aberto)"""
+    if os.path.isdir(source):
+        with open(os.path.join(source, entry), 'rb') as handle:
+            return handle.read()
+
+    archive = _open_archives.get(source)
+    if archive is None:
+        archive = zipfile.ZipFile(source) if zipfile.is_zipfile(source) else tarfile.open(source)
+        _open_archives[source] = archive
+
+    if isinstance(archive, zipfile.ZipFile):
+        return archive.read(entry)
+    return archive.extractfile(entry).read()
+
+
+def ingest_entry(source, entry, derivatives=True):
+    """
+    Valida e grava uma imagem; roda nos processos do pool.
+
+    Decodifica a imagem por completo com o Pillow (arquivos corrompidos ou
+    truncados são rejeitados), grava o arquivo endereçado pelo SHA-256 do
+    conteúdo (o mesmo do upload; um conteúdo já gravado não é regravado) e,
+    opcionalmente, gera as versões redimensionadas. Retorna um dict com os
+    campos do FaceImage, ou com 'error' se a imagem for inválida.
+    """
+    from PIL import Image
+    from django.conf import settings
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+    from .image_utils import content_addressed_name, perceptual_hash, render_derivatives
+
+    try:
+        data = read_entry(source, entry)
+        with Image.open(BytesIO(data)) as image:
+            image.verify()
+        with Image.open(BytesIO(data)) as image:
+            image.load()
+        phash = perceptual_hash(BytesIO(data))
+    except Exception as exc:
+        return {'source_name': entry, 'error': str(exc) or exc.__class__.__name__}
+
+    digest = hashlib.sha256(data).hexdigest()
+    name = content_addressed_name(digest, os.path.basename(entry))
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+    result = {
+        'source_name': entry,
+        'id': uuid.uuid4(),
+        'image': name,
+        'content_hash': digest,
+        'perceptual_hash': phash,
+    }
+
+    if derivatives:
+        # Nomeadas pelo hash: conteúdo repetido reaproveita os mesmos arquivos
+        result.update(render_derivatives(default_storage.path(name), str(settings.MEDIA_ROOT), digest))
+    return result
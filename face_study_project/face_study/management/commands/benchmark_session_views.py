@@ -0,0 +1,84 @@
+import asyncio
+import time
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import reverse
+from face_study.benchmark_utils import (
+    SESSION_VIEW_NAMES, benchmark_host, delete_benchmark_data, load_summary, run_asgi_load, run_wsgi_load,
+    session_urlconf, simulated_db_latency,
+)
+from face_study.catalog_utils import get_emotion_catalog
+from face_study.models import FaceImage
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara as páginas da sessão de avaliação sync (WSGI, uma thread por requisição) '
+        'e async (ASGI, um event loop) com a mesma carga de participantes simultâneos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--participants', type=int, default=50, help='Participants per run (default: 50)')
+        parser.add_argument(
+            '--concurrency', type=int, default=10,
+            help='Participants in flight at once; also the WSGI thread count (default: 10)',
+        )
+        parser.add_argument(
+            '--db-latency', type=float, default=0.0,
+            help='Milliseconds added to every query, to mimic a database over the network (default: 0)',
+        )
+        parser.add_argument(
+            '--mode', choices=['both', 'wsgi', 'asgi'], default='both', help='Which handler(s) to run (default: both)',
+        )
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Keep the benchmark participants, ratings and sessions instead of deleting them',
+        )
+
+    def handle(self, *args, **options):
+        if options['participants'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--participants and --concurrency must be positive.')
+        if not FaceImage.objects.exists():
+            raise CommandError('There are no images to rate.')
+        emotion_ids = get_emotion_catalog().ids
+        if not emotion_ids:
+            raise CommandError('There are no emotional states to rate.')
+        try:
+            benchmark_host()
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+
+        modes = ['wsgi', 'asgi'] if options['mode'] == 'both' else [options['mode']]
+        run = uuid.uuid4().hex[:8]
+        self.stdout.write(
+            f'{options["participants"]} participant(s), concurrency {options["concurrency"]}, '
+            f'{options["db_latency"]:g} ms added per query'
+        )
+
+        browsers = []
+        try:
+            for mode in modes:
+                emails = [
+                    f'bench-{run}-{mode}-{index}@example.invalid' for index in range(options['participants'])
+                ]
+                with override_settings(ROOT_URLCONF=session_urlconf(use_async=mode == 'asgi')), \
+                        simulated_db_latency(options['db_latency'] / 1000):
+                    paths = {name: reverse(f'faceStudy:{name}') for name in SESSION_VIEW_NAMES}
+                    started = time.perf_counter()
+                    if mode == 'wsgi':
+                        results = run_wsgi_load(emails, emotion_ids, paths, options['concurrency'])
+                    else:
+                        results = asyncio.run(run_asgi_load(emails, emotion_ids, paths, options['concurrency']))
+                    summary = load_summary(results, time.perf_counter() - started)
+                browsers += results
+                self.stdout.write(
+                    f'{mode.upper()}: {summary["completed"]}/{summary["participants"]} session(s) completed, '
+                    f'{summary["requests"]} request(s) in {summary["seconds"]:.2f}s '
+                    f'({summary["requests_per_second"]:.1f} req/s), {summary["errors"]} error(s); '
+                    f'latency p50 {summary["p50_ms"]:.1f} ms, p95 {summary["p95_ms"]:.1f} ms, '
+                    f'p99 {summary["p99_ms"]:.1f} ms'
+                )
+        finally:
+            if not options['keep']:
+                delete_benchmark_data(f'bench-{run}-', browsers)
@@ -0,0 +1,104 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from face_study.image_utils import delete_derivatives, derivative_stem, render_derivatives
+from face_study.models import FaceImage
+
+
+class Command(BaseCommand):
+    help = 'Gera miniatura e versão web das imagens que ainda não as têm (worker dos uploads)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate derivatives for every image')
+        parser.add_argument('--workers', type=int, default=settings.IMAGE_DERIVATIVE_WORKERS)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--watch', action='store_true',
+            help='Keep running and poll for new or replaced images (background worker)',
+        )
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --watch')
+
+    def handle(self, *args, **options):
+        media_root = str(settings.MEDIA_ROOT)
+
+        # Uploads e trocas de imagem no admin só esvaziam thumbnail/web_image;
+        # este comando (com --watch, como o run_export_jobs) gera as versões
+        # fora do processo web
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            regenerate_all = options['all']
+            while True:
+                done, failed = self.process_pending(executor, media_root, options['batch_size'], regenerate_all)
+                if done or failed or not options['watch']:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'Generated derivatives for {done} image(s), {failed} failed.'
+                    ))
+                if not options['watch']:
+                    break
+                regenerate_all = False
+                time.sleep(options['interval'])
+
+    def process_pending(self, executor, media_root, batch_size, regenerate_all):
+        images = FaceImage.objects.exclude(image='')
+        if not regenerate_all:
+            images = images.filter(Q(thumbnail='') | Q(web_image=''))
+
+        done = failed = 0
+        batch = []
+        for image in images.only('id', 'image', 'content_hash', 'thumbnail', 'web_image').iterator():
+            batch.append(image)
+            if len(batch) >= batch_size:
+                ok, errors = self.process_batch(executor, batch, media_root)
+                done, failed = done + ok, failed + errors
+                batch = []
+        if batch:
+            ok, errors = self.process_batch(executor, batch, media_root)
+            done, failed = done + ok, failed + errors
+        return done, failed
+
+    def process_batch(self, executor, batch, media_root):
+        """Gera as versões de um lote no pool e grava com um único bulk_update"""
+        futures = {
+            executor.submit(render_derivatives, image.image.path, media_root, derivative_stem(image)): image
+            for image in batch
+        }
+        rendered = []
+        failed = 0
+        for future in as_completed(futures):
+            image = futures[future]
+            try:
+                names = future.result()
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f'{image.pk}: {exc}')
+                continue
+            rendered.append((image, names))
+
+        updated = []
+        discarded = []
+        with transaction.atomic():
+            # Uma imagem trocada no admin durante a geração fica para a próxima passada
+            current = dict(
+                FaceImage.objects.select_for_update()
+                .filter(pk__in=[image.pk for image, _ in rendered])
+                .values_list('pk', 'image')
+            )
+            for image, names in rendered:
+                if current.get(image.pk) != image.image.name:
+                    discarded.extend(names.values())
+                    continue
+                # Com --all, versões antigas com outro nome deixam de ser usadas
+                discarded.extend(
+                    name for name in (image.thumbnail.name, image.web_image.name)
+                    if name and name not in names.values()
+                )
+                image.thumbnail.name = names['thumbnail']
+                image.web_image.name = names['web_image']
+                updated.append(image)
+            FaceImage.objects.bulk_update(updated, ['thumbnail', 'web_image'])
+        delete_derivatives(discarded)
+
+        self.stdout.write(f'  {len(updated)} image(s) processed')
+        return len(updated), failed
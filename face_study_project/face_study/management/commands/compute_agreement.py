@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from face_study.analytics_utils import ANALYTICS_CHUNK_SIZE, compute_agreement_summaries
+from face_study.export_utils import iter_agreement_csv
+from face_study.models import EmotionReliability, ImageEmotionAgreement
+
+
+class Command(BaseCommand):
+    help = 'Calcula média, desvio e entropia por imagem e a confiabilidade (alpha/ICC) por emoção'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=ANALYTICS_CHUNK_SIZE,
+                            help='Rankings read per query')
+        parser.add_argument('--csv', default=None,
+                            help='Also write the per-image statistics to this CSV file')
+
+    def handle(self, *args, **options):
+        result = compute_agreement_summaries(chunk_size=options['chunk_size'])
+
+        for reliability in EmotionReliability.objects.select_related('emotion'):
+            self.stdout.write(
+                f'{reliability.emotion.name}: {reliability.n_images} image(s), '
+                f'{reliability.n_ratings} rating(s), alpha={self.format(reliability.krippendorff_alpha)}, '
+                f'ICC(1)={self.format(reliability.icc)}'
+            )
+
+        if options['csv']:
+            with open(options['csv'], 'w', newline='') as handle:
+                for line in iter_agreement_csv(ImageEmotionAgreement.objects.all()):
+                    handle.write(line)
+            self.stdout.write(f'Statistics written to {options["csv"]}.')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{result["rankings"]} ranking(s) summarized into {result["groups"]} image/emotion row(s) '
+            f'for {result["emotions"]} emotion(s) in {result["seconds"]:.1f}s.'
+        ))
+
+    def format(self, value):
+        return '-' if value is None else f'{value:.3f}'
@@ -0,0 +1,95 @@
+from collections import defaultdict
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from face_study.bulk_utils import merge_duplicate_images
+from face_study.image_utils import content_addressed_name, file_content_hash, perceptual_hash
+from face_study.models import FaceImage
+
+
+class Command(BaseCommand):
+    help = 'Calcula os hashes das imagens antigas e junta as de conteúdo repetido'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report duplicates, without changing anything')
+        parser.add_argument('--relocate', action='store_true',
+                            help='Move kept files to their content-addressed names')
+        parser.add_argument('--similar', action='store_true',
+                            help='Also list images sharing a perceptual hash (near duplicates)')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        # Conteúdo -> imagens, da mais antiga para a mais nova
+        groups = defaultdict(list)
+        hashes = {}
+        missing = 0
+        images = FaceImage.objects.only('id', 'image', 'content_hash', 'perceptual_hash', 'uploaded_at')
+        for image in images.order_by('uploaded_at', 'id').iterator(chunk_size=500):
+            content_hash = image.content_hash
+            if not content_hash:
+                try:
+                    with default_storage.open(image.image.name) as handle:
+                        content_hash = file_content_hash(handle)
+                        hashes[image.pk] = (content_hash, image.perceptual_hash or perceptual_hash(handle))
+                except (OSError, ValueError) as exc:
+                    self.stderr.write(f'{image.image.name}: {exc}')
+                    missing += 1
+                    continue
+            groups[content_hash].append(image)
+
+        duplicates = {digest: group for digest, group in groups.items() if len(group) > 1}
+        removed = moved = deleted = 0
+        for digest, (keeper, *extra) in duplicates.items():
+            self.stdout.write(
+                f'{digest[:12]}: keeping {keeper.pk}, merging {", ".join(str(image.pk) for image in extra)}'
+            )
+            if dry_run:
+                continue
+            ratings_moved, result = merge_duplicate_images(keeper.pk, [image.pk for image in extra])
+            moved += ratings_moved
+            deleted += result.ratings
+            removed += len(extra)
+            for image in extra:
+                hashes.pop(image.pk, None)
+                if image.image.name != keeper.image.name:
+                    default_storage.delete(image.image.name)
+
+        if not dry_run:
+            for image_id, (content_hash, phash) in hashes.items():
+                FaceImage.objects.filter(pk=image_id).update(content_hash=content_hash, perceptual_hash=phash)
+            if options['relocate']:
+                self.relocate()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(hashes)} hash(es) computed, {missing} unreadable file(s), '
+            f'{len(duplicates)} duplicate group(s), {removed} image(s) removed, '
+            f'{moved} rating(s) moved, {deleted} conflicting rating(s) deleted.'
+        ))
+
+        if options['similar']:
+            self.report_similar()
+
+    def relocate(self):
+        """Renomeia os arquivos mantidos para faces/ab/cd/<sha256>.<ext>"""
+        relocated = 0
+        for image in FaceImage.objects.exclude(content_hash=None).only('id', 'image', 'content_hash').iterator():
+            target = content_addressed_name(image.content_hash, image.image.name)
+            if image.image.name == target:
+                continue
+            if not default_storage.exists(target):
+                with default_storage.open(image.image.name) as handle:
+                    default_storage.save(target, handle)
+            old_name = image.image.name
+            FaceImage.objects.filter(pk=image.pk).update(image=target)
+            default_storage.delete(old_name)
+            relocated += 1
+        self.stdout.write(f'{relocated} file(s) relocated.')
+
+    def report_similar(self):
+        groups = defaultdict(list)
+        for code, phash in FaceImage.objects.exclude(perceptual_hash='').values_list('code', 'perceptual_hash'):
+            groups[phash].append(code)
+        for phash, codes in groups.items():
+            if len(codes) > 1:
+                self.stdout.write(f'similar {phash}: {", ".join(codes)}')
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from face_study.catalog_utils import get_emotion_catalog
+from face_study.export_utils import build_rating_matrix, write_rating_matrix, MATRIX_FORMATS
+from face_study.models import ImageRating
+
+
+class Command(BaseCommand):
+    help = 'Exporta as avaliações como matriz densa float32 (avaliações x emoções)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Output file path')
+        parser.add_argument('--format', choices=sorted(MATRIX_FORMATS), default='npz')
+        parser.add_argument('--start-date', help='Only ratings created on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--end-date', help='Only ratings created on or before this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        queryset = ImageRating.objects.all()
+        if options['start_date']:
+            queryset = queryset.filter(created_at__date__gte=options['start_date'])
+        if options['end_date']:
+            queryset = queryset.filter(created_at__date__lte=options['end_date'])
+
+        try:
+            matrix = build_rating_matrix(queryset, get_emotion_catalog())
+            write_rating_matrix(matrix, options['output'], options['format'])
+        except ImportError as exc:
+            raise CommandError(f'The {options["format"]} format is not available: {exc}')
+
+        rows, columns = matrix['values'].shape
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {rows} rating(s) x {columns} emotion(s) to {options["output"]}.'
+        ))
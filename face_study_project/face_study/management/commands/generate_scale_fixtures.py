@@ -0,0 +1,85 @@
+import time
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from face_study.config_utils import get_active_config
+from face_study.fixture_utils import FIXTURE_BATCH_SIZE, FixturePlan, generate_scale_fixtures
+from face_study.models import StudyConfiguration
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera dados sintéticos em volume de produção (imagens com arquivos de exemplo, participantes, '
+        'avaliações e rankings) com bulk_create em lotes, para reproduzir lentidões localmente'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=100000, help='FaceImage rows (default: 100000)')
+        parser.add_argument('--participants', type=int, default=20000, help='Participant rows (default: 20000)')
+        parser.add_argument('--ratings', type=int, default=1000000, help='ImageRating rows (default: 1000000)')
+        parser.add_argument(
+            '--emotions', type=int, default=10,
+            help='Emotions ranked per rating; missing ones are created (default: 10, i.e. 10 rankings per rating)',
+        )
+        parser.add_argument(
+            '--max-ratings-per-image', type=int,
+            help='Set max_ratings_per_image on the active study configuration first '
+                 '(default: raised to ratings / images when the current limit is too low)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=FIXTURE_BATCH_SIZE,
+            help=f'Rows per INSERT (default: {FIXTURE_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--no-files', action='store_true',
+            help='Do not write placeholder files (image fields stay empty)',
+        )
+        parser.add_argument('--label', help='Tag for the generated rows (default: random)')
+        parser.add_argument('--seed', type=int, help='Random seed, for reproducible datasets')
+
+    def handle(self, *args, **options):
+        for name in ('images', 'participants', 'ratings', 'emotions', 'batch_size'):
+            if options[name] < 0 or (name == 'batch_size' and options[name] < 1):
+                raise CommandError(f'--{name.replace("_", "-")} must be positive.')
+
+        max_ratings = options['max_ratings_per_image']
+        if max_ratings is None and options['images']:
+            # Sem limite explícito, só sobe o atual se as avaliações não couberem
+            needed = -(-options['ratings'] // options['images'])
+            if needed > get_active_config().max_ratings_per_image:
+                max_ratings = needed
+                self.stdout.write(f'Raising max_ratings_per_image to {needed} so the ratings fit.')
+
+        if max_ratings is not None:
+            config = StudyConfiguration.objects.get(pk=get_active_config().pk)
+            config.max_ratings_per_image = max_ratings
+            try:
+                config.full_clean()
+            except ValidationError as exc:
+                raise CommandError(f'Invalid max_ratings_per_image={max_ratings}: {"; ".join(exc.messages)}')
+            config.save()
+
+        plan = FixturePlan(
+            options['images'], options['participants'], options['ratings'], options['emotions'],
+            label=options['label'], batch_size=options['batch_size'], files=not options['no_files'],
+            seed=options['seed'],
+        )
+        started = time.monotonic()
+
+        def progress(phase, rows):
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'{phase}: {rows} row(s) after {elapsed:.1f}s')
+
+        try:
+            result = generate_scale_fixtures(plan, progress=progress)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        seconds = result['seconds']
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated fixture set "{result["label"]}": {result["images"]} image(s), '
+            f'{result["participants"]} participant(s), {result["ratings"]} rating(s) and '
+            f'{result["rankings"]} ranking(s) over {result["emotions"]} emotion(s) '
+            f'in {sum(seconds.values()):.1f}s.'
+        ))
+        for phase, elapsed in seconds.items():
+            self.stdout.write(f'  {phase}: {elapsed:.1f}s')
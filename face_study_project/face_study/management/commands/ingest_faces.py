@@ -0,0 +1,131 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from face_study.ingest_utils import ingest_entry, list_source_entries
+from face_study.models import DuplicateSource, FaceImage, generate_image_code
+from face_study.stats_utils import record_images_added
+
+
+class Command(BaseCommand):
+    help = 'Importa em massa imagens de faces de um diretório, .zip ou .tar'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Directory, zip or tar archive with face images')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per bulk_create')
+        parser.add_argument('--skip-derivatives', action='store_true',
+                            help='Do not generate thumbnails/web renditions (run build_image_derivatives later)')
+        parser.add_argument('--prefix', default=None,
+                            help='Label stored with each file to tell datasets apart (default: source name)')
+
+    def handle(self, *args, **options):
+        source = options['source']
+        try:
+            entries = list_source_entries(source)
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        prefix = options['prefix'] or os.path.basename(os.path.normpath(source))
+        batch_size = options['batch_size']
+
+        # Reexecutar é seguro: o que já foi importado (ou descartado como
+        # duplicata) é pulado pelo source_name, sem reler o arquivo
+        pending = []
+        skipped = 0
+        for start in range(0, len(entries), batch_size):
+            batch = entries[start:start + batch_size]
+            names = [f'{prefix}/{entry}' for entry in batch]
+            existing = set(
+                FaceImage.objects.filter(source_name__in=names).values_list('source_name', flat=True)
+            ) | set(
+                DuplicateSource.objects.filter(source_name__in=names).values_list('source_name', flat=True)
+            )
+            for entry in batch:
+                if f'{prefix}/{entry}' in existing:
+                    skipped += 1
+                else:
+                    pending.append(entry)
+
+        self.stdout.write(f'{len(entries)} image(s) found, {skipped} already imported, {len(pending)} to import.')
+
+        started = time.monotonic()
+        created = invalid = 0
+        rows = []
+        # Hash -> id das imagens gravadas nesta execução (o banco é consultado a cada lote)
+        self.seen_hashes = {}
+        self.duplicates = 0
+
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            results = executor.map(
+                ingest_entry,
+                [source] * len(pending),
+                pending,
+                [not options['skip_derivatives']] * len(pending),
+                chunksize=16,
+            )
+            for result in results:
+                if 'error' in result:
+                    invalid += 1
+                    self.stderr.write(f'{result["source_name"]}: {result["error"]}')
+                    continue
+
+                rows.append(FaceImage(
+                    id=result['id'],
+                    image=result['image'],
+                    thumbnail=result.get('thumbnail', ''),
+                    web_image=result.get('web_image', ''),
+                    code=generate_image_code(),
+                    source_name=f'{prefix}/{result["source_name"]}',
+                    content_hash=result['content_hash'],
+                    perceptual_hash=result['perceptual_hash'],
+                ))
+                if len(rows) >= batch_size:
+                    created += self.flush(rows, started)
+
+        created += self.flush(rows, started)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {created} image(s), {invalid} invalid, {skipped} skipped, '
+            f'{self.duplicates} duplicate(s) '
+            f'in {elapsed:.1f}s ({created / max(elapsed, 1e-6):.1f} images/s).'
+        ))
+
+    def flush(self, rows, started):
+        if not rows:
+            return 0
+        # Conteúdo já cadastrado (ou repetido no lote) não gera outro FaceImage;
+        # a origem fica registrada como DuplicateSource da imagem existente
+        existing = dict(FaceImage.objects.filter(
+            content_hash__in=[row.content_hash for row in rows]
+        ).values_list('content_hash', 'id'))
+        unique_rows = []
+        duplicates = []
+        for row in rows:
+            image_id = existing.get(row.content_hash) or self.seen_hashes.get(row.content_hash)
+            if image_id:
+                duplicates.append(DuplicateSource(source_name=row.source_name, image_id=image_id))
+                continue
+            self.seen_hashes[row.content_hash] = row.id
+            unique_rows.append(row)
+        rows.clear()
+
+        self.ensure_unique_codes(unique_rows)
+        FaceImage.objects.bulk_create(unique_rows, batch_size=max(len(unique_rows), 1))
+        DuplicateSource.objects.bulk_create(duplicates, ignore_conflicts=True)
+        self.duplicates += len(duplicates)
+        count = len(unique_rows)
+        # bulk_create não dispara sinais
+        record_images_added(count)
+        self.stdout.write(f'  +{count} image(s), {time.monotonic() - started:.1f}s elapsed')
+        return count
+
+    def ensure_unique_codes(self, rows):
+        """Sorteia outro código para as linhas que repetem um código do lote ou do banco"""
+        taken = set(FaceImage.objects.filter(
+            code__in=[row.code for row in rows]
+        ).values_list('code', flat=True))
+        for row in rows:
+            while row.code in taken:
+                row.code = generate_image_code()
+            taken.add(row.code)
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import time
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import reverse
+from face_study.benchmark_utils import (
+    SESSION_VIEW_NAMES, benchmark_host, check_invariants, counting_queries, delete_benchmark_data,
+    endpoint_summaries, load_summary, run_asgi_load, run_wsgi_load, session_urlconf, simulated_db_latency,
+)
+from face_study.catalog_utils import get_emotion_catalog
+from face_study.models import FaceImage
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga da sessão de avaliação: N participantes simultâneos fazendo início, '
+        'avaliações e fim; mede latência por endpoint e consultas por requisição e verifica os invariantes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--participants', type=int, default=100, help='Simulated participants (default: 100)')
+        parser.add_argument(
+            '--concurrency', type=int, default=20, help='Participants in flight at once (default: 20)',
+        )
+        parser.add_argument(
+            '--handler', choices=['wsgi', 'asgi'], default='wsgi',
+            help='wsgi: sync views on a thread pool; asgi: async views on one event loop (default: wsgi)',
+        )
+        parser.add_argument(
+            '--db-latency', type=float, default=0.0,
+            help='Milliseconds added to every query, to mimic a database over the network (default: 0)',
+        )
+        parser.add_argument('--json', metavar='PATH', help='Also write the full report as JSON to this file')
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Keep the simulated participants, ratings and sessions instead of deleting them',
+        )
+
+    def handle(self, *args, **options):
+        if options['participants'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--participants and --concurrency must be positive.')
+        if not FaceImage.objects.exists():
+            raise CommandError('There are no images to rate.')
+        emotion_ids = get_emotion_catalog().ids
+        if not emotion_ids:
+            raise CommandError('There are no emotional states to rate.')
+        try:
+            benchmark_host()
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+
+        handler = options['handler']
+        run = uuid.uuid4().hex[:8]
+        emails = [f'load-{run}-{index}@example.invalid' for index in range(options['participants'])]
+
+        browsers = []
+        try:
+            with override_settings(ROOT_URLCONF=session_urlconf(use_async=handler == 'asgi')), \
+                    simulated_db_latency(options['db_latency'] / 1000), counting_queries():
+                paths = {name: reverse(f'faceStudy:{name}') for name in SESSION_VIEW_NAMES}
+                started = time.perf_counter()
+                if handler == 'wsgi':
+                    browsers = run_wsgi_load(emails, emotion_ids, paths, options['concurrency'])
+                else:
+                    browsers = asyncio.run(run_asgi_load(emails, emotion_ids, paths, options['concurrency']))
+                seconds = time.perf_counter() - started
+            invariants = check_invariants()
+        finally:
+            if not options['keep']:
+                delete_benchmark_data(f'load-{run}-', browsers)
+
+        report = {
+            'handler': handler,
+            'concurrency': options['concurrency'],
+            'db_latency_ms': options['db_latency'],
+            'summary': load_summary(browsers, seconds),
+            'endpoints': endpoint_summaries(browsers, paths),
+            'invariants': invariants,
+        }
+        self.write_report(report)
+        if options['json']:
+            with open(options['json'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+        violations = {name: count for name, count in invariants.items() if count}
+        if violations:
+            raise CommandError(f'Invariant violation(s): {violations}')
+
+    def write_report(self, report):
+        summary = report['summary']
+        self.stdout.write(
+            f'{report["handler"].upper()}, concurrency {report["concurrency"]}: '
+            f'{summary["completed"]}/{summary["participants"]} session(s) completed, '
+            f'{summary["requests"]} request(s) in {summary["seconds"]:.2f}s '
+            f'({summary["requests_per_second"]:.1f} req/s), {summary["errors"]} error(s)'
+        )
+        self.stdout.write(f'{"endpoint":<24}{"requests":>9}{"errors":>8}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}')
+        for endpoint, stats in [*report['endpoints'].items(), ('all', summary)]:
+            self.stdout.write(
+                f'{endpoint:<24}{stats["requests"]:>9}{stats["errors"]:>8}{stats["p50_ms"]:>9.1f}'
+                f'{stats["p95_ms"]:>9.1f}{stats["p99_ms"]:>9.1f}{stats["queries_per_request"]:>9.1f}'
+            )
+        for name, count in report['invariants'].items():
+            if count:
+                self.stdout.write(self.style.ERROR(f'{name}: {count} violation(s)'))
+        if not any(report['invariants'].values()):
+            self.stdout.write(self.style.SUCCESS('All invariants hold.'))
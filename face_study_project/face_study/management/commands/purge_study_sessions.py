@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from face_study.selection_utils import release_expired_reservations
+from face_study.session_utils import SESSION_PURGE_CHUNK_SIZE, purge_expired_sessions
+
+
+class Command(BaseCommand):
+    help = (
+        'Remove as sessões de avaliação vencidas: libera as reservas expiradas e apaga em lotes '
+        'as linhas vencidas de django_session'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=SESSION_PURGE_CHUNK_SIZE,
+            help=f'Session rows deleted per statement (default: {SESSION_PURGE_CHUNK_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+
+        released = release_expired_reservations()
+        purged = purge_expired_sessions(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Released {released} expired reservation(s) and purged {purged} expired session row(s).'
+        ))
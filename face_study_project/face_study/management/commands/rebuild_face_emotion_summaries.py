@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from face_study.models import EmotionRanking, FaceEmotionSummary
+from face_study.summary_utils import rebuild_face_emotion_summaries, scaled_sums, summed_levels
+
+
+class Command(BaseCommand):
+    help = 'Recalcula (ou apenas verifica) os resumos FaceEmotionSummary a partir dos rankings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report (image, emotion) summaries that differ from the rankings, without fixing them',
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            stored = {
+                (image_id, emotion_id): (count, total, total_sq)
+                for image_id, emotion_id, count, total, total_sq in FaceEmotionSummary.objects.filter(
+                    count__gt=0
+                ).values_list('image_id', 'emotion_id', 'count', 'total', 'total_sq').iterator()
+            }
+            wrong = 0
+            for row in summed_levels(EmotionRanking.objects.all()).iterator():
+                key = (row['rating__image_id'], row['emotion_id'])
+                actual = scaled_sums(row)
+                if stored.pop(key, None) != actual:
+                    self.stdout.write(f'{key[0]} / emotion {key[1]}: expected {actual}')
+                    wrong += 1
+            for key, values in stored.items():
+                self.stdout.write(f'{key[0]} / emotion {key[1]}: stored {values} without rankings')
+                wrong += 1
+            if wrong:
+                raise CommandError(f'{wrong} inconsistent summary(ies).')
+            self.stdout.write(self.style.SUCCESS('All face emotion summaries are consistent.'))
+            return
+
+        rebuild_face_emotion_summaries()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {FaceEmotionSummary.objects.count()} face emotion summary(ies).'
+        ))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from face_study.models import FaceImage
+
+
+class Command(BaseCommand):
+    help = 'Recalcula (ou apenas verifica) os contadores rating_count e reserved_count de FaceImage'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report images whose stored counters are wrong, without fixing them',
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            wrong = 0
+            rating_mismatches = FaceImage.objects.with_actual_rating_count().exclude(
+                rating_count=F('actual_rating_count')
+            ).values_list('code', 'rating_count', 'actual_rating_count')
+            for code, stored, actual in rating_mismatches:
+                self.stdout.write(f'{code}: rating_count stored={stored} actual={actual}')
+                wrong += 1
+            reserved_mismatches = FaceImage.objects.with_actual_reserved_count().exclude(
+                reserved_count=F('actual_reserved_count')
+            ).values_list('code', 'reserved_count', 'actual_reserved_count')
+            for code, stored, actual in reserved_mismatches:
+                self.stdout.write(f'{code}: reserved_count stored={stored} actual={actual}')
+                wrong += 1
+            if wrong:
+                raise CommandError(f'{wrong} inconsistent counter(s).')
+            self.stdout.write(self.style.SUCCESS('All image counters are consistent.'))
+            return
+
+        with transaction.atomic():
+            updated = FaceImage.objects.rebuild_rating_counts()
+            FaceImage.objects.rebuild_reserved_counts()
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters for {updated} image(s).'))
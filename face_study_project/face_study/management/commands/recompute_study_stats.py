@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from face_study.stats_utils import get_study_stats, recompute_study_stats
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o snapshot StudyStats (totais, cobertura e avaliações por hora) a partir das tabelas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report differences between the stored snapshot and a full recount, without fixing them',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            stored = get_study_stats()
+            recompute_study_stats()
+            actual = get_study_stats()
+            if options['verify']:
+                # Só compara: o recálculo é desfeito
+                transaction.set_rollback(True)
+
+        keys = ['total_images', 'rated_images', 'total_ratings', 'total_participants', 'coverage', 'hourly']
+        differences = [key for key in keys if stored[key] != actual[key]]
+        for key in differences:
+            self.stdout.write(f'{key}: stored={stored[key]} actual={actual[key]}')
+
+        if options['verify']:
+            if differences:
+                raise CommandError(f'{len(differences)} out-of-date field(s) in the study stats.')
+            self.stdout.write(self.style.SUCCESS('Study stats are consistent.'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Study stats recomputed: {actual["total_images"]} image(s), {actual["total_ratings"]} rating(s), '
+            f'{actual["total_participants"]} participant(s); {len(differences)} field(s) were out of date.'
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from face_study.selection_utils import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = 'Libera as reservas de imagens de sessões abandonadas (expiradas)'
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations()
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired reservation(s).'))
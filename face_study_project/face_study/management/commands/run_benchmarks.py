@@ -0,0 +1,73 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from face_study.benchmark_utils import SUITE_ADMIN_MODELS, compare_reports, run_benchmark_suite
+
+SUITE_CASE_NAMES = (
+    'dashboard',
+    *(f'admin_{model_name}_changelist' for model_name in SUITE_ADMIN_MODELS),
+    'select_next_image',
+    'reserve_images',
+    'export_ratings_csv',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Suíte de benchmark sobre os dados atuais: dashboard, changelists do admin, seleção e reserva '
+        'de imagens e exportação CSV; grava um relatório JSON comparável entre commits'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per case (default: 5)')
+        parser.add_argument(
+            '--only', nargs='+', choices=SUITE_CASE_NAMES, metavar='CASE',
+            help=f'Run only these cases ({", ".join(SUITE_CASE_NAMES)})',
+        )
+        parser.add_argument('--output', metavar='PATH', help='Write the JSON report to this file')
+        parser.add_argument(
+            '--compare', metavar='PATH', help='Previous JSON report to compare the median times against',
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be positive.')
+        previous = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as source:
+                    previous = json.load(source)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Cannot read {options["compare"]}: {exc}')
+
+        self.stdout.write(f'{"case":<36}{"min ms":>10}{"median ms":>11}{"p95 ms":>10}{"queries":>9}')
+
+        def progress(name, stats):
+            self.stdout.write(
+                f'{name:<36}{stats["min_ms"]:>10.1f}{stats["median_ms"]:>11.1f}'
+                f'{stats["p95_ms"]:>10.1f}{stats["queries"]:>9}'
+            )
+
+        try:
+            report = run_benchmark_suite(options['repeat'], options['only'], progress=progress)
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+
+        dataset = report['dataset']
+        self.stdout.write(
+            f'Dataset: {dataset["images"]} image(s), {dataset["participants"]} participant(s), '
+            f'{dataset["ratings"]} rating(s), {dataset["rankings"]} ranking(s) on {report["database"]}; '
+            f'commit {report["commit"] or "unknown"}'
+        )
+
+        if previous is not None:
+            self.stdout.write(
+                f'Compared with commit {previous.get("commit") or "unknown"} ({previous.get("created_at")}):'
+            )
+            for name, (before, after, change) in compare_reports(previous, report).items():
+                line = f'  {name:<34}{before:>10.1f} -> {after:>10.1f} ms ({change:+.1%})'
+                self.stdout.write(self.style.ERROR(line) if change > 0.1 else line)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}.'))
@@ -0,0 +1,49 @@
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from face_study.export_utils import EXPORT_CHUNK_SIZE, ExportJobLost, claim_export_job, run_export_job
+from face_study.models import ExportJob
+
+
+class Command(BaseCommand):
+    help = 'Worker local que executa as exportações em segundo plano (ExportJob)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process the queued jobs and exit')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between queue polls')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        # Vários workers podem rodar juntos: cada job é reservado por um UPDATE
+        # condicional, e um job "running" só é retomado (do último checkpoint)
+        # quando o worker dele parou de renovar o heartbeat
+        while True:
+            job = claim_export_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+                continue
+
+            self.stdout.write(f'Running export #{job.pk} ({job.description})...')
+            try:
+                run_export_job(job, options['chunk_size'], progress=self.report_progress)
+            except ExportJobLost as exc:
+                self.stderr.write(str(exc))
+                continue
+            except Exception as exc:
+                ExportJob.objects.filter(pk=job.pk, heartbeat_at=job.heartbeat_at).update(
+                    status=ExportJob.STATUS_FAILED, error=repr(exc), finished_at=timezone.now(),
+                )
+                self.stderr.write(f'Export #{job.pk} failed: {exc!r}')
+                continue
+
+            self.stdout.write(self.style.SUCCESS(
+                f'Export #{job.pk} done: {job.rows_written} row(s), '
+                f'{job.rows_per_second or 0:.0f} rows/s -> {job.file.name}'
+            ))
+
+    def report_progress(self, job):
+        self.stdout.write(
+            f'  #{job.pk}: {job.rows_written}/{job.total_rows} row(s), {job.rows_per_second:.0f} rows/s'
+        )
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:10
+
+import django.core.validators
+import django.utils.timezone
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_study', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='emotionranking',
+            options={'ordering': ['emotion__name']},
+        ),
+        migrations.AlterUniqueTogether(
+            name='emotionranking',
+            unique_together={('rating', 'emotion')},
+        ),
+        migrations.RemoveField(
+            model_name='faceimage',
+            name='is_rated',
+        ),
+        migrations.RemoveField(
+            model_name='participant',
+            name='completed_sessions',
+        ),
+        migrations.RemoveField(
+            model_name='studyconfiguration',
+            name='images_per_session',
+        ),
+        migrations.AddField(
+            model_name='emotionranking',
+            name='agreement_level',
+            field=models.DecimalField(decimal_places=2, default=0.5, max_digits=3, validators=[django.core.validators.MinValueValidator(Decimal('0.00')), django.core.validators.MaxValueValidator(Decimal('1.00'))]),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='emotionranking',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='participant',
+            name='last_session_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='studyconfiguration',
+            name='max_images_per_session',
+            field=models.IntegerField(default=10, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(50)], verbose_name='Maximum images per session'),
+        ),
+        migrations.AddField(
+            model_name='studyconfiguration',
+            name='max_ratings_per_image',
+            field=models.IntegerField(default=1, help_text='Maximum number of times an image can be rated', validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(100)], verbose_name='Maximum ratings per image'),
+        ),
+        migrations.AddField(
+            model_name='studyconfiguration',
+            name='min_images_per_session',
+            field=models.IntegerField(default=1, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(50)], verbose_name='Minimum images per session'),
+        ),
+        migrations.RemoveField(
+            model_name='emotionranking',
+            name='rank',
+        ),
+    ]
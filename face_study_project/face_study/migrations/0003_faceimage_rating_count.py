@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_counts(apps, schema_editor):
+    FaceImage = apps.get_model('face_study', 'FaceImage')
+    ImageRating = apps.get_model('face_study', 'ImageRating')
+    actual = ImageRating.objects.filter(
+        image=OuterRef('pk')
+    ).order_by().values('image').annotate(total=Count('id')).values('total')
+    FaceImage.objects.update(rating_count=Coalesce(Subquery(actual), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_study', '0002_sync_models'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceimage',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='faceimage',
+            index=models.Index(fields=['rating_count'], name='faceimage_rating_count_idx'),
+        ),
+        migrations.RunPython(backfill_rating_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:10
+
+import face_study.models
+from django.db import migrations, models
+from django.db.models.functions import Random
+
+
+def reroll_random_keys(apps, schema_editor):
+    # O default é avaliado uma vez só no AddField; sorteia uma chave por linha
+    FaceImage = apps.get_model('face_study', 'FaceImage')
+    FaceImage.objects.update(random_key=Random())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_study', '0003_faceimage_rating_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceimage',
+            name='random_key',
+            field=models.FloatField(default=face_study.models.random_sampling_key, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='faceimage',
+            index=models.Index(fields=['random_key'], name='faceimage_random_key_idx'),
+        ),
+        migrations.RunPython(reroll_random_keys, migrations.RunPython.noop),
+    ]
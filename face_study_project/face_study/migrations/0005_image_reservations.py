@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_study', '0004_faceimage_random_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceimage',
+            name='reserved_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='ImageReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.UUIDField(db_index=True)),
+                ('position', models.PositiveSmallIntegerField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('consumed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='face_study.faceimage')),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='face_study.participant')),
+            ],
+            options={
+                'ordering': ['token', 'position'],
+                'unique_together': {('token', 'position')},
+            },
+        ),
+    ]
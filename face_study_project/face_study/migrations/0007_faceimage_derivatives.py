@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_study', '0006_export_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='faceimage',
+            name='web_image',
+            field=models.ImageField(blank=True, editable=False, upload_to=''),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_study', '0007_faceimage_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceimage',
+            name='source_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_study', '0008_faceimage_source_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceimage',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='faceimage',
+            name='perceptual_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16),
+        ),
+    ]
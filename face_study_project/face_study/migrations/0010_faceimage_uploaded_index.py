@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_study', '0009_faceimage_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='faceimage',
+            index=models.Index(fields=['uploaded_at', 'id'], name='faceimage_uploaded_idx'),
+        ),
+    ]
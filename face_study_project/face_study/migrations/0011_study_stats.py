@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:27
+
+from datetime import timezone as dt_timezone
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+
+def backfill_study_stats(apps, schema_editor):
+    FaceImage = apps.get_model('face_study', 'FaceImage')
+    ImageRating = apps.get_model('face_study', 'ImageRating')
+    Participant = apps.get_model('face_study', 'Participant')
+    CoverageBucket = apps.get_model('face_study', 'CoverageBucket')
+    HourlyRatingCount = apps.get_model('face_study', 'HourlyRatingCount')
+    StudyStats = apps.get_model('face_study', 'StudyStats')
+
+    CoverageBucket.objects.bulk_create([
+        CoverageBucket(rating_count=rating_count, images=images)
+        for rating_count, images in FaceImage.objects.order_by().values_list('rating_count').annotate(images=Count('id'))
+    ])
+    HourlyRatingCount.objects.bulk_create([
+        HourlyRatingCount(hour=hour, ratings=total)
+        for hour, total in ImageRating.objects.order_by().annotate(
+            hour=TruncHour('created_at', tzinfo=dt_timezone.utc)
+        ).values_list('hour').annotate(total=Count('id'))
+    ], batch_size=1000)
+    StudyStats.objects.create(pk=1, total_participants=Participant.objects.count(), recomputed_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_study', '0010_faceimage_uploaded_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoverageBucket',
+            fields=[
+                ('rating_count', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('images', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HourlyRatingCount',
+            fields=[
+                ('hour', models.DateTimeField(primary_key=True, serialize=False)),
+                ('ratings', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StudyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_participants', models.IntegerField(default=0)),
+                ('recomputed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Study stats',
+            },
+        ),
+        migrations.RunPython(backfill_study_stats, migrations.RunPython.noop),
+    ]
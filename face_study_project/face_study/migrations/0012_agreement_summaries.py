@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_study', '0011_study_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmotionReliability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('n_images', models.PositiveIntegerField(help_text='Images with two or more ratings')),
+                ('n_ratings', models.PositiveIntegerField()),
+                ('n_raters', models.PositiveIntegerField()),
+                ('mean_agreement', models.FloatField(null=True)),
+                ('krippendorff_alpha', models.FloatField(null=True)),
+                ('icc', models.FloatField(null=True, verbose_name='ICC(1)')),
+                ('computed_at', models.DateTimeField()),
+                ('emotion', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reliability', to='face_study.emotionalstate')),
+            ],
+            options={
+                'verbose_name_plural': 'Emotion reliability',
+                'ordering': ['emotion__name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ImageEmotionAgreement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('n_ratings', models.PositiveIntegerField()),
+                ('mean', models.FloatField()),
+                ('std', models.FloatField()),
+                ('entropy', models.FloatField()),
+                ('computed_at', models.DateTimeField()),
+                ('emotion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_agreement_stats', to='face_study.emotionalstate')),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agreement_stats', to='face_study.faceimage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['emotion', 'std'], name='agreement_emotion_std_idx')],
+                'unique_together': {('image', 'emotion')},
+            },
+        ),
+    ]
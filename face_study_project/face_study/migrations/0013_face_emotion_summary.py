@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Sum
+
+
+def backfill_summaries(apps, schema_editor):
+    EmotionRanking = apps.get_model('face_study', 'EmotionRanking')
+    FaceEmotionSummary = apps.get_model('face_study', 'FaceEmotionSummary')
+    squared = ExpressionWrapper(F('agreement_level') * F('agreement_level'), output_field=FloatField())
+    grouped = EmotionRanking.objects.order_by().values('rating__image_id', 'emotion_id').annotate(
+        levels=Count('id'),
+        levels_total=Sum('agreement_level', output_field=FloatField()),
+        levels_total_sq=Sum(squared, output_field=FloatField()),
+    )
+    FaceEmotionSummary.objects.bulk_create([
+        FaceEmotionSummary(
+            image_id=row['rating__image_id'],
+            emotion_id=row['emotion_id'],
+            count=row['levels'],
+            total=int(round(row['levels_total'] * 100)),
+            total_sq=int(round(row['levels_total_sq'] * 10000)),
+        )
+        for row in grouped.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_study', '0012_agreement_summaries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceEmotionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0)),
+                ('total', models.BigIntegerField(default=0)),
+                ('total_sq', models.BigIntegerField(default=0)),
+                ('emotion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_summaries', to='face_study.emotionalstate')),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='emotion_summaries', to='face_study.faceimage')),
+            ],
+            options={
+                'unique_together': {('image', 'emotion')},
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
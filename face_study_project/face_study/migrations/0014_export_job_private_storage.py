@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:58
+
+import face_study.models
+from django.db import migrations, models
+
+
+def move_exports_out_of_media(apps, schema_editor):
+    """
+    Apaga os CSVs antigos de MEDIA_ROOT/exports (públicos) e recoloca os jobs
+    na fila, para que sejam gerados de novo no storage privado.
+    """
+    from django.core.files.storage import default_storage
+
+    ExportJob = apps.get_model('face_study', 'ExportJob')
+    for job in ExportJob.objects.exclude(file=''):
+        if default_storage.exists(job.file.name):
+            default_storage.delete(job.file.name)
+        job.file = ''
+        job.status = 'pending'
+        job.last_rating_id = 0
+        job.bytes_written = 0
+        job.rows_written = 0
+        job.finished_at = None
+        job.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_study', '0013_face_emotion_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='exportjob',
+            name='file',
+            field=models.FileField(blank=True, storage=face_study.models.export_storage, upload_to=''),
+        ),
+        migrations.RunPython(move_exports_out_of_media, migrations.RunPython.noop),
+    ]
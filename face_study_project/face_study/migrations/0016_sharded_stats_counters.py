@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:03
+
+from datetime import timezone as dt_timezone
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+
+
+def backfill_sharded_counters(apps, schema_editor):
+    """As tabelas são recriadas com a chave (valor, slot): recontagem completa no slot 0"""
+    FaceImage = apps.get_model('face_study', 'FaceImage')
+    ImageRating = apps.get_model('face_study', 'ImageRating')
+    CoverageBucket = apps.get_model('face_study', 'CoverageBucket')
+    HourlyRatingCount = apps.get_model('face_study', 'HourlyRatingCount')
+
+    CoverageBucket.objects.bulk_create([
+        CoverageBucket(rating_count=rating_count, images=images)
+        for rating_count, images in FaceImage.objects.order_by().values_list('rating_count').annotate(images=Count('id'))
+    ])
+    HourlyRatingCount.objects.bulk_create([
+        HourlyRatingCount(hour=hour, ratings=total)
+        for hour, total in ImageRating.objects.order_by().annotate(
+            hour=TruncHour('created_at', tzinfo=dt_timezone.utc)
+        ).values_list('hour').annotate(total=Count('id'))
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_study', '0015_cache_version'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(name='CoverageBucket'),
+        migrations.DeleteModel(name='HourlyRatingCount'),
+        migrations.CreateModel(
+            name='CoverageBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating_count', models.PositiveIntegerField()),
+                ('slot', models.PositiveSmallIntegerField(default=0)),
+                ('images', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('rating_count', 'slot')},
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyRatingCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('slot', models.PositiveSmallIntegerField(default=0)),
+                ('ratings', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('hour', 'slot')},
+            },
+        ),
+        migrations.RunPython(backfill_sharded_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_study', '0016_sharded_stats_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DuplicateSource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_name', models.CharField(max_length=255, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duplicate_sources', to='face_study.faceimage')),
+            ],
+        ),
+    ]
@@ -1,14 +1,52 @@
-from django.db import models
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator, MaxValueValidator
 import uuid
 import os
+import random
 from decimal import Decimal
+from .config_utils import get_active_config
 
 def image_upload_path(instance, filename):
+    # Com o hash do conteúdo o arquivo é endereçado por ele (ver image_utils.content_addressed_name)
+    content_hash = getattr(instance, 'content_hash', None)
+    if content_hash:
+        from .image_utils import content_addressed_name
+        return content_addressed_name(content_hash, filename)
     ext = filename.split('.')[-1]
     filename = f"{uuid.uuid4().hex[:16]}.{ext}"
     return f'faces/{filename}'
 
+class ExportStorage(FileSystemStorage):
+    """
+    Storage privado das exportações, em STUDY_EXPORT_ROOT (fora de MEDIA_ROOT).
+
+    Os arquivos não têm URL pública: são baixados pela view download_export.
+    """
+    @property
+    def base_location(self):
+        return settings.STUDY_EXPORT_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    def url(self, name):
+        raise ValueError('Export files have no public URL; use the download_export view.')
+
+def export_storage():
+    return ExportStorage()
+
+def random_sampling_key():
+    return random.random()
+
+def generate_image_code():
+    # 64 bits: códigos criados em massa (ingest_faces, fixtures) não colidem na prática
+    return f"IMG-{uuid.uuid4().hex[:16].upper()}"
+
 class EmotionalState(models.Model):
     name = models.CharField(max_length=50, unique=True)
     description = models.TextField(blank=True)
@@ -20,37 +58,131 @@ class EmotionalState(models.Model):
     def __str__(self):
         return self.name
 
+class FaceImageQuerySet(models.QuerySet):
+    def available(self, max_ratings):
+        """Imagens que ainda não atingiram o limite de avaliações (usa o índice de rating_count)"""
+        return self.filter(rating_count__lt=max_ratings)
+    
+    def with_open_slots(self, max_ratings):
+        """Imagens disponíveis considerando também as reservas ainda não consumidas"""
+        return self.available(max_ratings).filter(
+            rating_count__lt=max_ratings - F('reserved_count')
+        )
+    
+    def rebuild_rating_counts(self):
+        """Recalcula o contador desnormalizado a partir da tabela de avaliações"""
+        from .stats_utils import record_coverage_change
+        
+        actual = ImageRating.objects.filter(
+            image=OuterRef('pk')
+        ).order_by().values('image').annotate(total=Count('id')).values('total')
+        # O histograma de cobertura (StudyStats) acompanha a correção dos contadores
+        before = self.coverage_histogram()
+        updated = self.update(rating_count=Coalesce(Subquery(actual), Value(0)))
+        record_coverage_change(before, self.coverage_histogram())
+        return updated
+    
+    def rebuild_reserved_counts(self):
+        """Recalcula o contador de reservas ativas (não consumidas)"""
+        actual = ImageReservation.objects.filter(
+            image=OuterRef('pk'), consumed_at__isnull=True
+        ).order_by().values('image').annotate(total=Count('id')).values('total')
+        return self.update(reserved_count=Coalesce(Subquery(actual), Value(0)))
+    
+    def coverage_histogram(self):
+        """{rating_count: número de imagens} das imagens do queryset"""
+        return dict(self.order_by().values_list('rating_count').annotate(images=Count('id')))
+    
+    def with_actual_rating_count(self):
+        """Anota a contagem real de avaliações (usado para verificar o contador)"""
+        return self.annotate(actual_rating_count=Count('ratings'))
+    
+    def with_actual_reserved_count(self):
+        """Anota a contagem real de reservas ativas (usado para verificar o contador)"""
+        return self.annotate(actual_reserved_count=Count(
+            'reservations', filter=Q(reservations__consumed_at__isnull=True)
+        ))
+
 class FaceImage(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     image = models.ImageField(upload_to=image_upload_path)
     code = models.CharField(max_length=20, unique=True, editable=False)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Mantido pelos sinais de ImageRating (ver signals.py)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    # Chave aleatória persistida usada pelo sorteio de imagens (ver selection_utils.py)
+    random_key = models.FloatField(default=random_sampling_key, editable=False)
+    # Reservas ainda não consumidas, mantido por selection_utils.py e signals.py
+    reserved_count = models.PositiveIntegerField(default=0, editable=False)
+    # Versões redimensionadas geradas por image_utils.py (vazias até ficarem prontas)
+    thumbnail = models.ImageField(blank=True, editable=False)
+    web_image = models.ImageField(blank=True, editable=False)
+    # Caminho de origem na importação em massa (ingest_faces), usado para não importar de novo
+    source_name = models.CharField(max_length=255, blank=True, db_index=True, editable=False)
+    # SHA-256 do arquivo (um único FaceImage por conteúdo) e dHash para quase-duplicatas
+    content_hash = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+    perceptual_hash = models.CharField(max_length=16, blank=True, db_index=True, editable=False)
+    
+    objects = FaceImageQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['rating_count'], name='faceimage_rating_count_idx'),
+            models.Index(fields=['random_key'], name='faceimage_random_key_idx'),
+            # Paginação por chave da galeria de uploads (ver gallery_utils.py)
+            models.Index(fields=['uploaded_at', 'id'], name='faceimage_uploaded_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.code:
-            self.code = f"IMG-{uuid.uuid4().hex[:8].upper()}"
+            self.code = generate_image_code()
+        stale_derivatives = self.clear_stale_derivatives(kwargs)
         super().save(*args, **kwargs)
+        if stale_derivatives:
+            from .image_utils import delete_derivatives
+            transaction.on_commit(lambda: delete_derivatives(stale_derivatives))
     
-    def rating_count(self):
-        """Retorna quantas vezes esta imagem foi avaliada"""
-        return self.ratings.count()
+    def clear_stale_derivatives(self, save_kwargs):
+        """
+        Esvazia thumbnail e web_image quando o arquivo original foi trocado.
+        
+        O build_image_derivatives gera as novas versões depois; retorna os
+        nomes dos arquivos antigos, apagados só depois do commit.
+        """
+        update_fields = save_kwargs.get('update_fields')
+        if self._state.adding or (update_fields is not None and 'image' not in update_fields):
+            return []
+        stored = FaceImage.objects.filter(pk=self.pk).values_list('image', 'thumbnail', 'web_image').first()
+        if stored is None or stored[0] == self.image.name:
+            return []
+        self.thumbnail = ''
+        self.web_image = ''
+        if update_fields is not None:
+            save_kwargs['update_fields'] = {*update_fields, 'thumbnail', 'web_image'}
+        return [name for name in stored[1:] if name]
+    
+    @property
+    def thumbnail_url(self):
+        """URL da miniatura, ou do original enquanto ela não foi gerada"""
+        return self.thumbnail.url if self.thumbnail else self.image.url
+    
+    @property
+    def web_image_url(self):
+        """URL da versão para a página de avaliação, ou do original"""
+        return self.web_image.url if self.web_image else self.image.url
     
     def is_available_for_rating(self, config=None):
         """Verifica se a imagem está disponível para avaliação"""
         if not config:
-            config = StudyConfiguration.objects.filter(is_active=True).first()
-            if not config:
-                config = StudyConfiguration.objects.create()
+            config = get_active_config()
         
-        return self.ratings.count() < config.max_ratings_per_image
+        return self.rating_count < config.max_ratings_per_image
     
     def get_availability_status(self):
         """Retorna status de disponibilidade para o admin"""
-        config = StudyConfiguration.objects.filter(is_active=True).first()
-        if not config:
-            config = StudyConfiguration.objects.create()
+        config = get_active_config()
         
-        count = self.rating_count()
+        count = self.rating_count
         max_allowed = config.max_ratings_per_image
         
         if count >= max_allowed:
@@ -63,6 +195,20 @@ class FaceImage(models.Model):
     def __str__(self):
         return f"{self.code} - {self.image.name}"
     
+class DuplicateSource(models.Model):
+    """
+    Origem do ingest_faces cujo conteúdo já estava em outra imagem.
+
+    Guardada para que uma nova execução pule o arquivo pelo nome, sem lê-lo
+    e calcular o hash de novo.
+    """
+    source_name = models.CharField(max_length=255, unique=True)
+    image = models.ForeignKey(FaceImage, on_delete=models.CASCADE, related_name='duplicate_sources')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.source_name} -> {self.image_id}"
+
 class Participant(models.Model):
     email = models.EmailField(unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -78,7 +224,7 @@ class Participant(models.Model):
         return self.ratings.values('image').distinct().count()
     
     def __str__(self):
-        return f"{self.email} ({self.ratings.count()} ratings)"
+        return self.email
     
 class ImageRating(models.Model):
     participant = models.ForeignKey(Participant, on_delete=models.CASCADE, related_name='ratings')
@@ -89,7 +235,27 @@ class ImageRating(models.Model):
         unique_together = ['participant', 'image']
     
     def __str__(self):
-        return f"{self.participant.email} - {self.image.code}"
+        # Usa os objetos relacionados só se já estiverem carregados (select_related)
+        participant = self.participant.email if ImageRating.participant.is_cached(self) else self.participant_id
+        image = self.image.code if ImageRating.image.is_cached(self) else self.image_id
+        return f"{participant} - {image}"
+
+class ImageReservation(models.Model):
+    """Imagem reservada para uma sessão de avaliação até expires_at"""
+    token = models.UUIDField(db_index=True)  # Identifica a sessão de avaliação
+    participant = models.ForeignKey(Participant, on_delete=models.CASCADE, related_name='reservations')
+    image = models.ForeignKey(FaceImage, on_delete=models.CASCADE, related_name='reservations')
+    position = models.PositiveSmallIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    consumed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['token', 'position']
+        ordering = ['token', 'position']
+    
+    def __str__(self):
+        return f"{self.token} #{self.position}: {self.image_id}"
 
 class EmotionRanking(models.Model):
     rating = models.ForeignKey(ImageRating, on_delete=models.CASCADE, related_name='emotion_rankings')
@@ -106,7 +272,8 @@ class EmotionRanking(models.Model):
         ordering = ['emotion__name']
     
     def __str__(self):
-        return f"{self.emotion.name}: {self.agreement_level}"
+        emotion = self.emotion.name if EmotionRanking.emotion.is_cached(self) else self.emotion_id
+        return f"{emotion}: {self.agreement_level}"
 
 class StudyConfiguration(models.Model):
     min_images_per_session = models.IntegerField(
@@ -140,4 +307,174 @@ class StudyConfiguration(models.Model):
         super().save(*args, **kwargs)
     
     def __str__(self):
-        return f"Config: {self.min_images_per_session}-{self.max_images_per_session} images, max {self.max_ratings_per_image} ratings/image"
\ No newline at end of file
+        return f"Config: {self.min_images_per_session}-{self.max_images_per_session} images, max {self.max_ratings_per_image} ratings/image"
+
+class ExportJob(models.Model):
+    """Exportação CSV executada em segundo plano (ver run_export_jobs)"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    description = models.CharField(max_length=200, blank=True)
+    # Filtro das avaliações: {'rating_ids': [...]}, {'image_ids': [...]}, {'participant_ids': [...]} ou {} (todas)
+    filters = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    file = models.FileField(upload_to='', storage=export_storage, blank=True)
+    # Checkpoint: último id gravado, bytes já confirmados no arquivo e colunas de emoção usadas
+    last_rating_id = models.BigIntegerField(default=0)
+    bytes_written = models.BigIntegerField(default=0)
+    emotion_ids = models.JSONField(default=list, blank=True)
+    rows_written = models.PositiveIntegerField(default=0)
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    rows_per_second = models.FloatField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Renovado a cada checkpoint pelo worker que executa o job
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def ratings_queryset(self):
+        """Avaliações que esta exportação deve incluir"""
+        queryset = ImageRating.objects.all()
+        if 'rating_ids' in self.filters:
+            queryset = queryset.filter(id__in=self.filters['rating_ids'])
+        if 'image_ids' in self.filters:
+            queryset = queryset.filter(image_id__in=self.filters['image_ids'])
+        if 'participant_ids' in self.filters:
+            queryset = queryset.filter(participant_id__in=self.filters['participant_ids'])
+        return queryset
+    
+    def __str__(self):
+        return f"Export #{self.pk} ({self.status}) {self.description}"
+
+class CacheVersion(models.Model):
+    """Versão de um cache em memória dos processos (ver version_utils.py)"""
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+class StudyStats(models.Model):
+    """Totais do estudo mantidos incrementalmente (ver stats_utils.py); uma única linha"""
+    total_participants = models.IntegerField(default=0)
+    recomputed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name_plural = 'Study stats'
+    
+    def __str__(self):
+        return f"Study stats ({self.total_participants} participants)"
+
+class CoverageBucket(models.Model):
+    """
+    Histograma de cobertura: quantas imagens têm exatamente rating_count avaliações.
+
+    Cada faixa é dividida em STATS_SLOTS linhas (slot) somadas na leitura,
+    para que avaliações simultâneas não disputem a mesma linha.
+    """
+    rating_count = models.PositiveIntegerField()
+    slot = models.PositiveSmallIntegerField(default=0)
+    images = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = [['rating_count', 'slot']]
+    
+    def __str__(self):
+        return f"{self.images} image(s) with {self.rating_count} rating(s) (slot {self.slot})"
+
+class HourlyRatingCount(models.Model):
+    """Avaliações criadas em cada hora (UTC), divididas em slots como CoverageBucket"""
+    hour = models.DateTimeField()
+    slot = models.PositiveSmallIntegerField(default=0)
+    ratings = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = [['hour', 'slot']]
+    
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00}: {self.ratings} (slot {self.slot})"
+
+class ImageEmotionAgreement(models.Model):
+    """Média, desvio e entropia das notas de uma emoção numa imagem (ver analytics_utils.py)"""
+    image = models.ForeignKey(FaceImage, on_delete=models.CASCADE, related_name='agreement_stats')
+    emotion = models.ForeignKey(EmotionalState, on_delete=models.CASCADE, related_name='image_agreement_stats')
+    n_ratings = models.PositiveIntegerField()
+    mean = models.FloatField()
+    std = models.FloatField()
+    entropy = models.FloatField()
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ['image', 'emotion']
+        indexes = [
+            models.Index(fields=['emotion', 'std'], name='agreement_emotion_std_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.image_id} / {self.emotion_id}: {self.mean:.2f} ± {self.std:.2f}"
+
+class EmotionReliability(models.Model):
+    """Confiabilidade entre avaliadores de uma emoção (alpha de Krippendorff e ICC)"""
+    emotion = models.OneToOneField(EmotionalState, on_delete=models.CASCADE, related_name='reliability')
+    n_images = models.PositiveIntegerField(help_text="Images with two or more ratings")
+    n_ratings = models.PositiveIntegerField()
+    n_raters = models.PositiveIntegerField()
+    mean_agreement = models.FloatField(null=True)
+    krippendorff_alpha = models.FloatField(null=True)
+    icc = models.FloatField(null=True, verbose_name="ICC(1)")
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        verbose_name_plural = 'Emotion reliability'
+        ordering = ['emotion__name']
+    
+    def __str__(self):
+        return f"{self.emotion_id}: alpha={self.krippendorff_alpha}"
+
+class FaceEmotionSummary(models.Model):
+    """
+    Soma corrente das notas de uma emoção numa imagem (ver summary_utils.py).
+
+    Atualizada na mesma transação das avaliações. Soma e soma dos quadrados
+    ficam em inteiros escalados (centésimos e décimos de milésimo), então
+    somar e desfazer notas não acumula erro de arredondamento.
+    """
+    image = models.ForeignKey(FaceImage, on_delete=models.CASCADE, related_name='emotion_summaries')
+    emotion = models.ForeignKey(EmotionalState, on_delete=models.CASCADE, related_name='image_summaries')
+    count = models.IntegerField(default=0)
+    total = models.BigIntegerField(default=0)
+    total_sq = models.BigIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['image', 'emotion']
+    
+    @property
+    def mean(self):
+        return self.total / self.count / 100 if self.count else None
+    
+    @property
+    def variance(self):
+        """Variância amostral das notas (0 com uma só nota)"""
+        if self.count < 2:
+            return 0.0 if self.count else None
+        return max(self.total_sq - self.total * self.total / self.count, 0) / (self.count - 1) / 10000
+    
+    @property
+    def std(self):
+        variance = self.variance
+        return None if variance is None else variance ** 0.5
+    
+    def __str__(self):
+        return f"{self.image_id} / {self.emotion_id}: n={self.count}"
@@ -0,0 +1,109 @@
+# face_study/rating_utils.py
+from decimal import Decimal, InvalidOperation
+from django.db import connection, transaction
+
+MIN_AGREEMENT = Decimal('0.00')
+MAX_AGREEMENT = Decimal('1.00')
+
+
+def parse_agreement_levels(data, emotions):
+    """
+    Valida de uma vez os níveis de concordância enviados (campos emotion_<id>).
+
+    Valores fora de [0, 1] são limitados ao intervalo e arredondados para
+    duas casas. Campos vazios são ignorados. Retorna (levels, errors), onde
+    levels mapeia emotion_id -> Decimal e errors mapeia o nome do campo para
+    a mensagem de erro.
+    """
+    levels = {}
+    errors = {}
+
+    for emotion in emotions:
+        field_name = f'emotion_{emotion.id}'
+        raw_value = data.get(field_name)
+        if raw_value in (None, ''):
+            continue
+
+        try:
+            value = Decimal(str(raw_value).strip())
+        except InvalidOperation:
+            errors[field_name] = f'{emotion.name}: "{raw_value}" is not a number.'
+            continue
+
+        if not value.is_finite():
+            errors[field_name] = f'{emotion.name}: "{raw_value}" is not a number.'
+            continue
+
+        value = min(max(value, MIN_AGREEMENT), MAX_AGREEMENT)
+        levels[emotion.id] = value.quantize(Decimal('0.01'))
+
+    return levels, errors
+
+
+def save_rating(participant, image, levels):
+    """
+    Grava a avaliação do participante e todos os rankings em uma escrita em lote.
+
+    Numa avaliação nova os rankings vão em um único bulk_create; numa edição
+    é feito um upsert pelo par único (rating, emotion) e só são removidas as
+    emoções que deixaram de ser enviadas. Os resumos FaceEmotionSummary da
+    imagem recebem a diferença na mesma transação; edições da mesma
+    avaliação são serializadas pela trava da linha. Retorna (rating, created).
+    """
+    from .models import ImageRating, EmotionRanking
+    from .summary_utils import add_summary_deltas, rating_summary_deltas
+
+    with transaction.atomic():
+        rating, created = ImageRating.objects.get_or_create(
+            participant=participant,
+            image=image,
+        )
+        rankings = [
+            EmotionRanking(rating=rating, emotion_id=emotion_id, agreement_level=level)
+            for emotion_id, level in levels.items()
+        ]
+
+        if created:
+            old_levels = {}
+            EmotionRanking.objects.bulk_create(rankings)
+        else:
+            # Duas edições simultâneas (clique duplo, página e API) aplicariam o
+            # mesmo old -> new nos resumos: a linha da avaliação fica travada
+            # até o fim da transação, e os níveis antigos vêm de uma leitura
+            # com trava (no MySQL uma leitura simples usaria o snapshot antigo)
+            ImageRating.objects.select_for_update().values_list('pk', flat=True).get(pk=rating.pk)
+            old_levels = dict(
+                rating.emotion_rankings.select_for_update().values_list('emotion_id', 'agreement_level')
+            )
+            rating.emotion_rankings.exclude(emotion_id__in=list(levels)).delete()
+            # MySQL faz ON DUPLICATE KEY UPDATE sem indicar as colunas únicas
+            unique_fields = (
+                ['rating', 'emotion']
+                if connection.features.supports_update_conflicts_with_target
+                else None
+            )
+            EmotionRanking.objects.bulk_create(
+                rankings,
+                update_conflicts=True,
+                update_fields=['agreement_level'],
+                unique_fields=unique_fields,
+            )
+
+        add_summary_deltas(image.pk, rating_summary_deltas(old_levels, levels))
+
+    return rating, created
+
+
+def submit_rating(participant, image, data, emotions):
+    """
+    Valida e grava uma submissão da página de avaliação.
+
+    Retorna (rating, errors). Se houver qualquer erro nada é gravado e
+    rating é None.
+    """
+    levels, errors = parse_agreement_levels(data, emotions)
+    if errors:
+        return None, errors
+
+    rating, _ = save_rating(participant, image, levels)
+    return rating, {}
@@ -0,0 +1,196 @@
+# face_study/selection_utils.py
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.db.models.functions import Random
+from django.utils import timezone
+
+
+def sample_image_ids(queryset, count):
+    """
+    Sorteia até `count` ids do queryset usando a chave aleatória indexada.
+
+    Em vez de ORDER BY RAND(), escolhe um ponto aleatório e percorre o índice
+    de random_key a partir dele; se faltarem imagens, dá a volta e continua
+    do início até o ponto. Cada consulta é uma leitura no índice.
+    """
+    from .models import random_sampling_key
+
+    pivot = random_sampling_key()
+    ids = list(
+        queryset.filter(random_key__gte=pivot).order_by('random_key').values_list('id', flat=True)[:count]
+    )
+    if len(ids) < count:
+        ids += list(
+            queryset.filter(random_key__lt=pivot).order_by('random_key').values_list('id', flat=True)[:count - len(ids)]
+        )
+    return ids
+
+
+def sample_image(queryset):
+    """Sorteia uma única imagem do queryset (mesma estratégia de sample_image_ids)"""
+    from .models import random_sampling_key
+
+    pivot = random_sampling_key()
+    image = queryset.filter(random_key__gte=pivot).order_by('random_key').first()
+    if image is None:
+        image = queryset.filter(random_key__lt=pivot).order_by('random_key').first()
+    return image
+
+
+def reroll_random_key(image):
+    """Sorteia uma nova chave depois da atribuição para espalhar os próximos sorteios"""
+    from .models import FaceImage, random_sampling_key
+
+    image.random_key = random_sampling_key()
+    FaceImage.objects.filter(pk=image.pk).update(random_key=image.random_key)
+
+
+def candidate_images(participant, config, exclude_ids=()):
+    """
+    Imagens elegíveis para o participante:
+    1. Ainda não atingiram o limite máximo de avaliações
+    2. Não foram avaliadas pelo participante (em qualquer sessão)
+    3. Não estão em exclude_ids (ex.: imagens já avaliadas nesta sessão)
+    """
+    from .models import FaceImage, ImageRating
+
+    already_rated = ImageRating.objects.filter(
+        participant=participant,
+        image=OuterRef('pk'),
+    )
+    queryset = FaceImage.objects.available(
+        config.max_ratings_per_image
+    ).exclude(Exists(already_rated))
+
+    if exclude_ids:
+        queryset = queryset.exclude(id__in=[uuid.UUID(str(image_id)) for image_id in exclude_ids])
+    return queryset
+
+
+def select_next_image(participant, config, exclude_ids=()):
+    """
+    Escolhe a próxima imagem para o participante e renova sua chave aleatória.
+
+    Usada quando a sessão não tem reservas válidas: como em reserve_images,
+    só entram imagens com vaga contando as reservas ativas de outras sessões.
+    """
+    image = sample_image(
+        candidate_images(participant, config, exclude_ids).with_open_slots(config.max_ratings_per_image)
+    )
+    if image is not None:
+        reroll_random_key(image)
+    return image
+
+
+def reserve_images(participant, config, count):
+    """
+    Reserva de uma vez as imagens de uma sessão de avaliação.
+
+    As imagens sorteadas são travadas (SELECT ... FOR UPDATE) e só recebem a
+    reserva se ainda tiverem vaga contando avaliações e reservas ativas, o
+    que evita que participantes simultâneos passem do limite por imagem.
+    Retorna o token da sessão e a lista de ids reservados, na ordem.
+    """
+    from .models import FaceImage, ImageReservation
+
+    max_ratings = config.max_ratings_per_image
+    token = uuid.uuid4()
+    expires_at = timezone.now() + timedelta(seconds=settings.STUDY_RESERVATION_TTL)
+
+    with transaction.atomic():
+        sampled = sample_image_ids(
+            candidate_images(participant, config).with_open_slots(max_ratings), count
+        )
+        locked = set(
+            FaceImage.objects.select_for_update().filter(
+                id__in=sampled
+            ).with_open_slots(max_ratings).values_list('id', flat=True)
+        )
+        reserved = [image_id for image_id in sampled if image_id in locked]
+
+        FaceImage.objects.filter(id__in=reserved).update(
+            reserved_count=F('reserved_count') + 1,
+            random_key=Random(),
+        )
+        ImageReservation.objects.bulk_create([
+            ImageReservation(
+                token=token,
+                participant=participant,
+                image_id=image_id,
+                position=position,
+                expires_at=expires_at,
+            )
+            for position, image_id in enumerate(reserved)
+        ])
+
+    return token, reserved
+
+
+def rating_slot_available(participant, image, config, token=None):
+    """
+    True se o participante pode gravar agora uma nota para a imagem.
+
+    Vale a edição de uma nota já dada, a reserva não consumida da sessão
+    (token) ou uma vaga livre, contando as avaliações e as reservas ativas
+    como em reserve_images. Deve rodar dentro da transação que grava a nota:
+    a reserva ou a imagem ficam travadas (SELECT ... FOR UPDATE) até o fim
+    dela, para que duas notas simultâneas não ocupem a mesma vaga.
+    """
+    from .models import FaceImage, ImageRating, ImageReservation
+
+    if ImageRating.objects.filter(participant=participant, image=image).exists():
+        return True
+    # Uma reserva vencida pode já ter tido a vaga repassada (release_expired_reservations)
+    if token and ImageReservation.objects.select_for_update().filter(
+        token=token, image=image, consumed_at__isnull=True, expires_at__gt=timezone.now()
+    ).exists():
+        return True
+    return FaceImage.objects.select_for_update().filter(pk=image.pk).with_open_slots(
+        config.max_ratings_per_image
+    ).exists()
+
+
+def consume_reservation(token, image):
+    """
+    Marca a reserva como usada; a vaga passa a contar em rating_count.
+
+    Retorna a posição da imagem na sessão (também num reenvio, com a reserva
+    já consumida) ou None se ela não está entre as reservas do token.
+    """
+    from .models import FaceImage, ImageReservation
+
+    position = ImageReservation.objects.filter(
+        token=token, image=image
+    ).values_list('position', flat=True).first()
+    if position is None:
+        return None
+
+    consumed = ImageReservation.objects.filter(
+        token=token, position=position, consumed_at__isnull=True
+    ).update(consumed_at=timezone.now())
+    if consumed:
+        FaceImage.objects.filter(pk=image.pk, reserved_count__gt=0).update(
+            reserved_count=F('reserved_count') - 1
+        )
+    return position
+
+
+def release_reservations(token):
+    """Remove as reservas de uma sessão encerrada (as não consumidas liberam a vaga)"""
+    from .models import ImageReservation
+
+    deleted, _ = ImageReservation.objects.filter(token=token).delete()
+    return deleted
+
+
+def release_expired_reservations(now=None):
+    """Remove reservas vencidas, liberando as vagas de sessões abandonadas"""
+    from .models import ImageReservation
+
+    deleted, _ = ImageReservation.objects.filter(
+        expires_at__lte=now or timezone.now()
+    ).delete()
+    return deleted
@@ -0,0 +1,309 @@
+# face_study/session_utils.py
+import random
+import uuid
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+# O estado da sessão de avaliação fica num cookie assinado (StudyState),
+# não em django_session: avaliar uma imagem só troca o cookie da resposta.
+# As funções com prefixo "a" são as versões para as views async; o que
+# depende de transaction.atomic ou SELECT ... FOR UPDATE (reserva e
+# gravação da nota) roda inteiro numa thread com sync_to_async, porque
+# transações não podem atravessar awaits.
+
+STUDY_STATE_SALT = 'face_study.session_utils.StudyState'
+
+# Linhas de django_session apagadas por DELETE ao purgar sessões vencidas
+SESSION_PURGE_CHUNK_SIZE = 1000
+
+
+class StudyState:
+    """
+    Estado de uma sessão de avaliação, compactado em inteiros.
+
+    Participante, token das reservas, tamanho da sessão e limites sorteados,
+    mais as posições reservadas já avaliadas como um bitmap (bit i = imagem
+    da posição i) e quantas imagens fora das reservas foram avaliadas.
+    Reenviar a nota de uma imagem reservada não conta de novo.
+    """
+
+    def __init__(self, participant_id, token, image_count, min_images, max_images,
+                 rated_positions=0, extra_rated=0, active=True):
+        self.participant_id = participant_id
+        self.token = token
+        self.image_count = image_count
+        self.min_images = min_images
+        self.max_images = max_images
+        self.rated_positions = rated_positions
+        self.extra_rated = extra_rated
+        self.active = active
+        self.modified = False
+
+    @classmethod
+    def start(cls, participant, config, token, reserved):
+        return cls(
+            participant.id, token, len(reserved),
+            config.min_images_per_session, config.max_images_per_session,
+        )
+
+    def pack(self):
+        return signing.dumps([
+            self.participant_id, self.token.hex, self.image_count, self.min_images, self.max_images,
+            self.rated_positions, self.extra_rated, int(self.active),
+        ], salt=STUDY_STATE_SALT, compress=True)
+
+    @classmethod
+    def unpack(cls, value):
+        """Estado de um cookie, ou None se ele faltar, for inválido ou tiver vencido"""
+        if not value:
+            return None
+        try:
+            fields = signing.loads(value, salt=STUDY_STATE_SALT, max_age=settings.STUDY_RESERVATION_TTL)
+            participant_id, token, image_count, min_images, max_images, rated_positions, extra_rated, active = fields
+            return cls(
+                participant_id, uuid.UUID(token), image_count, min_images, max_images,
+                rated_positions, extra_rated, bool(active),
+            )
+        except (signing.BadSignature, TypeError, ValueError):
+            return None
+
+    @property
+    def rated(self):
+        return bin(self.rated_positions).count('1') + self.extra_rated
+
+    @property
+    def complete(self):
+        return self.rated >= self.image_count
+
+    def mark_rated(self, position=None):
+        """Registra uma imagem avaliada (posição reservada ou None); retorna True se a sessão terminou"""
+        if position is None:
+            self.extra_rated += 1
+        else:
+            self.rated_positions |= 1 << position
+        self.modified = True
+        if self.complete:
+            self.end()
+        return not self.active
+
+    def end(self):
+        self.active = False
+        self.modified = True
+
+
+class StudyStateMiddleware(MiddlewareMixin):
+    """
+    Lê request.study_state do cookie e, se ele mudou, grava (ou apaga) o cookie na resposta.
+
+    As views trocam request.study_state para iniciar (StudyState) ou
+    encerrar (None) uma sessão e alteram o objeto durante a sessão.
+    """
+
+    def process_request(self, request):
+        request._study_state_cookie = request.COOKIES.get(settings.STUDY_STATE_COOKIE_NAME)
+        request._loaded_study_state = StudyState.unpack(request._study_state_cookie)
+        request.study_state = request._loaded_study_state
+
+    def process_response(self, request, response):
+        if not hasattr(request, '_loaded_study_state'):
+            return response
+        state = request.study_state
+        if state is None:
+            if request._study_state_cookie:
+                response.delete_cookie(
+                    settings.STUDY_STATE_COOKIE_NAME, path=settings.SESSION_COOKIE_PATH,
+                    domain=settings.SESSION_COOKIE_DOMAIN, samesite=settings.SESSION_COOKIE_SAMESITE,
+                )
+        elif state is not request._loaded_study_state or state.modified:
+            response.set_cookie(
+                settings.STUDY_STATE_COOKIE_NAME, state.pack(),
+                max_age=settings.STUDY_RESERVATION_TTL,
+                path=settings.SESSION_COOKIE_PATH,
+                domain=settings.SESSION_COOKIE_DOMAIN,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+            )
+        if request._study_state_cookie or state is not None:
+            patch_vary_headers(response, ('Cookie',))
+        return response
+
+
+def reserve_session_images(participant, config):
+    """Sorteia o tamanho da sessão e reserva as imagens; retorna (token, ids reservados)"""
+    from .selection_utils import reserve_images
+
+    images_for_this_session = random.randint(
+        config.min_images_per_session,
+        config.max_images_per_session
+    )
+    return reserve_images(participant, config, images_for_this_session)
+
+
+def start_study_session(request, participant, config):
+    """
+    Sorteia o tamanho da sessão, reserva as imagens e inicia o estado da sessão.
+
+    Compartilhado pela página start_session e pela API JSON. Uma sessão
+    anterior ainda aberta é encerrada (suas reservas são liberadas). Retorna
+    a lista de ids reservados.
+    """
+    end_study_session(request)
+    token, reserved = reserve_session_images(participant, config)
+    request.study_state = StudyState.start(participant, config, token, reserved)
+    return reserved
+
+
+async def astart_study_session(request, participant, config):
+    await aend_study_session(request)
+    token, reserved = await sync_to_async(reserve_session_images)(participant, config)
+    request.study_state = StudyState.start(participant, config, token, reserved)
+    return reserved
+
+
+def end_study_session(request):
+    """Libera as reservas da sessão (as não consumidas voltam a ter vaga) e descarta o estado"""
+    from .selection_utils import release_reservations
+
+    state = request.study_state
+    if state is not None:
+        release_reservations(state.token)
+    request.study_state = None
+
+
+async def aend_study_session(request):
+    from .selection_utils import release_reservations
+
+    state = request.study_state
+    if state is not None:
+        await sync_to_async(release_reservations)(state.token)
+    request.study_state = None
+
+
+def active_state(request):
+    state = request.study_state
+    return state if state is not None and state.active else None
+
+
+def get_session_participant(request):
+    """Participante da sessão ativa, ou None se não houver sessão válida"""
+    from .models import Participant
+
+    state = active_state(request)
+    if state is None:
+        return None
+    return Participant.objects.filter(id=state.participant_id).first()
+
+
+async def aget_session_participant(request):
+    from .models import Participant
+
+    state = active_state(request)
+    if state is None:
+        return None
+    return await Participant.objects.filter(id=state.participant_id).afirst()
+
+
+def session_progress(state):
+    """Quantas imagens já foram avaliadas nesta sessão e quantas faltam"""
+    rated = state.rated
+    total = state.image_count
+    return {
+        'rated': rated,
+        'total': total,
+        'current': min(rated + 1, total),
+        'remaining': max(total - rated, 0),
+        'complete': rated >= total,
+    }
+
+
+def upcoming_reservations(token, limit=2):
+    from .models import ImageReservation
+
+    return ImageReservation.objects.select_related('image').filter(
+        token=token,
+        consumed_at__isnull=True,
+        expires_at__gt=timezone.now(),
+    ).order_by('position')[:limit]
+
+
+def upcoming_reserved_images(token, limit=2):
+    """As próximas imagens reservadas e não avaliadas da sessão, em ordem (uma consulta)"""
+    return [reservation.image for reservation in upcoming_reservations(token, limit)]
+
+
+async def aupcoming_reserved_images(token, limit=2):
+    return [reservation.image async for reservation in upcoming_reservations(token, limit)]
+
+
+def session_images(state, participant, config):
+    """
+    (imagem atual, imagem seguinte) da sessão.
+
+    A seguinte vem das reservas e é enviada ao cliente para ser pré-carregada;
+    sem reservas válidas a atual é sorteada entre as disponíveis (que já
+    excluem as avaliadas pelo participante) e não há seguinte conhecida.
+    """
+    from .selection_utils import select_next_image
+
+    upcoming = upcoming_reserved_images(state.token)
+    if upcoming:
+        return upcoming[0], upcoming[1] if len(upcoming) > 1 else None
+    return select_next_image(participant, config), None
+
+
+async def asession_images(state, participant, config):
+    from .selection_utils import select_next_image
+
+    upcoming = await aupcoming_reserved_images(state.token)
+    if upcoming:
+        return upcoming[0], upcoming[1] if len(upcoming) > 1 else None
+    return await sync_to_async(select_next_image)(participant, config), None
+
+
+def submit_session_rating(participant, image, data, emotions, reservation_token=None):
+    """
+    Grava a nota e consome a reserva da imagem numa única transação.
+
+    Só são aceitas notas para uma imagem reservada pela sessão, para uma
+    imagem que ainda tem vaga ou para uma já avaliada pelo participante
+    (edição); qualquer outro image_id é recusado como erro de image_id.
+    Retorna (rating, errors, position): o resultado de submit_rating e a
+    posição da imagem nas reservas da sessão (None fora delas). Com erros
+    nada é gravado.
+    """
+    from .config_utils import get_active_config
+    from .rating_utils import submit_rating
+    from .selection_utils import consume_reservation, rating_slot_available
+
+    position = None
+    with transaction.atomic():
+        if not rating_slot_available(participant, image, get_active_config(), reservation_token):
+            return None, {'image_id': 'This image is not available for rating in this session.'}, None
+        rating, errors = submit_rating(participant, image, data, emotions)
+        if rating and reservation_token:
+            position = consume_reservation(reservation_token, image)
+    return rating, errors, position
+
+
+def purge_expired_sessions(now=None, chunk_size=SESSION_PURGE_CHUNK_SIZE):
+    """
+    Apaga as linhas vencidas de django_session em lotes, um DELETE por lote.
+
+    O clearsessions do Django apaga tudo num único DELETE, que numa tabela
+    grande segura o bloqueio por muito tempo. Retorna quantas linhas saíram.
+    """
+    from django.contrib.sessions.models import Session
+
+    expired = Session.objects.filter(expire_date__lt=now or timezone.now())
+    purged = 0
+    while True:
+        keys = list(expired.order_by('session_key').values_list('session_key', flat=True)[:chunk_size])
+        if not keys:
+            return purged
+        purged += Session.objects.filter(session_key__in=keys).delete()[0]
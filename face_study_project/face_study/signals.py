@@ -0,0 +1,89 @@
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from .catalog_utils import bump_catalog_version
+from .config_utils import invalidate_active_config
+from .models import EmotionalState, FaceImage, ImageRating, ImageReservation, Participant, StudyConfiguration
+from .stats_utils import move_coverage, record_participants_change, record_rating_change
+from .summary_utils import subtract_rankings
+
+
+def current_rating_count(image_id):
+    # Lido depois do UPDATE, com a linha da imagem ainda bloqueada pela transação
+    return FaceImage.objects.filter(pk=image_id).values_list('rating_count', flat=True).first()
+
+
+@receiver(post_save, sender=ImageRating)
+def increment_image_rating_count(sender, instance, created, **kwargs):
+    """Incrementa o contador da imagem e o StudyStats na mesma transação da avaliação"""
+    if created:
+        updated = FaceImage.objects.filter(pk=instance.image_id).update(
+            rating_count=F('rating_count') + 1
+        )
+        record_rating_change(instance, 1, current_rating_count(instance.image_id) if updated else None)
+
+
+@receiver(post_delete, sender=ImageRating)
+def decrement_image_rating_count(sender, instance, **kwargs):
+    """Decrementa o contador (inclui deletes em massa e cascatas)"""
+    updated = FaceImage.objects.filter(pk=instance.image_id, rating_count__gt=0).update(
+        rating_count=F('rating_count') - 1
+    )
+    record_rating_change(instance, -1, current_rating_count(instance.image_id) if updated else None)
+
+
+@receiver(pre_delete, sender=ImageRating)
+def subtract_rating_from_summaries(sender, instance, **kwargs):
+    """Tira os rankings da avaliação dos resumos antes que a cascata os apague"""
+    subtract_rankings(instance.emotion_rankings.all())
+
+
+@receiver(post_save, sender=FaceImage)
+def add_image_to_coverage(sender, instance, created, **kwargs):
+    if created:
+        move_coverage(None, instance.rating_count)
+
+
+@receiver(post_delete, sender=FaceImage)
+def remove_image_from_coverage(sender, instance, **kwargs):
+    """
+    Tira a imagem do histograma de cobertura.
+
+    A cascata apaga as avaliações antes da imagem e os sinais acima já a
+    levaram para a faixa zero; instance.rating_count é o valor de antes.
+    """
+    move_coverage(0, None)
+
+
+@receiver(post_save, sender=Participant)
+def add_participant_to_stats(sender, instance, created, **kwargs):
+    if created:
+        record_participants_change(1)
+
+
+@receiver(post_delete, sender=Participant)
+def remove_participant_from_stats(sender, instance, **kwargs):
+    record_participants_change(-1)
+
+
+@receiver(post_delete, sender=ImageReservation)
+def release_image_reservation(sender, instance, **kwargs):
+    """Libera a vaga de uma reserva removida antes de ser consumida"""
+    if instance.consumed_at is None:
+        FaceImage.objects.filter(pk=instance.image_id, reserved_count__gt=0).update(
+            reserved_count=F('reserved_count') - 1
+        )
+
+
+@receiver(post_save, sender=StudyConfiguration)
+@receiver(post_delete, sender=StudyConfiguration)
+def invalidate_study_configuration(sender, **kwargs):
+    """Qualquer alteração de configuração invalida o cache da configuração ativa"""
+    invalidate_active_config()
+
+
+@receiver(post_save, sender=EmotionalState)
+@receiver(post_delete, sender=EmotionalState)
+def invalidate_emotion_catalog(sender, **kwargs):
+    """Qualquer alteração de emoção gera uma nova versão do catálogo"""
+    bump_catalog_version()
@@ -0,0 +1,191 @@
+# face_study/stats_utils.py
+import random
+from datetime import timedelta, timezone as dt_timezone
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+STATS_PK = 1
+
+# Horas exibidas no gráfico de avaliações por hora
+STATS_HOURLY_WINDOW = 48
+
+# Linhas por INSERT ao recalcular o histograma por hora
+STATS_BATCH_SIZE = 1000
+
+# Linhas (slots) por faixa de cobertura e por hora: cada avaliação soma num
+# slot sorteado e a leitura soma os slots, então avaliações simultâneas quase
+# nunca esperam pela trava da mesma linha
+STATS_SLOTS = 16
+
+
+def rating_hour(created_at):
+    """Hora (UTC) em que a avaliação entra no histograma por hora"""
+    return created_at.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def rating_hour_histogram(ratings):
+    """{hora: avaliações} de um queryset de ImageRating, agrupado no banco"""
+    return dict(
+        ratings.order_by()
+        .annotate(hour=TruncHour('created_at', tzinfo=dt_timezone.utc))
+        .values_list('hour')
+        .annotate(total=Count('id'))
+    )
+
+
+def _add(model, lookup, field, delta):
+    """
+    Soma delta ao contador da linha de `lookup` com UPDATE ... F(), criando-a se preciso.
+
+    Só a linha afetada fica bloqueada até o fim da transação, então avaliações
+    de imagens com contagens diferentes não disputam o mesmo registro.
+    """
+    if not delta:
+        return
+    if model.objects.filter(**lookup).update(**{field: F(field) + delta}):
+        return
+    model.objects.bulk_create([model(**lookup)], ignore_conflicts=True)
+    model.objects.filter(**lookup).update(**{field: F(field) + delta})
+
+
+def _add_to_slot(model, lookup, field, delta):
+    """_add numa das STATS_SLOTS linhas de `lookup`, sorteada"""
+    _add(model, {**lookup, 'slot': random.randrange(STATS_SLOTS)}, field, delta)
+
+
+def move_coverage(old_count, new_count, images=1):
+    """Move imagens de uma faixa do histograma de cobertura para outra"""
+    from .models import CoverageBucket
+
+    if old_count == new_count:
+        return
+    # Faixas sempre atualizadas em ordem crescente: avaliações criadas e
+    # removidas ao mesmo tempo bloqueiam as linhas na mesma ordem (sem deadlock)
+    changes = {old_count: -images, new_count: images}
+    for rating_count in sorted(key for key in changes if key is not None):
+        _add_to_slot(CoverageBucket, {'rating_count': rating_count}, 'images', changes[rating_count])
+
+
+def record_coverage_change(before, after):
+    """Aplica a diferença entre dois histogramas {rating_count: imagens}"""
+    from .models import CoverageBucket
+
+    for rating_count in sorted(set(before) | set(after)):
+        _add_to_slot(
+            CoverageBucket, {'rating_count': rating_count}, 'images',
+            after.get(rating_count, 0) - before.get(rating_count, 0),
+        )
+
+
+def record_hourly_change(histogram, sign=1):
+    """Soma (ou subtrai, com sign=-1) um histograma {hora: avaliações}"""
+    from .models import HourlyRatingCount
+
+    for hour, total in sorted(histogram.items()):
+        _add_to_slot(HourlyRatingCount, {'hour': hour}, 'ratings', sign * total)
+
+
+def record_rating_change(rating, delta, image_count=None):
+    """
+    Uma avaliação criada (delta=1) ou removida (delta=-1).
+
+    image_count é o rating_count da imagem já atualizado, ou None se o
+    contador da imagem não mudou (imagem inexistente ou já zerada).
+    """
+    from .models import HourlyRatingCount
+
+    if image_count is not None:
+        move_coverage(image_count - delta, image_count)
+    _add_to_slot(HourlyRatingCount, {'hour': rating_hour(rating.created_at)}, 'ratings', delta)
+
+
+def record_images_added(count):
+    """Imagens novas entram na faixa de zero avaliações"""
+    move_coverage(None, 0, count)
+
+
+def record_participants_change(delta):
+    from .models import StudyStats
+
+    _add(StudyStats, {'pk': STATS_PK}, 'total_participants', delta)
+
+
+def recompute_study_stats():
+    """
+    Recalcula todo o snapshot a partir das tabelas.
+
+    Usado pelo comando recompute_study_stats para corrigir desvios (por
+    exemplo após alterações feitas direto no banco).
+    """
+    from .models import CoverageBucket, FaceImage, HourlyRatingCount, ImageRating, Participant, StudyStats
+
+    with transaction.atomic():
+        CoverageBucket.objects.all().delete()
+        CoverageBucket.objects.bulk_create([
+            CoverageBucket(rating_count=rating_count, images=images)
+            for rating_count, images in FaceImage.objects.coverage_histogram().items()
+        ])
+
+        HourlyRatingCount.objects.all().delete()
+        HourlyRatingCount.objects.bulk_create([
+            HourlyRatingCount(hour=hour, ratings=total)
+            for hour, total in rating_hour_histogram(ImageRating.objects.all()).items()
+        ], batch_size=STATS_BATCH_SIZE)
+
+        StudyStats.objects.update_or_create(pk=STATS_PK, defaults={
+            'total_participants': Participant.objects.count(),
+            'recomputed_at': timezone.now(),
+        })
+
+
+def get_study_stats():
+    """
+    Snapshot do estudo para o dashboard e a exportação.
+
+    Lê só as linhas de StudyStats, o histograma de cobertura (STATS_SLOTS
+    linhas por contagem possível) e as últimas horas: o custo não depende do
+    tamanho das tabelas de imagens e avaliações.
+    """
+    from .catalog_utils import get_emotion_catalog
+    from .config_utils import get_active_config
+    from .models import CoverageBucket, HourlyRatingCount, StudyStats
+
+    stats = StudyStats.objects.filter(pk=STATS_PK).first()
+    coverage = dict(
+        CoverageBucket.objects.order_by().values_list('rating_count').annotate(
+            total=Sum('images')
+        ).filter(total__gt=0)
+    )
+    since = rating_hour(timezone.now()) - timedelta(hours=STATS_HOURLY_WINDOW - 1)
+    hourly = list(
+        HourlyRatingCount.objects.filter(hour__gte=since).order_by('hour').values_list('hour').annotate(
+            total=Sum('ratings')
+        ).filter(total__gt=0)
+    )
+
+    max_ratings = get_active_config().max_ratings_per_image
+    total_images = sum(coverage.values())
+    rated_images = total_images - coverage.get(0, 0)
+    full_images = sum(images for rating_count, images in coverage.items() if rating_count >= max_ratings)
+    total_ratings = sum(rating_count * images for rating_count, images in coverage.items())
+    total_participants = stats.total_participants if stats else 0
+
+    return {
+        'total_images': total_images,
+        'rated_images': rated_images,
+        'full_images': full_images,
+        'pending_images': total_images - rated_images,
+        'total_ratings': total_ratings,
+        'total_participants': total_participants,
+        'emotional_states': len(get_emotion_catalog().emotions),
+        'coverage_percent': 100 * rated_images / total_images if total_images else 0,
+        'ratings_per_participant': total_ratings / total_participants if total_participants else 0,
+        'coverage': [
+            {'rating_count': rating_count, 'images': images}
+            for rating_count, images in sorted(coverage.items())
+        ],
+        'hourly': [{'hour': hour, 'ratings': ratings} for hour, ratings in hourly],
+        'recomputed_at': stats.recomputed_at if stats else None,
+    }
@@ -0,0 +1,159 @@
+# face_study/summary_utils.py
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Sum
+
+# Os níveis têm duas casas decimais: somas guardadas em centésimos (e os
+# quadrados em décimos de milésimo) são inteiras e não acumulam erro
+LEVEL_SCALE = 100
+
+# Resumos gravados por INSERT ao recalcular
+SUMMARY_REBUILD_BATCH_SIZE = 1000
+
+
+def scaled_level(level):
+    """Nível de concordância (Decimal 0.00-1.00) em centésimos"""
+    return int((Decimal(level) * LEVEL_SCALE).to_integral_value())
+
+
+def level_delta(level, sign=1):
+    """(n, soma, soma dos quadrados) de um nível, para somar ou subtrair"""
+    value = scaled_level(level)
+    return sign, sign * value, sign * value * value
+
+
+def add_summary_deltas(image_id, deltas):
+    """
+    Aplica deltas {emotion_id: (n, soma, soma dos quadrados)} aos resumos de uma imagem.
+
+    UPDATE ... F() por (imagem, emoção), em ordem de emoção para que
+    transações concorrentes bloqueiem as linhas na mesma ordem. A linha só
+    é criada quando o delta acrescenta notas: uma remoção nunca recria o
+    resumo de uma imagem que está sendo apagada.
+    """
+    from .models import FaceEmotionSummary
+
+    for emotion_id in sorted(deltas):
+        count, total, total_sq = deltas[emotion_id]
+        if not (count or total or total_sq):
+            continue
+        changes = {
+            'count': F('count') + count,
+            'total': F('total') + total,
+            'total_sq': F('total_sq') + total_sq,
+        }
+        summary = FaceEmotionSummary.objects.filter(image_id=image_id, emotion_id=emotion_id)
+        if summary.update(**changes) or count <= 0:
+            continue
+        FaceEmotionSummary.objects.bulk_create(
+            [FaceEmotionSummary(image_id=image_id, emotion_id=emotion_id)], ignore_conflicts=True
+        )
+        summary.update(**changes)
+
+
+def rating_summary_deltas(old_levels, new_levels):
+    """
+    Deltas por emoção ao trocar os níveis de uma avaliação.
+
+    old_levels e new_levels mapeiam emotion_id -> nível; {} representa uma
+    avaliação nova (old) ou apagada (new).
+    """
+    deltas = {}
+    for emotion_id in set(old_levels) | set(new_levels):
+        old = old_levels.get(emotion_id)
+        new = new_levels.get(emotion_id)
+        if old is not None and new is not None and scaled_level(old) == scaled_level(new):
+            continue
+        count = total = total_sq = 0
+        if old is not None:
+            count, total, total_sq = level_delta(old, -1)
+        if new is not None:
+            added = level_delta(new)
+            count, total, total_sq = count + added[0], total + added[1], total_sq + added[2]
+        deltas[emotion_id] = (count, total, total_sq)
+    return deltas
+
+
+def summed_levels(rankings):
+    """
+    Agrupa rankings por (imagem, emoção) com contagem, soma e soma dos quadrados.
+
+    Somas como float: a soma dos quadrados em DecimalField seria arredondada
+    para duas casas no SQLite. Os valores voltam a inteiros escalados com round().
+    """
+    squared = ExpressionWrapper(F('agreement_level') * F('agreement_level'), output_field=FloatField())
+    return rankings.order_by().values('rating__image_id', 'emotion_id').annotate(
+        levels=Count('id'),
+        levels_total=Sum('agreement_level', output_field=FloatField()),
+        levels_total_sq=Sum(squared, output_field=FloatField()),
+    )
+
+
+def scaled_sums(row):
+    """(n, soma, soma dos quadrados) escalados de uma linha de summed_levels"""
+    return (
+        row['levels'],
+        int(round(row['levels_total'] * LEVEL_SCALE)),
+        int(round(row['levels_total_sq'] * LEVEL_SCALE * LEVEL_SCALE)),
+    )
+
+
+def subtract_rankings(rankings):
+    """
+    Tira dos resumos um queryset de EmotionRanking que vai ser apagado.
+
+    Agrupa no banco por (imagem, emoção): uma consulta e um UPDATE por
+    grupo, qualquer que seja o número de rankings.
+    """
+    by_image = defaultdict(dict)
+    for row in summed_levels(rankings):
+        count, total, total_sq = scaled_sums(row)
+        by_image[row['rating__image_id']][row['emotion_id']] = (-count, -total, -total_sq)
+    for image_id in sorted(by_image):
+        add_summary_deltas(image_id, by_image[image_id])
+
+
+def rebuild_face_emotion_summaries(images=None):
+    """
+    Recalcula os resumos das imagens do queryset (ou de todas) a partir dos rankings.
+
+    Usado depois de operações que mudam rankings de imagem (junção de
+    duplicatas), por edições diretas no admin e pelo comando de verificação.
+    """
+    from .models import EmotionRanking, FaceEmotionSummary
+
+    rankings = EmotionRanking.objects.all()
+    summaries = FaceEmotionSummary.objects.all()
+    if images is not None:
+        rankings = rankings.filter(rating__image__in=images)
+        summaries = summaries.filter(image__in=images)
+
+    with transaction.atomic():
+        summaries.delete()
+        # Gravados em lotes durante a leitura: só um lote de objetos em memória
+        rows = []
+        for row in summed_levels(rankings).iterator(chunk_size=SUMMARY_REBUILD_BATCH_SIZE):
+            count, total, total_sq = scaled_sums(row)
+            rows.append(FaceEmotionSummary(
+                image_id=row['rating__image_id'], emotion_id=row['emotion_id'],
+                count=count, total=total, total_sq=total_sq,
+            ))
+            if len(rows) >= SUMMARY_REBUILD_BATCH_SIZE:
+                FaceEmotionSummary.objects.bulk_create(rows)
+                rows = []
+        FaceEmotionSummary.objects.bulk_create(rows)
+
+
+def get_consensus(image):
+    """Consenso de uma imagem: [{emotion, count, mean, std}] lido só dos resumos"""
+    summaries = image.emotion_summaries.select_related('emotion').filter(count__gt=0)
+    return [
+        {
+            'emotion': summary.emotion.name,
+            'count': summary.count,
+            'mean': summary.mean,
+            'std': summary.std,
+        }
+        for summary in summaries
+    ]
@@ -1,3 +1,1361 @@
-from django.test import TestCase
+import csv
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import uuid
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipIf
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from .analytics_utils import compute_agreement_summaries
+from decimal import Decimal
+from .benchmark_utils import check_invariants, session_urlconf
+from .bulk_utils import delete_ratings_in_chunks
+from .catalog_utils import CATALOG_VERSION_NAME, EmotionCatalog, get_emotion_catalog
+from .config_utils import CONFIG_VERSION_NAME, get_active_config
+from .export_utils import build_rating_matrix, claim_export_job, run_export_job
+from .fixture_utils import placeholder_image_bytes
+from .models import (
+    CacheVersion, CoverageBucket, DuplicateSource, EmotionalState, EmotionRanking, EmotionReliability, ExportJob,
+    FaceEmotionSummary, FaceImage, HourlyRatingCount, ImageEmotionAgreement, ImageRating, ImageReservation,
+    Participant, StudyConfiguration,
+)
+from .rating_utils import save_rating
+from .selection_utils import (
+    candidate_images, consume_reservation, rating_slot_available, release_expired_reservations, reserve_images,
+    sample_image, sample_image_ids, select_next_image,
+)
+from .session_utils import purge_expired_sessions
+from .summary_utils import rebuild_face_emotion_summaries
+from .stats_utils import get_study_stats, recompute_study_stats
+from .version_utils import current_version
 
-# Create your tests here.
+try:
+    import numpy as np
+except ImportError:  # A exportação em matriz exige o numpy
+    np = None
+
+
+# Sem releitura periódica das versões de cache no meio das medições
+@override_settings(STUDY_CACHE_VERSION_TTL=3600)
+class FaceImageAdminQueryBudgetTests(TestCase):
+    """O número de consultas da listagem de imagens não pode crescer com o tamanho da página"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        StudyConfiguration.objects.create(max_ratings_per_image=3)
+        cls.participants = [
+            Participant.objects.create(email=f'participant{i}@example.com') for i in range(3)
+        ]
+
+    def create_images(self, count):
+        for _ in range(count):
+            image = FaceImage.objects.create(image='faces/test.jpg')
+            for participant in self.participants[:2]:
+                ImageRating.objects.create(participant=participant, image=image)
+
+    def changelist_queries(self):
+        url = reverse('admin:face_study_faceimage_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_query_count_is_independent_of_page_size(self):
+        self.client.force_login(self.admin)
+        self.create_images(2)
+        self.changelist_queries()  # Aquece caches (configuração ativa, sessão)
+        small_page = self.changelist_queries()
+
+        self.create_images(30)
+        large_page = self.changelist_queries()
+
+        self.assertEqual(small_page, large_page)
+
+    def test_rating_count_column_is_sortable(self):
+        self.client.force_login(self.admin)
+        self.create_images(1)
+        ImageRating.objects.create(
+            participant=self.participants[0], image=FaceImage.objects.create(image='faces/test.jpg')
+        )
+        FaceImage.objects.create(image='faces/test.jpg')
+        url = reverse('admin:face_study_faceimage_changelist')
+        for order, expected in (('4', [0, 1, 2]), ('-4', [2, 1, 0])):
+            with self.subTest(order=order):
+                response = self.client.get(url, {'o': order})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([image.rating_count for image in response.context['cl'].result_list], expected)
+
+
+# Sem releitura periódica das versões de cache no meio das medições
+@override_settings(STUDY_CACHE_VERSION_TTL=3600)
+class ParticipantAdminQueryBudgetTests(TestCase):
+    """Os agregados da listagem de participantes vêm de subconsultas, não de consultas por linha"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.image = FaceImage.objects.create(image='faces/test.jpg')
+
+    def create_participants(self, count):
+        start = Participant.objects.count()
+        for i in range(start, start + count):
+            participant = Participant.objects.create(email=f'participant{i}@example.com')
+            ImageRating.objects.create(participant=participant, image=self.image)
+
+    def changelist_queries(self):
+        url = reverse('admin:face_study_participant_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_query_count_is_independent_of_page_size(self):
+        self.client.force_login(self.admin)
+        self.create_participants(2)
+        self.changelist_queries()
+        small_page = self.changelist_queries()
+
+        self.create_participants(30)
+        large_page = self.changelist_queries()
+
+        self.assertEqual(small_page, large_page)
+
+    def test_str_does_not_query(self):
+        participant = Participant.objects.create(email='someone@example.com')
+        created = ImageRating.objects.create(participant=participant, image=self.image)
+        rating = ImageRating.objects.get(pk=created.pk)
+        with self.assertNumQueries(0):
+            str(participant)
+            str(rating)
+
+
+@override_settings(STUDY_CACHE_VERSION_TTL=3600)
+class AdminFilterAndCountTests(TestCase):
+    """Filtros de texto livre no admin e contagem aproximada das listagens sem filtro"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        StudyConfiguration.objects.create(max_ratings_per_image=3)
+        cls.images = [FaceImage.objects.create(image='faces/test.jpg') for _ in range(3)]
+        alice = Participant.objects.create(email='alice@example.com')
+        bob = Participant.objects.create(email='bob@example.com')
+        ImageRating.objects.create(participant=alice, image=cls.images[0])
+        ImageRating.objects.create(participant=bob, image=cls.images[1])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_input_filters_match_email_prefix(self):
+        response = self.client.get(
+            reverse('admin:face_study_imagerating_changelist'), {'participant_email': ' ALI', 'o': '1'}
+        )
+        self.assertEqual(
+            [rating.participant.email for rating in response.context['cl'].result_list], ['alice@example.com']
+        )
+        # Campo de busca com os outros parâmetros da listagem como campos ocultos
+        self.assertContains(response, 'name="participant_email" value=" ALI"')
+        self.assertContains(response, '<input type="hidden" name="o" value="1">', html=True)
+        self.assertNotContains(response, 'bob@example.com')
+
+        response = self.client.get(reverse('admin:face_study_faceimage_changelist'), {'rated_by': 'bob'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.images[1]])
+
+    @override_settings(ADMIN_APPROXIMATE_COUNT_THRESHOLD=2)
+    def test_unfiltered_changelist_uses_estimate_above_threshold(self):
+        url = reverse('admin:face_study_faceimage_changelist')
+        with mock.patch('face_study.admin_filters.estimated_row_count', return_value=250000):
+            response = self.client.get(url)
+            self.assertEqual(response.context['cl'].paginator.count, 250000)
+            # Com filtro a contagem é exata
+            response = self.client.get(url, {'rated_by': 'alice'})
+            self.assertEqual(response.context['cl'].paginator.count, 1)
+
+        with mock.patch('face_study.admin_filters.estimated_row_count', return_value=2):
+            self.assertEqual(self.client.get(url).context['cl'].paginator.count, 3)
+        # Sem estatísticas do banco (SQLite) a contagem é exata
+        with mock.patch('face_study.admin_filters.estimated_row_count', return_value=None):
+            self.assertEqual(self.client.get(url).context['cl'].paginator.count, 3)
+
+
+@override_settings(UPLOAD_GALLERY_PAGE_SIZE=5)
+class UploadGalleryTests(TestCase):
+    """A galeria de uploads é paginada por chave e não consulta nada por imagem"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('uploader', 'uploader@example.com', 'password')
+        StudyConfiguration.objects.create(max_ratings_per_image=3)
+        cls.images = [FaceImage.objects.create(image='faces/test.jpg') for _ in range(12)]
+
+    def test_pages_cover_every_image_once(self):
+        self.client.force_login(self.user)
+        codes = []
+        cursor = None
+        while True:
+            params = {'cursor': cursor} if cursor else {}
+            data = self.client.get(reverse('faceStudy:upload_gallery'), params).json()
+            codes.extend(image['code'] for image in data['images'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(sorted(codes), sorted(image.code for image in self.images))
+        self.assertEqual(len(codes), len(set(codes)))
+
+    def test_upload_page_renders_first_page_only(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('faceStudy:upload_image'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['images']), 5)
+        self.assertTrue(response.context['next_cursor'])
+
+    def test_invalid_cursor_is_rejected(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('faceStudy:upload_gallery'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RatingCountSignalTests(TestCase):
+    """rating_count acompanha criações e remoções de avaliações, inclusive em massa e em cascata"""
+
+    @classmethod
+    def setUpTestData(cls):
+        StudyConfiguration.objects.create(max_ratings_per_image=3)
+        cls.image = FaceImage.objects.create(image='faces/test.jpg')
+        cls.participants = [Participant.objects.create(email=f'p{i}@example.com') for i in range(3)]
+
+    def rating_count(self):
+        return FaceImage.objects.values_list('rating_count', flat=True).get(pk=self.image.pk)
+
+    def test_counter_follows_creates_and_deletes(self):
+        ratings = [ImageRating.objects.create(participant=p, image=self.image) for p in self.participants]
+        self.assertEqual(self.rating_count(), 3)
+        self.assertFalse(FaceImage.objects.available(3).filter(pk=self.image.pk).exists())
+
+        # Salvar de novo não conta duas vezes
+        ratings[0].save()
+        self.assertEqual(self.rating_count(), 3)
+
+        ratings[0].delete()
+        self.assertEqual(self.rating_count(), 2)
+        ImageRating.objects.filter(participant=self.participants[1]).delete()
+        self.assertEqual(self.rating_count(), 1)
+        # Cascata a partir do participante
+        self.participants[2].delete()
+        self.assertEqual(self.rating_count(), 0)
+        self.assertTrue(FaceImage.objects.available(3).filter(pk=self.image.pk).exists())
+
+    def test_rebuild_fixes_drifted_counter(self):
+        ImageRating.objects.create(participant=self.participants[0], image=self.image)
+        FaceImage.objects.filter(pk=self.image.pk).update(rating_count=7)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rating_counts', verify=True, stdout=StringIO())
+
+        call_command('rebuild_rating_counts', stdout=StringIO())
+        self.assertEqual(self.rating_count(), 1)
+        call_command('rebuild_rating_counts', verify=True, stdout=StringIO())
+
+
+class RandomKeySamplingTests(TestCase):
+    """O sorteio pela chave indexada dá a volta no índice, respeita o filtro e espalha as escolhas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.config = StudyConfiguration.objects.create(max_ratings_per_image=1)
+        cls.images = [
+            FaceImage.objects.create(image='faces/test.jpg', random_key=key) for key in (0.1, 0.3, 0.5, 0.7, 0.9)
+        ]
+        cls.participant = Participant.objects.create(email='rater@example.com')
+
+    def test_sample_starts_at_pivot_and_wraps_around(self):
+        with mock.patch('face_study.models.random_sampling_key', return_value=0.6):
+            ids = sample_image_ids(FaceImage.objects.all(), 4)
+            first = sample_image(FaceImage.objects.all())
+        self.assertEqual(ids, [self.images[i].pk for i in (3, 4, 0, 1)])
+        self.assertEqual(first, self.images[3])
+
+        with mock.patch('face_study.models.random_sampling_key', return_value=0.95):
+            self.assertEqual(sample_image(FaceImage.objects.all()), self.images[0])
+            self.assertEqual(len(sample_image_ids(FaceImage.objects.all(), 10)), 5)
+
+    def test_sample_only_returns_eligible_images(self):
+        other = Participant.objects.create(email='other@example.com')
+        ImageRating.objects.create(participant=other, image=self.images[0])
+        ImageRating.objects.create(participant=self.participant, image=self.images[1])
+        eligible = {image.pk for image in self.images[2:]}
+        # Com a chave renovada a cada escolha, todas as elegíveis acabam sorteadas
+        chosen = {select_next_image(self.participant, self.config).pk for _ in range(60)}
+        self.assertEqual(chosen, eligible)
+        self.assertEqual(set(sample_image_ids(candidate_images(self.participant, self.config), 10)), eligible)
+
+    def test_selected_image_gets_a_new_key(self):
+        with mock.patch('face_study.models.random_sampling_key', side_effect=[0.2, 0.42]):
+            image = select_next_image(self.participant, self.config)
+        self.assertEqual(image, self.images[1])
+        self.assertEqual(FaceImage.objects.get(pk=image.pk).random_key, 0.42)
+
+
+class StudyStatsTests(TestCase):
+    """O snapshot incremental deve bater com uma recontagem completa"""
+
+    def assertStatsMatchRecount(self):
+        incremental = get_study_stats()
+        recompute_study_stats()
+        recounted = get_study_stats()
+        for key in ['total_images', 'rated_images', 'total_ratings', 'total_participants', 'coverage', 'hourly']:
+            self.assertEqual(incremental[key], recounted[key], key)
+        return recounted
+
+    def test_snapshot_follows_ratings_and_deletes(self):
+        StudyConfiguration.objects.create(max_ratings_per_image=2)
+        images = [FaceImage.objects.create(image='faces/test.jpg') for _ in range(4)]
+        participants = [Participant.objects.create(email=f'p{i}@example.com') for i in range(3)]
+        for participant in participants:
+            ImageRating.objects.create(participant=participant, image=images[0])
+        ImageRating.objects.create(participant=participants[0], image=images[1])
+        ImageRating.objects.create(participant=participants[1], image=images[2])
+
+        stats = self.assertStatsMatchRecount()
+        self.assertEqual(stats['total_images'], 4)
+        self.assertEqual(stats['rated_images'], 3)
+        self.assertEqual(stats['total_ratings'], 5)
+        self.assertEqual(stats['full_images'], 1)
+
+        ImageRating.objects.filter(image=images[1]).delete()
+        delete_ratings_in_chunks(ImageRating.objects.filter(participant=participants[2]), chunk_size=1)
+        images[2].delete()
+        participants[2].delete()
+
+        stats = self.assertStatsMatchRecount()
+        self.assertEqual(stats['total_images'], 3)
+        self.assertEqual(stats['total_ratings'], 2)
+        self.assertEqual(stats['total_participants'], 2)
+
+    def test_concurrent_counters_are_spread_over_slots(self):
+        StudyConfiguration.objects.create(max_ratings_per_image=2)
+        participant = Participant.objects.create(email='rater@example.com')
+        for _ in range(30):
+            ImageRating.objects.create(participant=participant, image=FaceImage.objects.create(image='faces/test.jpg'))
+
+        # Várias linhas por faixa e por hora, somadas na leitura
+        self.assertGreater(CoverageBucket.objects.filter(rating_count=1).count(), 1)
+        self.assertGreater(HourlyRatingCount.objects.count(), 1)
+        stats = self.assertStatsMatchRecount()
+        self.assertEqual(stats['coverage'], [{'rating_count': 1, 'images': 30}])
+        self.assertEqual(sum(hour['ratings'] for hour in stats['hourly']), 30)
+
+    def test_dashboard_reads_snapshot(self):
+        self.client.force_login(User.objects.create_user('staff', 'staff@example.com', 'password'))
+        FaceImage.objects.create(image='faces/test.jpg')
+        get_study_stats()  # Aquece caches (configuração ativa, catálogo)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('faceStudy:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['stats']['total_images'], 1)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql'].upper()])
+
+
+class BulkDeleteTests(TestCase):
+    """delete_ratings_in_chunks (DELETE direto no banco) deixa tudo igual a um .delete() com sinais"""
+
+    @classmethod
+    def setUpTestData(cls):
+        StudyConfiguration.objects.create(max_ratings_per_image=3)
+        emotions = [EmotionalState.objects.create(name=name) for name in ('happy', 'sad')]
+        cls.images = [FaceImage.objects.create(image='faces/test.jpg') for _ in range(4)]
+        cls.participants = [Participant.objects.create(email=f'p{i}@example.com') for i in range(3)]
+        for index, participant in enumerate(cls.participants):
+            for image in cls.images[index:]:
+                save_rating(participant, image, {
+                    emotion.id: Decimal(index * 20 + position * 7) / 100
+                    for position, emotion in enumerate(emotions)
+                })
+        # Avaliações em horas diferentes, contadas de novo no StudyStats
+        ImageRating.objects.filter(participant=cls.participants[0]).update(
+            created_at=timezone.now() - timedelta(hours=2)
+        )
+        recompute_study_stats()
+        # Reservas abertas nas imagens afetadas, com o contador em dia
+        for position, image in enumerate(cls.images[2:]):
+            ImageReservation.objects.create(
+                participant=cls.participants[0], image=image, token=uuid.uuid4(), position=position,
+                expires_at=timezone.now() + timedelta(minutes=5),
+            )
+        FaceImage.objects.rebuild_reserved_counts()
+
+    def snapshot(self):
+        stats = get_study_stats()
+        return {
+            'images': list(FaceImage.objects.order_by('pk').values_list('pk', 'rating_count', 'reserved_count')),
+            'stats': {
+                key: stats[key]
+                for key in ('total_images', 'rated_images', 'full_images', 'total_ratings', 'coverage')
+            },
+            'hourly': sorted(
+                (row['hour'], row['ratings']) for row in stats['hourly'] if row['ratings']
+            ),
+            'summaries': list(FaceEmotionSummary.objects.filter(count__gt=0).order_by('image', 'emotion').values_list(
+                'image', 'emotion', 'count', 'total', 'total_sq',
+            )),
+            'reservations': list(ImageReservation.objects.order_by('pk').values_list('pk', 'image', 'consumed_at')),
+            'open_images': list(FaceImage.objects.with_open_slots(3).order_by('pk').values_list('pk', flat=True)),
+        }
+
+    def test_chunked_delete_matches_orm_delete(self):
+        for label, ratings in (
+            ('one participant', ImageRating.objects.filter(participant=self.participants[1])),
+            ('reserved images', ImageRating.objects.filter(image__in=self.images[2:])),
+        ):
+            with self.subTest(label):
+                sid = transaction.savepoint()
+                ratings.delete()
+                expected = self.snapshot()
+                transaction.savepoint_rollback(sid)
+
+                delete_ratings_in_chunks(ratings, chunk_size=2)
+                self.assertEqual(self.snapshot(), expected)
+                self.assertEqual(check_invariants(), dict.fromkeys(check_invariants(), 0))
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentRatingEditTests(TransactionTestCase):
+    """Reenvios simultâneos da mesma avaliação não podem desalinhar os resumos (trava da linha da avaliação)"""
+
+    def test_concurrent_edits_keep_summaries_consistent(self):
+        happy = EmotionalState.objects.create(name='happy')
+        image = FaceImage.objects.create(image='faces/test.jpg')
+        participant = Participant.objects.create(email='double-click@example.com')
+        save_rating(participant, image, {happy.id: Decimal('0.10')})
+
+        barrier = threading.Barrier(2)
+
+        def resubmit(level):
+            try:
+                barrier.wait()
+                for _ in range(20):
+                    save_rating(participant, image, {happy.id: Decimal(level)})
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=resubmit, args=(level,)) for level in ('0.30', '0.90')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        level = EmotionRanking.objects.get(rating__participant=participant).agreement_level
+        summary = FaceEmotionSummary.objects.get(image=image, emotion=happy)
+        self.assertEqual((summary.count, summary.total, summary.total_sq), (1, level * 100, (level * 100) ** 2))
+
+
+class AgreementAnalyticsTests(TestCase):
+    """Estatísticas vetorizadas conferidas com valores calculados à mão"""
+
+    def rate(self, participant, image, emotion, level):
+        rating, _ = ImageRating.objects.get_or_create(participant=participant, image=image)
+        EmotionRanking.objects.create(rating=rating, emotion=emotion, agreement_level=level)
+
+    def test_summaries_and_reliability(self):
+        happy = EmotionalState.objects.create(name='happy')
+        sad = EmotionalState.objects.create(name='sad')
+        images = [FaceImage.objects.create(image='faces/test.jpg') for _ in range(3)]
+        participants = [Participant.objects.create(email=f'rater{i}@example.com') for i in range(2)]
+        # happy: os dois avaliadores sempre concordam; sad: sempre discordam ao máximo
+        for image, level in zip(images, ['0.10', '0.50', '0.90']):
+            for participant in participants:
+                self.rate(participant, image, happy, level)
+        for image in images:
+            self.rate(participants[0], image, sad, '0.00')
+            self.rate(participants[1], image, sad, '1.00')
+
+        result = compute_agreement_summaries(chunk_size=4)
+        self.assertEqual(result['rankings'], 12)
+        self.assertEqual(result['groups'], 6)
+
+        self.assertAlmostEqual(EmotionReliability.objects.get(emotion=happy).krippendorff_alpha, 1.0)
+        self.assertAlmostEqual(EmotionReliability.objects.get(emotion=happy).icc, 1.0)
+        self.assertLess(EmotionReliability.objects.get(emotion=sad).krippendorff_alpha, 0)
+
+        disagreement = ImageEmotionAgreement.objects.get(image=images[0], emotion=sad)
+        self.assertEqual(disagreement.n_ratings, 2)
+        self.assertAlmostEqual(disagreement.mean, 0.5)
+        self.assertAlmostEqual(disagreement.std, 2 ** 0.5 / 2)
+        self.assertAlmostEqual(disagreement.entropy, 1.0)
+
+
+class FaceEmotionSummaryTests(TestCase):
+    """Os resumos incrementais devem bater com um recálculo a partir dos rankings"""
+
+    def snapshot(self):
+        return set(
+            FaceEmotionSummary.objects.filter(count__gt=0).values_list('image_id', 'emotion_id', 'count', 'total', 'total_sq')
+        )
+
+    def assertSummariesMatchRebuild(self):
+        incremental = self.snapshot()
+        rebuild_face_emotion_summaries()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_summaries_follow_new_edited_and_deleted_ratings(self):
+        happy = EmotionalState.objects.create(name='happy')
+        sad = EmotionalState.objects.create(name='sad')
+        image = FaceImage.objects.create(image='faces/test.jpg')
+        first, second, third = [Participant.objects.create(email=f'rater{i}@example.com') for i in range(3)]
+
+        save_rating(first, image, {happy.id: Decimal('0.20'), sad.id: Decimal('0.70')})
+        save_rating(second, image, {happy.id: Decimal('0.60')})
+        save_rating(third, image, {happy.id: Decimal('1.00'), sad.id: Decimal('0.10')})
+        self.assertSummariesMatchRebuild()
+
+        summary = FaceEmotionSummary.objects.get(image=image, emotion=happy)
+        self.assertEqual(summary.count, 3)
+        self.assertAlmostEqual(summary.mean, 0.6)
+        self.assertAlmostEqual(summary.std, 0.4)
+
+        # Edição: muda um nível e deixa de enviar outra emoção
+        save_rating(first, image, {happy.id: Decimal('0.30')})
+        self.assertSummariesMatchRebuild()
+
+        ImageRating.objects.get(participant=second).delete()
+        delete_ratings_in_chunks(ImageRating.objects.filter(participant=third))
+        self.assertSummariesMatchRebuild()
+        self.assertEqual(FaceEmotionSummary.objects.get(image=image, emotion=happy).count, 1)
+
+    def test_rebuild_writes_in_fixed_size_batches(self):
+        emotions = [EmotionalState.objects.create(name=name) for name in ('happy', 'sad', 'calm')]
+        participant = Participant.objects.create(email='rater@example.com')
+        for _ in range(2):
+            image = FaceImage.objects.create(image='faces/test.jpg')
+            save_rating(participant, image, {emotion.id: Decimal('0.50') for emotion in emotions})
+        expected = self.snapshot()
+
+        table = connection.ops.quote_name(FaceEmotionSummary._meta.db_table)
+        with mock.patch('face_study.summary_utils.SUMMARY_REBUILD_BATCH_SIZE', 4):
+            with CaptureQueriesContext(connection) as queries:
+                rebuild_face_emotion_summaries()
+        inserts = [query for query in queries if query['sql'].startswith(f'INSERT INTO {table}')]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(self.snapshot(), expected)
+
+
+class SaveRatingTests(TestCase):
+    """save_rating grava os rankings em uma escrita em lote e edita com upsert"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.happy, cls.sad, cls.calm = [
+            EmotionalState.objects.create(name=name) for name in ('happy', 'sad', 'calm')
+        ]
+        cls.image = FaceImage.objects.create(image='faces/test.jpg')
+        cls.participant = Participant.objects.create(email='rater@example.com')
+
+    def ranking_inserts(self, queries):
+        table = connection.ops.quote_name(EmotionRanking._meta.db_table)
+        return [query for query in queries if query['sql'].startswith(f'INSERT INTO {table}')]
+
+    def levels(self, rating):
+        return dict(rating.emotion_rankings.values_list('emotion_id', 'agreement_level'))
+
+    def test_new_rating_inserts_rankings_in_one_statement(self):
+        with CaptureQueriesContext(connection) as queries:
+            rating, created = save_rating(self.participant, self.image, {
+                self.happy.id: Decimal('0.20'), self.sad.id: Decimal('0.70'), self.calm.id: Decimal('0.50'),
+            })
+        self.assertTrue(created)
+        self.assertEqual(len(self.ranking_inserts(queries)), 1)
+        self.assertEqual(rating.emotion_rankings.count(), 3)
+
+    def test_edit_upserts_changed_levels_and_drops_missing_emotions(self):
+        rating, _ = save_rating(self.participant, self.image, {
+            self.happy.id: Decimal('0.20'), self.sad.id: Decimal('0.70'),
+        })
+        happy_ranking = rating.emotion_rankings.get(emotion=self.happy).pk
+
+        with CaptureQueriesContext(connection) as queries:
+            edited, created = save_rating(self.participant, self.image, {
+                self.happy.id: Decimal('0.40'), self.calm.id: Decimal('0.90'),
+            })
+        self.assertFalse(created)
+        self.assertEqual(edited.pk, rating.pk)
+        self.assertEqual(len(self.ranking_inserts(queries)), 1)
+        self.assertEqual(self.levels(edited), {self.happy.id: Decimal('0.40'), self.calm.id: Decimal('0.90')})
+        # O ranking que continuou é atualizado no lugar, não recriado
+        self.assertEqual(edited.emotion_rankings.get(emotion=self.happy).pk, happy_ranking)
+        self.assertEqual(ImageRating.objects.count(), 1)
+        self.assertEqual(FaceImage.objects.get(pk=self.image.pk).rating_count, 1)
+
+        summaries = dict(
+            FaceEmotionSummary.objects.filter(count__gt=0).values_list('emotion_id', 'total')
+        )
+        self.assertEqual(summaries, {self.happy.id: 40, self.calm.id: 90})
+
+
+class RatingApiTests(TestCase):
+    """Fluxo completo pela API JSON: início, envio com pré-carregamento e fim da sessão"""
+
+    @classmethod
+    def setUpTestData(cls):
+        StudyConfiguration.objects.create(min_images_per_session=3, max_images_per_session=3, max_ratings_per_image=2)
+        cls.happy = EmotionalState.objects.create(name='happy')
+        for _ in range(5):
+            FaceImage.objects.create(image='faces/test.jpg')
+
+    def test_session_flow(self):
+        response = self.client.post(
+            reverse('faceStudy:api_start_session'), {'email': 'api@example.com'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        state = response.json()
+        self.assertEqual(state['progress']['total'], 3)
+        self.assertEqual([emotion['field'] for emotion in state['emotions']], [f'emotion_{self.happy.id}'])
+
+        seen = []
+        while not state['complete']:
+            seen.append(state['image']['id'])
+            expected_next = state['next_image']
+            response = self.client.post(reverse('faceStudy:api_submit_rating'), {
+                'image_id': state['image']['id'],
+                f'emotion_{self.happy.id}': '0.40',
+            }, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            state = response.json()
+            if not state['complete']:
+                # A imagem pré-carregada na resposta anterior é a atual agora
+                self.assertEqual(state['image']['id'], expected_next['id'])
+
+        self.assertEqual(len(set(seen)), 3)
+        self.assertEqual(ImageRating.objects.filter(participant__email='api@example.com').count(), 3)
+        self.assertEqual(self.client.get(reverse('faceStudy:api_progress')).status_code, 409)
+
+    def test_invalid_level_is_rejected(self):
+        state = self.client.post(
+            reverse('faceStudy:api_start_session'), {'email': 'api@example.com'}, content_type='application/json'
+        ).json()
+        response = self.client.post(reverse('faceStudy:api_submit_rating'), {
+            'image_id': state['image']['id'],
+            f'emotion_{self.happy.id}': 'abc',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f'emotion_{self.happy.id}', response.json()['errors'])
+        self.assertEqual(self.client.get(reverse('faceStudy:api_progress')).json()['progress']['rated'], 0)
+
+
+@override_settings(ROOT_URLCONF=session_urlconf(use_async=True))
+class AsyncSessionViewsTests(TestCase):
+    """Páginas da sessão em versão async: mesmo fluxo e mesmo estado gravado que as sync"""
+
+    @classmethod
+    def setUpTestData(cls):
+        StudyConfiguration.objects.create(min_images_per_session=3, max_images_per_session=3, max_ratings_per_image=2)
+        cls.happy = EmotionalState.objects.create(name='happy')
+        for _ in range(5):
+            FaceImage.objects.create(image='faces/test.jpg')
+
+    async def test_session_flow(self):
+        rate_url = reverse('faceStudy:rate_images')
+        response = await self.async_client.post(reverse('faceStudy:start_session'), {'email': 'async@example.com'})
+        self.assertEqual(response.url, rate_url)
+
+        seen = []
+        for _ in range(3):
+            page = await self.async_client.get(rate_url)
+            self.assertEqual(page.status_code, 200)
+            seen.append(page.context['image'].id)
+            response = await self.async_client.post(rate_url, {
+                'image_id': seen[-1],
+                f'emotion_{self.happy.id}': '0.40',
+            })
+        self.assertEqual(response.url, reverse('faceStudy:session_complete'))
+        self.assertEqual((await self.async_client.get(response.url)).status_code, 200)
+
+        self.assertEqual(len(set(seen)), 3)
+        self.assertEqual(await ImageRating.objects.filter(participant__email='async@example.com').acount(), 3)
+        self.assertFalse(await ImageReservation.objects.aexists())
+        self.assertEqual((await self.async_client.get(rate_url)).url, reverse('faceStudy:start_session'))
+
+
+class StudyStateTests(TestCase):
+    """Estado da sessão de avaliação no cookie assinado, fora de django_session"""
+
+    @classmethod
+    def setUpTestData(cls):
+        StudyConfiguration.objects.create(min_images_per_session=2, max_images_per_session=2, max_ratings_per_image=2)
+        cls.happy = EmotionalState.objects.create(name='happy')
+        for _ in range(4):
+            FaceImage.objects.create(image='faces/test.jpg')
+
+    def rate(self, image_id):
+        return self.client.post(reverse('faceStudy:rate_images'), {
+            'image_id': image_id,
+            f'emotion_{self.happy.id}': '0.60',
+        })
+
+    def test_rating_flow_writes_no_session_rows(self):
+        self.client.post(reverse('faceStudy:start_session'), {'email': 'state@example.com'})
+        first = self.client.get(reverse('faceStudy:rate_images')).context['image'].id
+        self.rate(first)
+        # Reenviar a mesma imagem não avança a sessão
+        self.rate(first)
+        second = self.client.get(reverse('faceStudy:rate_images')).context['image'].id
+        self.assertNotEqual(first, second)
+        response = self.rate(second)
+        self.assertEqual(response.url, reverse('faceStudy:session_complete'))
+
+        response = self.client.get(response.url)
+        self.assertEqual(response.cookies[settings.STUDY_STATE_COOKIE_NAME].value, '')
+        self.assertFalse(Session.objects.exists())
+        self.assertFalse(ImageReservation.objects.exists())
+        self.assertEqual(ImageRating.objects.count(), 2)
+
+    def test_tampered_state_is_ignored(self):
+        self.client.post(reverse('faceStudy:start_session'), {'email': 'state@example.com'})
+        value = self.client.cookies[settings.STUDY_STATE_COOKIE_NAME].value
+        self.client.cookies[settings.STUDY_STATE_COOKIE_NAME] = value[:-1] + ('A' if value[-1] != 'A' else 'B')
+        response = self.client.get(reverse('faceStudy:rate_images'))
+        self.assertEqual(response.url, reverse('faceStudy:start_session'))
+
+    def test_purge_expired_sessions(self):
+        now = timezone.now()
+        Session.objects.bulk_create([
+            Session(session_key=f'expired{index:03d}', session_data='', expire_date=now - timedelta(hours=1))
+            for index in range(5)
+        ] + [Session(session_key='live', session_data='', expire_date=now + timedelta(hours=1))])
+        self.assertEqual(purge_expired_sessions(chunk_size=2), 5)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+
+
+class RatingSlotTests(TestCase):
+    """Notas só entram em imagens reservadas pela sessão ou com vaga livre"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.config = StudyConfiguration.objects.create(
+            min_images_per_session=1, max_images_per_session=1, max_ratings_per_image=1,
+        )
+        cls.happy = EmotionalState.objects.create(name='happy')
+        cls.full = FaceImage.objects.create(image='faces/test.jpg')
+        cls.held = FaceImage.objects.create(image='faces/test.jpg')
+        cls.open = FaceImage.objects.create(image='faces/test.jpg')
+        ImageRating.objects.create(participant=Participant.objects.create(email='first@example.com'), image=cls.full)
+        # Vaga ocupada pela reserva de outra sessão
+        FaceImage.objects.filter(pk=cls.held.pk).update(reserved_count=1)
+
+    def test_page_rejects_image_without_slot(self):
+        self.client.post(reverse('faceStudy:start_session'), {'email': 'late@example.com'})
+        for image in (self.full, self.held):
+            response = self.client.post(reverse('faceStudy:rate_images'), {
+                'image_id': image.id, f'emotion_{self.happy.id}': '0.60',
+            })
+            self.assertEqual(response.url, reverse('faceStudy:rate_images'))
+        self.assertFalse(ImageRating.objects.filter(participant__email='late@example.com').exists())
+        self.assertEqual(FaceImage.objects.get(pk=self.full.pk).rating_count, 1)
+
+    def test_api_rejects_image_without_slot(self):
+        self.client.post(
+            reverse('faceStudy:api_start_session'), {'email': 'late@example.com'}, content_type='application/json'
+        )
+        response = self.client.post(reverse('faceStudy:api_submit_rating'), {
+            'image_id': str(self.held.id), f'emotion_{self.happy.id}': '0.60',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image_id', response.json()['errors'])
+
+    def test_fallback_selection_skips_reserved_slots(self):
+        participant = Participant.objects.create(email='fallback@example.com')
+        for _ in range(10):
+            self.assertEqual(select_next_image(participant, self.config), self.open)
+
+
+class ReservationTests(TestCase):
+    """Reservas não passam do limite por imagem, e vagas vencidas ou usadas voltam ao contador certo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.config = StudyConfiguration.objects.create(max_ratings_per_image=1)
+        cls.first = FaceImage.objects.create(image='faces/test.jpg')
+        cls.second = FaceImage.objects.create(image='faces/test.jpg')
+        cls.participant = Participant.objects.create(email='rater@example.com')
+        cls.other = Participant.objects.create(email='other@example.com')
+
+    def reserved_count(self, image):
+        return FaceImage.objects.values_list('reserved_count', flat=True).get(pk=image.pk)
+
+    def test_reserve_skips_images_filled_after_sampling(self):
+        # Outra sessão ocupa a vaga entre o sorteio e a trava
+        ImageRating.objects.create(participant=self.other, image=self.first)
+        with mock.patch(
+            'face_study.selection_utils.sample_image_ids', return_value=[self.first.pk, self.second.pk]
+        ):
+            token, reserved = reserve_images(self.participant, self.config, 2)
+        self.assertEqual(reserved, [self.second.pk])
+        self.assertEqual(
+            list(ImageReservation.objects.filter(token=token).values_list('image', flat=True)), [self.second.pk]
+        )
+        self.assertEqual((self.reserved_count(self.first), self.reserved_count(self.second)), (0, 1))
+
+        # Com a vaga reservada, nenhuma outra sessão recebe a imagem
+        _, reserved = reserve_images(self.other, self.config, 2)
+        self.assertEqual(reserved, [])
+
+    def test_consume_and_release_update_reserved_count(self):
+        token, _ = reserve_images(self.participant, self.config, 2)
+        position = ImageReservation.objects.get(token=token, image=self.first).position
+        self.assertEqual(consume_reservation(token, self.first), position)
+        self.assertEqual(self.reserved_count(self.first), 0)
+        # Reenvio: a reserva já consumida não desconta de novo
+        consume_reservation(token, self.first)
+        self.assertEqual(self.reserved_count(self.first), 0)
+        self.assertEqual(self.reserved_count(self.second), 1)
+
+        ImageReservation.objects.filter(token=token).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(release_expired_reservations(), 2)
+        self.assertEqual((self.reserved_count(self.first), self.reserved_count(self.second)), (0, 0))
+        self.assertEqual(check_invariants()['reserved_count'], 0)
+
+    def test_expired_reservation_does_not_hold_the_slot(self):
+        token, _ = reserve_images(self.participant, self.config, 2)
+        # Vencida e ainda não liberada; a imagem ficou cheia nesse meio tempo
+        ImageReservation.objects.filter(token=token).update(expires_at=timezone.now() - timedelta(seconds=1))
+        ImageRating.objects.create(participant=self.other, image=self.first)
+        with transaction.atomic():
+            self.assertFalse(rating_slot_available(self.participant, self.first, self.config, token))
+
+        ImageReservation.objects.filter(token=token).update(expires_at=timezone.now() + timedelta(minutes=5))
+        with transaction.atomic():
+            self.assertTrue(rating_slot_available(self.participant, self.second, self.config, token))
+
+
+class LoadTestSessionsTests(TransactionTestCase):
+    """O teste de carga completa as sessões simuladas, verifica os invariantes e apaga o que criou"""
+
+    def setUp(self):
+        StudyConfiguration.objects.create(min_images_per_session=2, max_images_per_session=2, max_ratings_per_image=2)
+        EmotionalState.objects.create(name='happy')
+        for _ in range(4):
+            FaceImage.objects.create(image='faces/test.jpg')
+
+    def test_load_test_reports_endpoints_and_cleans_up(self):
+        output = StringIO()
+        # Um participante por vez: o banco SQLite em memória dos testes trava escritas simultâneas
+        call_command('load_test_sessions', participants=3, concurrency=1, stdout=output)
+        report = output.getvalue()
+        self.assertIn('3/3 session(s) completed', report)
+        self.assertIn('POST rate_images', report)
+        self.assertIn('All invariants hold.', report)
+        self.assertFalse(Participant.objects.exists())
+        self.assertEqual(check_invariants(), dict.fromkeys(check_invariants(), 0))
+
+
+class ScaleFixturesTests(TestCase):
+    """Os dados sintéticos respeitam os invariantes e a suíte de benchmark roda sobre eles"""
+
+    def test_generated_fixtures_are_consistent(self):
+        StudyConfiguration.objects.create()
+        output = StringIO()
+        call_command(
+            'generate_scale_fixtures', images=30, participants=10, ratings=100, emotions=3,
+            max_ratings_per_image=5, batch_size=16, no_files=True, seed=1, stdout=output,
+        )
+        self.assertEqual(FaceImage.objects.count(), 30)
+        self.assertEqual(ImageRating.objects.count(), 100)
+        self.assertEqual(EmotionRanking.objects.count(), 300)
+        self.assertEqual(get_study_stats()['total_ratings'], 100)
+        self.assertEqual(check_invariants(), dict.fromkeys(check_invariants(), 0))
+
+        output = StringIO()
+        call_command('run_benchmarks', repeat=1, stdout=output)
+        self.assertIn('export_ratings_csv', output.getvalue())
+        self.assertIn('100 rating(s)', output.getvalue())
+        self.assertFalse(User.objects.exists())
+
+    def test_limit_is_raised_when_ratings_do_not_fit(self):
+        StudyConfiguration.objects.create(max_ratings_per_image=1)
+        output = StringIO()
+        call_command(
+            'generate_scale_fixtures', images=8, participants=5, ratings=30, emotions=1,
+            no_files=True, seed=2, stdout=output,
+        )
+        self.assertIn('Raising max_ratings_per_image to 4', output.getvalue())
+        self.assertEqual(ImageRating.objects.count(), 30)
+        codes = list(FaceImage.objects.values_list('code', flat=True))
+        self.assertTrue(all(len(code) == 20 for code in codes))
+
+
+@skipIf(np is None, 'numpy is not installed')
+class RatingMatrixTests(TestCase):
+    """A matriz densa tem NaN onde não há nota, índices alinhados às tabelas e sai igual em todos os formatos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.happy = EmotionalState.objects.create(name='happy')
+        cls.sad = EmotionalState.objects.create(name='sad')
+        cls.first_image = FaceImage.objects.create(image='faces/first.jpg')
+        cls.second_image = FaceImage.objects.create(image='faces/second.jpg')
+        cls.ana = Participant.objects.create(email='ana@example.com')
+        cls.bia = Participant.objects.create(email='bia@example.com')
+        save_rating(cls.ana, cls.first_image, {cls.happy.id: Decimal('0.20'), cls.sad.id: Decimal('0.70')})
+        save_rating(cls.bia, cls.first_image, {cls.happy.id: Decimal('0.60')})
+        save_rating(cls.ana, cls.second_image, {cls.sad.id: Decimal('0.10')})
+
+    def catalog(self):
+        return EmotionCatalog(0, EmotionalState.objects.order_by('name'))
+
+    def rows(self, matrix):
+        """(e-mail, código da imagem, happy, sad) de cada linha, pelos índices e tabelas da matriz"""
+        return [
+            (
+                str(matrix['participants'][participant]), str(matrix['image_codes'][image]),
+                *(None if np.isnan(value) else round(float(value), 2) for value in values),
+            )
+            for participant, image, values in zip(
+                matrix['participant_index'], matrix['image_index'], matrix['values']
+            )
+        ]
+
+    def expected_rows(self):
+        return [
+            ('ana@example.com', self.first_image.code, 0.2, 0.7),
+            ('bia@example.com', self.first_image.code, 0.6, None),
+            ('ana@example.com', self.second_image.code, None, 0.1),
+        ]
+
+    def test_matrix_fills_nan_and_aligns_indices(self):
+        matrix = build_rating_matrix(ImageRating.objects.all(), self.catalog(), chunk_size=2)
+        self.assertEqual(matrix['values'].dtype, np.float32)
+        self.assertEqual(self.rows(matrix), self.expected_rows())
+        rating_ids = ImageRating.objects.order_by('id').values_list('id', flat=True)
+        self.assertEqual(list(matrix['rating_id']), list(rating_ids))
+        self.assertEqual(list(matrix['emotion_columns']), ['emotion_happy', 'emotion_sad'])
+
+    def test_rows_of_participants_deleted_during_read_are_skipped(self):
+        read_rankings = EmotionRanking.objects.filter
+
+        def delete_then_read(*args, **kwargs):
+            # Participante removido por outra requisição entre a leitura das avaliações e a dos metadados
+            Participant.objects.filter(pk=self.bia.pk).delete()
+            return read_rankings(*args, **kwargs)
+
+        with mock.patch.object(EmotionRanking.objects, 'filter', side_effect=delete_then_read):
+            matrix = build_rating_matrix(ImageRating.objects.all(), self.catalog())
+        self.assertEqual(self.rows(matrix), [self.expected_rows()[0], self.expected_rows()[2]])
+        self.assertEqual(list(matrix['participants']), ['ana@example.com'])
+
+    def test_every_format_round_trips(self):
+        matrix = build_rating_matrix(ImageRating.objects.all(), self.catalog())
+        for fmt in ('npz', 'arrow', 'parquet'):
+            with self.subTest(fmt), tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, f'ratings.{fmt}')
+                call_command('export_rating_matrix', path, format=fmt, stdout=StringIO())
+                if fmt == 'npz':
+                    with np.load(path) as loaded:
+                        written = {name: loaded[name] for name in loaded.files}
+                    self.assertEqual(self.rows(written), self.expected_rows())
+                    continue
+
+                try:
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+                except ImportError:
+                    self.skipTest('pyarrow is not installed')
+                if fmt == 'parquet':
+                    table = pq.read_table(path)
+                else:
+                    with pa.memory_map(path) as source:
+                        table = pa.ipc.open_file(source).read_all()
+                self.assertEqual(
+                    table.column_names,
+                    ['rating_id', 'participant_index', 'image_index', 'created_at', 'emotion_happy', 'emotion_sad'],
+                )
+                metadata = {key.decode(): json.loads(value) for key, value in table.schema.metadata.items()}
+                written = {
+                    'participant_index': table.column('participant_index').to_numpy(),
+                    'image_index': table.column('image_index').to_numpy(),
+                    'values': np.column_stack([
+                        table.column(name).to_numpy(zero_copy_only=False)
+                        for name in ('emotion_happy', 'emotion_sad')
+                    ]),
+                    'participants': metadata['participants'],
+                    'image_codes': metadata['image_codes'],
+                }
+                self.assertEqual(self.rows(written), self.expected_rows())
+                self.assertEqual(list(table.column('rating_id').to_numpy()), list(matrix['rating_id']))
+
+    def test_command_date_filter_includes_the_end_date(self):
+        ImageRating.objects.filter(participant=self.bia).update(created_at=timezone.now() - timedelta(days=30))
+        today = timezone.localdate()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ratings.npz')
+            call_command(
+                'export_rating_matrix', path, start_date=(today - timedelta(days=1)).isoformat(),
+                end_date=today.isoformat(), stdout=StringIO(),
+            )
+            with np.load(path) as loaded:
+                self.assertEqual(sorted(loaded['participants']), ['ana@example.com'])
+                self.assertEqual(len(loaded['values']), 2)
+
+
+class ExportAdvancedTests(TestCase):
+    """A exportação avançada aplica o filtro de datas ou recusa o formato que não pode aplicá-lo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        happy = EmotionalState.objects.create(name='happy')
+        image = FaceImage.objects.create(image='faces/test.jpg')
+        old, recent = (Participant.objects.create(email=f'{name}@example.com') for name in ('old', 'recent'))
+        save_rating(old, image, {happy.id: Decimal('0.20')})
+        save_rating(recent, image, {happy.id: Decimal('0.80')})
+        ImageRating.objects.filter(participant=old).update(created_at=timezone.now() - timedelta(days=30))
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:face_study_export_advanced')
+
+    def test_csv_export_applies_date_filter(self):
+        today = timezone.localdate()
+        response = self.client.post(self.url, {
+            'format': 'csv', 'start_date': (today - timedelta(days=1)).isoformat(), 'end_date': today.isoformat(),
+        })
+        content = b''.join(response.streaming_content)
+        self.assertIn(b'recent@example.com', content)
+        self.assertNotIn(b'old@example.com', content)
+
+    def test_consensus_export_rejects_date_filter(self):
+        response = self.client.post(self.url, {'format': 'consensus', 'start_date': '2020-01-01'}, follow=True)
+        self.assertRedirects(response, self.url)
+        self.assertContains(response, 'clear the date filter')
+
+        response = self.client.post(self.url, {'format': 'consensus'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+
+class ExportJobTests(TestCase):
+    """Os CSVs das exportações ficam fora de MEDIA_ROOT, saem só para a equipe e cada job tem um único worker"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.user = User.objects.create_user('user', 'user@example.com', 'password')
+        participant = Participant.objects.create(email='private@example.com')
+        ImageRating.objects.create(participant=participant, image=FaceImage.objects.create(image='faces/test.jpg'))
+
+    def setUp(self):
+        export_root = tempfile.TemporaryDirectory()
+        self.addCleanup(export_root.cleanup)
+        self.enterContext(override_settings(STUDY_EXPORT_ROOT=export_root.name))
+
+    def test_export_is_private(self):
+        job = ExportJob.objects.create()
+        call_command('run_export_jobs', once=True, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS_DONE)
+        self.assertTrue(job.file.path.startswith(settings.STUDY_EXPORT_ROOT))
+        self.assertRegex(job.file.name, r'^ratings_export_\d+_[0-9a-f]{32}\.csv$')
+
+        url = reverse('faceStudy:download_export', args=[job.pk])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.admin)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'private@example.com', b''.join(response.streaming_content))
+
+    def test_interrupted_job_resumes_from_checkpoint(self):
+        for index in range(4):
+            participant = Participant.objects.create(email=f'resume{index}@example.com')
+            ImageRating.objects.create(participant=participant, image=FaceImage.objects.create(image='faces/test.jpg'))
+
+        class WorkerStopped(Exception):
+            pass
+
+        def stop_after_first_chunk(job):
+            raise WorkerStopped
+
+        job = ExportJob.objects.create()
+        with self.assertRaises(WorkerStopped):
+            run_export_job(claim_export_job(), chunk_size=2, progress=stop_after_first_chunk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_written), (ExportJob.STATUS_RUNNING, 2))
+        # Lote gravado pela metade depois do último checkpoint
+        with open(job.file.path, 'a') as output:
+            output.write('999999,partial')
+
+        stale = timezone.now() - timedelta(seconds=settings.EXPORT_JOB_STALE_AFTER + 1)
+        ExportJob.objects.filter(pk=job.pk).update(heartbeat_at=stale)
+        run_export_job(claim_export_job(), chunk_size=2)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_written), (ExportJob.STATUS_DONE, 5))
+        with open(job.file.path, newline='', encoding='utf-8') as exported:
+            header, *rows = list(csv.reader(exported))
+        self.assertEqual(header[0], 'rating_id')
+        self.assertEqual(
+            [int(row[0]) for row in rows], list(ImageRating.objects.order_by('id').values_list('id', flat=True))
+        )
+
+    def test_running_job_is_reclaimed_only_when_stale(self):
+        job = ExportJob.objects.create()
+        self.assertEqual(claim_export_job(), job)
+        self.assertIsNone(claim_export_job())
+
+        stale = timezone.now() - timedelta(seconds=settings.EXPORT_JOB_STALE_AFTER + 1)
+        ExportJob.objects.filter(pk=job.pk).update(heartbeat_at=stale)
+        self.assertEqual(claim_export_job(), job)
+
+
+class IngestFacesTests(TestCase):
+    """ingest_faces importa uma vez cada conteúdo e, reexecutado, pula pelo nome o que já viu"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        source = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.source = source.name
+        files = {
+            'a.jpg': placeholder_image_bytes(size=64),
+            'nested/b.jpg': placeholder_image_bytes(size=64),
+            'c.jpg': placeholder_image_bytes(size=32),
+            'broken.jpg': b'not an image',
+            'notes.txt': b'ignored',
+        }
+        for name, content in files.items():
+            os.makedirs(os.path.dirname(os.path.join(self.source, name)), exist_ok=True)
+            with open(os.path.join(self.source, name), 'wb') as handle:
+                handle.write(content)
+
+    def ingest(self):
+        output, errors = StringIO(), StringIO()
+        call_command('ingest_faces', self.source, workers=1, prefix='set', stdout=output, stderr=errors)
+        return output.getvalue(), errors.getvalue()
+
+    def test_colliding_codes_are_regenerated(self):
+        existing = FaceImage.objects.create(image='faces/test.jpg', code='IMG-TAKEN')
+        codes = iter(['IMG-TAKEN', 'IMG-SAME', 'IMG-SAME', 'IMG-OTHER', 'IMG-LAST'])
+        with mock.patch('face_study.management.commands.ingest_faces.generate_image_code', lambda: next(codes)):
+            output, _ = self.ingest()
+        self.assertIn('Imported 2 image(s)', output)
+        self.assertEqual(
+            sorted(FaceImage.objects.exclude(pk=existing.pk).values_list('code', flat=True)), ['IMG-OTHER', 'IMG-SAME']
+        )
+
+    def test_ingest_skips_duplicates_and_invalid_files(self):
+        output, errors = self.ingest()
+        self.assertIn('4 image(s) found, 0 already imported, 4 to import.', output)
+        self.assertIn('Imported 2 image(s), 1 invalid, 0 skipped, 1 duplicate(s)', output)
+        self.assertIn('broken.jpg', errors)
+
+        self.assertEqual(
+            sorted(FaceImage.objects.values_list('source_name', flat=True)), ['set/a.jpg', 'set/c.jpg']
+        )
+        first = FaceImage.objects.get(source_name='set/a.jpg')
+        self.assertEqual(first.content_hash, hashlib.sha256(placeholder_image_bytes(size=64)).hexdigest())
+        self.assertTrue(default_storage.exists(first.thumbnail.name))
+        self.assertEqual(
+            list(DuplicateSource.objects.values_list('source_name', 'image')), [('set/nested/b.jpg', first.pk)]
+        )
+        self.assertEqual(get_study_stats()['total_images'], 2)
+
+        # Só o arquivo inválido é lido de novo
+        output, _ = self.ingest()
+        self.assertIn('4 image(s) found, 3 already imported, 1 to import.', output)
+        self.assertIn('Imported 0 image(s), 1 invalid, 3 skipped, 0 duplicate(s)', output)
+        self.assertEqual(FaceImage.objects.count(), 2)
+
+
+class ImageDerivativeTests(TestCase):
+    """As versões são geradas pelo build_image_derivatives e refeitas quando a imagem é trocada no admin"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.client.force_login(self.admin)
+
+    def test_replaced_image_gets_new_derivatives(self):
+        self.client.post(reverse('faceStudy:upload_image'), {
+            'image': SimpleUploadedFile('face.jpg', placeholder_image_bytes(size=64), 'image/jpeg'),
+        })
+        image = FaceImage.objects.get()
+        self.assertFalse(image.thumbnail)
+
+        call_command('build_image_derivatives', workers=1, stdout=StringIO())
+        image.refresh_from_db()
+        old_derivatives = [image.thumbnail.name, image.web_image.name]
+        self.assertTrue(all(default_storage.exists(name) for name in old_derivatives))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:face_study_faceimage_change', args=[image.pk]), {
+                'image': SimpleUploadedFile('other.jpg', placeholder_image_bytes(size=32), 'image/jpeg'),
+            })
+        self.assertEqual(response.status_code, 302)
+        image.refresh_from_db()
+        self.assertFalse(image.thumbnail)
+        self.assertFalse(image.web_image)
+        self.assertFalse(any(default_storage.exists(name) for name in old_derivatives))
+
+        call_command('build_image_derivatives', workers=1, stdout=StringIO())
+        image.refresh_from_db()
+        self.assertTrue(default_storage.exists(image.thumbnail.name))
+        self.assertTrue(default_storage.exists(image.web_image.name))
+
+
+class DuplicateImageTests(TestCase):
+    """Toda imagem tem o hash do conteúdo e duplicatas são juntadas sem deixar arquivos ou contadores errados"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        StudyConfiguration.objects.create(max_ratings_per_image=5)
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.client.force_login(self.admin)
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), settings.MEDIA_ROOT)
+            for directory, _, names in os.walk(settings.MEDIA_ROOT) for name in names
+        )
+
+    def test_admin_images_get_content_hash(self):
+        content = placeholder_image_bytes(size=64)
+        self.client.post(reverse('admin:face_study_faceimage_add'), {
+            'image': SimpleUploadedFile('face.jpg', content, 'image/jpeg'),
+        })
+        image = FaceImage.objects.get()
+        self.assertEqual(image.content_hash, hashlib.sha256(content).hexdigest())
+        self.assertTrue(image.perceptual_hash)
+
+        replacement = placeholder_image_bytes(size=32)
+        change_url = reverse('admin:face_study_faceimage_change', args=[image.pk])
+        self.client.post(change_url, {'image': SimpleUploadedFile('other.jpg', replacement, 'image/jpeg')})
+        image.refresh_from_db()
+        self.assertEqual(image.content_hash, hashlib.sha256(replacement).hexdigest())
+
+        # Reenviar o mesmo conteúdo em outra imagem é recusado pelo formulário
+        response = self.client.post(reverse('admin:face_study_faceimage_add'), {
+            'image': SimpleUploadedFile('again.jpg', replacement, 'image/jpeg'),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(FaceImage.objects.count(), 1)
+
+    def test_concurrent_upload_leaves_no_orphan_file(self):
+        content = placeholder_image_bytes(size=64)
+        digest = hashlib.sha256(content).hexdigest()
+
+        def upload_from_other_request(image):
+            # A outra requisição grava a mesma imagem entre a validação e o INSERT
+            FaceImage.objects.create(image='faces/other-request.jpg', content_hash=digest)
+            return '0' * 16
+
+        with mock.patch('face_study.forms.perceptual_hash', upload_from_other_request):
+            self.client.post(reverse('faceStudy:upload_image'), {
+                'image': SimpleUploadedFile('face.jpg', content, 'image/jpeg'),
+            })
+        self.assertEqual(FaceImage.objects.count(), 1)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_dedup_merges_ratings_counters_and_summaries(self):
+        happy = EmotionalState.objects.create(name='happy')
+        content = placeholder_image_bytes(size=64)
+        images = []
+        for name in ('keeper', 'first_copy', 'second_copy'):
+            path = default_storage.save(f'faces/{name}.jpg', SimpleUploadedFile(name, content))
+            images.append(FaceImage.objects.create(image=path))
+        keeper, first_copy, second_copy = images
+        both, twice, single = (
+            Participant.objects.create(email=f'{name}@example.com') for name in ('both', 'twice', 'single')
+        )
+        save_rating(both, keeper, {happy.id: Decimal('0.10')})
+        save_rating(both, first_copy, {happy.id: Decimal('0.90')})
+        save_rating(twice, first_copy, {happy.id: Decimal('0.30')})
+        save_rating(twice, second_copy, {happy.id: Decimal('0.70')})
+        save_rating(single, second_copy, {happy.id: Decimal('0.50')})
+        ImageReservation.objects.create(
+            participant=single, image=first_copy, token=uuid.uuid4(), position=0,
+            expires_at=timezone.now() + timedelta(minutes=5),
+        )
+        FaceImage.objects.filter(pk=first_copy.pk).update(reserved_count=1)
+
+        output = StringIO()
+        call_command('dedup_faces', stdout=output)
+        self.assertIn('2 image(s) removed, 2 rating(s) moved, 2 conflicting rating(s) deleted', output.getvalue())
+
+        keeper.refresh_from_db()
+        self.assertEqual(list(FaceImage.objects.all()), [keeper])
+        self.assertEqual(keeper.content_hash, hashlib.sha256(content).hexdigest())
+        self.assertEqual(keeper.rating_count, 3)
+        self.assertEqual(
+            sorted(keeper.ratings.values_list('participant__email', 'emotion_rankings__agreement_level')),
+            [('both@example.com', Decimal('0.10')), ('single@example.com', Decimal('0.50')),
+             ('twice@example.com', Decimal('0.30'))],
+        )
+        self.assertEqual(check_invariants(), dict.fromkeys(check_invariants(), 0))
+        self.assertEqual(get_study_stats()['coverage'], [{'rating_count': 3, 'images': 1}])
+
+        summary = FaceEmotionSummary.objects.get(image=keeper, emotion=happy)
+        self.assertEqual((summary.count, summary.total), (3, 90))
+        self.assertEqual(self.stored_files(), [keeper.image.name])
+
+
+@override_settings(STUDY_CACHE_VERSION_TTL=0)
+class CacheVersionTests(TestCase):
+    """Configuração e catálogo em cache são invalidados pela versão no banco, depois do commit"""
+
+    def bump_in_other_process(self, name):
+        # O que o commit de outro processo deixa no banco; o cache deste processo não é tocado
+        version, _ = CacheVersion.objects.get_or_create(name=name)
+        CacheVersion.objects.filter(name=name).update(version=version.version + 1)
+
+    def test_config_changed_elsewhere_is_reloaded(self):
+        config = StudyConfiguration.objects.create(max_ratings_per_image=3)
+        self.assertEqual(get_active_config().max_ratings_per_image, 3)
+
+        StudyConfiguration.objects.filter(pk=config.pk).update(max_ratings_per_image=5)
+        self.assertEqual(get_active_config().max_ratings_per_image, 3)
+        self.bump_in_other_process(CONFIG_VERSION_NAME)
+        self.assertEqual(get_active_config().max_ratings_per_image, 5)
+
+    def test_catalog_changed_elsewhere_is_reloaded(self):
+        EmotionalState.objects.create(name='happy')
+        self.assertEqual(len(get_emotion_catalog()), 1)
+
+        EmotionalState.objects.bulk_create([EmotionalState(name='sad')])
+        self.assertEqual(len(get_emotion_catalog()), 1)
+        self.bump_in_other_process(CATALOG_VERSION_NAME)
+        self.assertEqual([emotion.name for emotion in get_emotion_catalog()], ['happy', 'sad'])
+
+    def test_version_changes_only_after_commit(self):
+        config = StudyConfiguration.objects.create()
+        before = current_version(CONFIG_VERSION_NAME)
+        with self.captureOnCommitCallbacks(execute=True):
+            config.max_ratings_per_image = 4
+            config.save()
+            self.assertEqual(current_version(CONFIG_VERSION_NAME), before)
+        self.assertEqual(current_version(CONFIG_VERSION_NAME), before + 1)
+        self.assertEqual(get_active_config().max_ratings_per_image, 4)
@@ -1,19 +1,29 @@
 from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
-from . import views
+from . import api_views, async_views, views
 
 app_name = 'faceStudy'
 
+# Páginas da sessão de avaliação: versões async quando servido por ASGI
+session_views = async_views if settings.STUDY_ASYNC_VIEWS else views
+
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('upload/', views.upload_image, name='upload_image'),
-    path('start/', views.start_session, name='start_session'),
-    path('rate/', views.rate_images, name='rate_images'),
-    path('complete/', views.session_complete, name='session_complete'),
+    path('upload/images/', views.upload_gallery, name='upload_gallery'),
+    path('start/', session_views.start_session, name='start_session'),
+    path('rate/', session_views.rate_images, name='rate_images'),
+    path('complete/', session_views.session_complete, name='session_complete'),
     path('emotions/', views.manage_emotional_states, name='manage_emotional_states'),
     path('emotions/delete/<int:emotion_id>/', views.delete_emotion, name='delete_emotion'),
     path('config/', views.study_config, name='study_config'),
+    path('consensus/<str:code>/', views.image_consensus, name='image_consensus'),
+    path('exports/<int:job_id>/download/', views.download_export, name='download_export'),
+    path('api/session/start/', api_views.api_start_session, name='api_start_session'),
+    path('api/session/next/', api_views.api_next_image, name='api_next_image'),
+    path('api/session/submit/', api_views.api_submit_rating, name='api_submit_rating'),
+    path('api/session/progress/', api_views.api_progress, name='api_progress'),
 ]
 
 if settings.DEBUG:
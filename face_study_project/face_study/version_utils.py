@@ -0,0 +1,46 @@
+# face_study/version_utils.py
+import time
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+# Versões lidas do banco por este processo e o momento da leitura (time.monotonic())
+_versions = ({}, None)
+
+
+def current_version(name):
+    """
+    Versão atual de um cache mantido em memória pelos processos (0 se nunca trocada).
+
+    As versões ficam no banco (CacheVersion), compartilhadas por todos os
+    processos do WSGI/ASGI, e são relidas (todas numa consulta) no máximo a
+    cada STUDY_CACHE_VERSION_TTL segundos. Uma alteração feita em outro
+    processo aparece depois desse intervalo; no processo que a fez, na hora.
+    """
+    global _versions
+    from .models import CacheVersion
+
+    versions, loaded_at = _versions
+    now = time.monotonic()
+    if loaded_at is None or now - loaded_at >= settings.STUDY_CACHE_VERSION_TTL:
+        versions = dict(CacheVersion.objects.values_list('name', 'version'))
+        _versions = (versions, now)
+    return versions.get(name, 0)
+
+
+def bump_version(name):
+    """
+    Troca a versão de um cache em todos os processos quando a transação atual for confirmada.
+
+    Antes do commit outro processo ainda lê a linha antiga; se a versão já
+    tivesse mudado, ele guardaria o valor antigo sob a versão nova.
+    """
+    from .models import CacheVersion
+
+    def bump():
+        global _versions
+        CacheVersion.objects.get_or_create(name=name)
+        CacheVersion.objects.filter(name=name).update(version=F('version') + 1)
+        _versions = ({}, None)
+
+    transaction.on_commit(bump)
@@ -1,36 +1,75 @@
 from django.utils import timezone
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse, Http404
+from django.http import FileResponse, HttpResponse, JsonResponse, Http404
 from django.contrib import messages
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.core.paginator import Paginator
 from django.conf import settings
 import json
 from django.contrib.auth.decorators import login_required
-import random
 from .models import *
 from .forms import *
 from django.db.models import Count
-from .export_utils import export_ratings_to_csv
+from .catalog_utils import get_emotion_catalog
+from .config_utils import get_active_config
+from .export_utils import export_consensus_to_csv, export_ratings_to_csv, export_ratings_to_matrix, MATRIX_FORMATS
+from .gallery_utils import gallery_item, gallery_page
+from .stats_utils import get_study_stats
+from .summary_utils import get_consensus
+from .session_utils import (
+    end_study_session, get_session_participant, session_images, start_study_session, submit_session_rating,
+)
 from django.contrib.admin.views.decorators import staff_member_required
 
 @login_required
 def upload_image(request):
     if request.method == 'POST':
-        form = ImageUploadForm(request.POST, request.FILES)
+        form = ImageUploadForm(
+            request.POST, request.FILES,
+            content_hashes=getattr(request, 'upload_content_hashes', None),
+        )
         if form.is_valid():
-            image = form.save()
+            try:
+                with transaction.atomic():
+                    image = form.save()
+            except IntegrityError:
+                # Mesmo conteúdo enviado ao mesmo tempo por outra requisição; o
+                # arquivo já foi gravado antes do INSERT falhar (o nome gravado é
+                # só desta requisição: o storage não sobrescreve o da outra)
+                stored = form.instance.image
+                if stored and stored._committed:
+                    stored.delete(save=False)
+                messages.error(request, 'Esta imagem já foi enviada.')
+                return redirect('faceStudy:upload_image')
+            # Miniatura e versão web são geradas pelo build_image_derivatives --watch
             messages.success(request, f'Imagem enviada! Código: {image.code}')
             return redirect('faceStudy:upload_image')
     else:
         form = ImageUploadForm()
     
-    images = FaceImage.objects.all().order_by('-uploaded_at')
+    # Só a primeira página; as seguintes vêm de upload_gallery conforme a rolagem
+    images, next_cursor = gallery_page()
+    max_ratings = get_active_config().max_ratings_per_image
     return render(request, 'studyInterfaces/upload.html', {
         'form': form,
-        'images': images
+        'images': [gallery_item(image, max_ratings) for image in images],
+        'next_cursor': next_cursor,
+    })
+
+@login_required
+def upload_gallery(request):
+    """Próxima página da galeria de imagens enviadas, em JSON (rolagem infinita)"""
+    try:
+        images, next_cursor = gallery_page(request.GET.get('cursor'))
+    except ValueError:
+        return JsonResponse({'error': 'Cursor inválido.'}, status=400)
+    
+    max_ratings = get_active_config().max_ratings_per_image
+    return JsonResponse({
+        'images': [gallery_item(image, max_ratings) for image in images],
+        'next_cursor': next_cursor,
     })
 
 def start_session(request):
@@ -46,35 +85,15 @@ def start_session(request):
             participant.last_session_at = timezone.now()
             participant.save()
             
-            # Obtém configuração ativa
-            config = StudyConfiguration.objects.filter(is_active=True).first()
-            if not config:
-                config = StudyConfiguration.objects.create()
-            
-            # Gera número aleatório de imagens para esta sessão
-            images_for_this_session = random.randint(
-                config.min_images_per_session, 
-                config.max_images_per_session
-            )
-            
-            # Inicia sessão
-            request.session['participant_email'] = email
-            request.session['session_active'] = True
-            request.session['rated_images'] = []  # Imagens avaliadas nesta sessão
-            request.session['session_image_count'] = images_for_this_session
-            request.session['session_min_images'] = config.min_images_per_session
-            request.session['session_max_images'] = config.max_images_per_session
-            request.session['participant_id'] = str(participant.id)  # Armazena ID do participante
+            # Sorteia o tamanho da sessão, reserva as imagens e inicia a sessão
+            start_study_session(request, participant, get_active_config())
             
             return redirect('faceStudy:rate_images')
     else:
         form = ParticipantEmailForm()
     
-    # Obtém configuração ativa para mostrar informações
-    study_config = StudyConfiguration.objects.filter(is_active=True).first()
-    if not study_config:
-        # Cria configuração padrão se não existir
-        study_config = StudyConfiguration.objects.create()
+    # Obtém configuração ativa para mostrar informações (cria a padrão se não existir)
+    study_config = get_active_config()
     
     return render(request, 'studyInterfaces/start_session.html', {
         'form': form,
@@ -82,142 +101,51 @@ def start_session(request):
     })
 
 def rate_images(request):
-    if not request.session.get('session_active'):
+    participant = get_session_participant(request)
+    if participant is None:
+        # Sem sessão ativa (ou participante removido): começa uma nova
         return redirect('faceStudy:start_session')
     
-    email = request.session.get('participant_email')
-    participant_id = request.session.get('participant_id')
-    
-    if not email or not participant_id:
-        return redirect('faceStudy:start_session')
-    
-    try:
-        participant = Participant.objects.get(id=participant_id, email=email)
-    except Participant.DoesNotExist:
-        # Se não encontrar, redireciona para começar nova sessão
-        return redirect('faceStudy:start_session')
+    # Estado da sessão (cookie assinado): reservas, tamanho e imagens avaliadas
+    state = request.study_state
     
     # Obtém configuração ativa
-    config = StudyConfiguration.objects.filter(is_active=True).first()
-    if not config:
-        config = StudyConfiguration.objects.create()
+    config = get_active_config()
     
-    # Obtém número de imagens para esta sessão
-    session_image_count = request.session.get('session_image_count', 10)
-    
-    # Obter todas as emoções para o formulário
-    emotions = EmotionalState.objects.all().order_by('name')
+    # Obter todas as emoções para o formulário (catálogo em cache)
+    catalog = get_emotion_catalog()
+    emotions = catalog.emotions
     
     if request.method == 'POST':
         image_id = request.POST.get('image_id')
         image = get_object_or_404(FaceImage, id=image_id)
         
-        with transaction.atomic():
-            # Verifica se o participante já avaliou esta imagem
-            existing_rating = ImageRating.objects.filter(
-                participant=participant,
-                image=image
-            ).first()
-            
-            if existing_rating:
-                # Se já avaliou, atualiza os rankings
-                # Remove rankings antigos
-                existing_rating.emotion_rankings.all().delete()
-                
-                # Adiciona novos rankings
-                for emotion in emotions:
-                    agreement_key = f'emotion_{emotion.id}'
-                    agreement_value = request.POST.get(agreement_key)
-                    if agreement_value:
-                        try:
-                            agreement_decimal = Decimal(agreement_value)
-                            if agreement_decimal < Decimal('0.00'):
-                                agreement_decimal = Decimal('0.00')
-                            elif agreement_decimal > Decimal('1.00'):
-                                agreement_decimal = Decimal('1.00')
-                            
-                            agreement_decimal = agreement_decimal.quantize(Decimal('0.01'))
-                            
-                            EmotionRanking.objects.create(
-                                rating=existing_rating,
-                                emotion=emotion,
-                                agreement_level=agreement_decimal
-                            )
-                        except:
-                            pass
-            else:
-                # Se não avaliou, cria nova avaliação
-                rating = ImageRating.objects.create(
-                    participant=participant,
-                    image=image
-                )
-                
-                # Processa níveis de concordância
-                for emotion in emotions:
-                    agreement_key = f'emotion_{emotion.id}'
-                    agreement_value = request.POST.get(agreement_key)
-                    if agreement_value:
-                        try:
-                            agreement_decimal = Decimal(agreement_value)
-                            if agreement_decimal < Decimal('0.00'):
-                                agreement_decimal = Decimal('0.00')
-                            elif agreement_decimal > Decimal('1.00'):
-                                agreement_decimal = Decimal('1.00')
-                            
-                            agreement_decimal = agreement_decimal.quantize(Decimal('0.01'))
-                            
-                            EmotionRanking.objects.create(
-                                rating=rating,
-                                emotion=emotion,
-                                agreement_level=agreement_decimal
-                            )
-                        except:
-                            pass
+        rating, errors, position = submit_session_rating(participant, image, request.POST, emotions, state.token)
         
-        # Atualiza sessão
-        rated = request.session.get('rated_images', [])
-        rated.append(str(image.id))
-        request.session['rated_images'] = rated
+        if errors:
+            # Nada foi gravado: mostra os erros e volta para a imagem reservada
+            for error in errors.values():
+                messages.error(request, error)
+            return redirect('faceStudy:rate_images')
         
-        # Verifica se completou a sessão
-        if len(rated) >= session_image_count:
-            request.session['session_active'] = False
+        # Atualiza sessão e verifica se completou
+        if state.mark_rated(position):
             return redirect('faceStudy:session_complete')
         
         return redirect('faceStudy:rate_images')
     
-    # Pega as imagens já avaliadas nesta sessão
-    rated_in_this_session = request.session.get('rated_images', [])
-    
     # Se já avaliou todas as imagens da sessão
-    if len(rated_in_this_session) >= session_image_count:
-        request.session['session_active'] = False
+    if state.complete:
+        state.end()
         return redirect('faceStudy:session_complete')
     
-    # Busca a próxima imagem disponível para este participante
-    # 1. Imagens que ainda não atingiram o limite máximo de avaliações
-    # 2. Exclui imagens que este participante já avaliou (em qualquer sessão)
-    # 3. Exclui imagens já avaliadas nesta sessão
-    
-    # Imagens que o participante já avaliou (em qualquer sessão)
-    already_rated_by_participant = ImageRating.objects.filter(
-        participant=participant
-    ).values_list('image_id', flat=True)
-    
-    # Busca próxima imagem
-    current_image = FaceImage.objects.annotate(
-        rating_count=Count('ratings')
-    ).filter(
-        rating_count__lt=config.max_ratings_per_image  # Ainda não atingiu o limite
-    ).exclude(
-        id__in=already_rated_by_participant  # Exclui imagens já avaliadas pelo participante
-    ).exclude(
-        id__in=[uuid.UUID(id) for id in rated_in_this_session]  # Exclui imagens já avaliadas nesta sessão
-    ).order_by('?').first()
+    # Próxima imagem reservada para esta sessão; com as reservas vencidas,
+    # a próxima disponível para este participante. A seguinte é pré-carregada.
+    current_image, following_image = session_images(state, participant, config)
     
     if not current_image:
         # Não há mais imagens disponíveis para este participante
-        request.session['session_active'] = False
+        state.end()
         return redirect('faceStudy:session_complete')
     
     # Verifica se há uma avaliação anterior desta imagem por este participante
@@ -227,21 +155,22 @@ def rate_images(request):
     ).first()
     
     # Calcular estatísticas da imagem
-    image_rating_count = current_image.ratings.count()
+    image_rating_count = current_image.rating_count
     image_rating_progress = (image_rating_count / config.max_ratings_per_image) * 100
     
     # Cria o formulário de concordância com valores anteriores se existirem
-    form = EmotionAgreementForm(emotions=emotions)
+    form = catalog.form_class()
     
     # Se houver avaliação anterior, preenche o formulário com esses valores
     if previous_rating:
         initial_data = {}
         for ranking in previous_rating.emotion_rankings.all():
-            initial_data[f'emotion_{ranking.emotion.id}'] = str(ranking.agreement_level)
-        form = EmotionAgreementForm(emotions=emotions, initial=initial_data)
+            initial_data[f'emotion_{ranking.emotion_id}'] = str(ranking.agreement_level)
+        form = catalog.form_class(initial=initial_data)
     
     return render(request, 'studyInterfaces/rate_images.html', {
         'image': current_image,
+        'next_image': following_image,
         'emotions': emotions,
         'form': form,
         'config': config,
@@ -253,22 +182,18 @@ def rate_images(request):
             'remaining': config.max_ratings_per_image - image_rating_count
         },
         'progress': {
-            'current': len(rated_in_this_session) + 1,
-            'total': session_image_count,
-            'min_images': request.session.get('session_min_images', 1),
-            'max_images': request.session.get('session_max_images', 10),
-            'estimated_time': session_image_count * 2,
+            'current': state.rated + 1,
+            'total': state.image_count,
+            'min_images': state.min_images,
+            'max_images': state.max_images,
+            'estimated_time': state.image_count * 2,
         }
     })
 
 
 def session_complete(request):
-    if 'participant_email' in request.session:
-        del request.session['participant_email']
-    if 'session_active' in request.session:
-        del request.session['session_active']
-    if 'rated_images' in request.session:
-        del request.session['rated_images']
+    # Libera as reservas e apaga o cookie de estado da sessão
+    end_study_session(request)
     
     return render(request, 'studyInterfaces/session_complete.html')
 
@@ -285,7 +210,7 @@ def manage_emotional_states(request):
             messages.success(request, 'Estado emocional adicionado!')
         return redirect('faceStudy:manage_emotional_states')
     
-    emotions = EmotionalState.objects.all()
+    emotions = get_emotion_catalog().emotions
     return render(request, 'studyInterfaces/manage_emotions.html', {'emotions': emotions})
 
 @login_required
@@ -312,13 +237,8 @@ def study_config(request):
 
 @login_required
 def dashboard(request):
-    stats = {
-        'total_images': FaceImage.objects.count(),
-        'rated_images': FaceImage.objects.filter(is_rated=True).count(),
-        'total_participants': Participant.objects.count(),
-        'total_ratings': ImageRating.objects.count(),
-        'emotional_states': EmotionalState.objects.count(),
-    }
+    # Snapshot mantido pelos sinais (ver stats_utils.py), sem COUNT(*) nas tabelas
+    stats = get_study_stats()
     
     recent_ratings = ImageRating.objects.select_related(
         'participant', 'image'
@@ -343,19 +263,55 @@ def export_advanced(request):
         
         queryset = ImageRating.objects.all()
         
+        # Datas inteiras no fuso do projeto (o dia final entra no filtro)
         if start_date:
-            queryset = queryset.filter(created_at__gte=start_date)
+            queryset = queryset.filter(created_at__date__gte=start_date)
         if end_date:
-            queryset = queryset.filter(created_at__lte=end_date)
+            queryset = queryset.filter(created_at__date__lte=end_date)
+        
+        export_format = request.POST.get('format', 'csv')
+        if export_format == 'consensus':
+            # Lido dos resumos por imagem, que não têm data: o filtro não pode ser aplicado
+            if start_date or end_date:
+                messages.error(request, 'The consensus export covers all ratings; clear the date filter to use it.')
+                return redirect('admin:face_study_export_advanced')
+            return export_consensus_to_csv()
+        if export_format in MATRIX_FORMATS:
+            try:
+                return export_ratings_to_matrix(queryset, export_format)
+            except ImportError as exc:
+                messages.error(request, f'The {export_format} format is not available: {exc}')
+                return redirect('admin:face_study_export_advanced')
         
         return export_ratings_to_csv(queryset)
     
+    stats = get_study_stats()
     context = {
         'title': 'Advanced Export',
-        'total_ratings': ImageRating.objects.count(),
-        'total_images': FaceImage.objects.count(),
-        'total_participants': Participant.objects.count(),
-        'emotions': EmotionalState.objects.all(),
+        'total_ratings': stats['total_ratings'],
+        'total_images': stats['total_images'],
+        'total_participants': stats['total_participants'],
+        'emotions': get_emotion_catalog().emotions,
     }
     
-    return render(request, 'admin/face_study/export_advanced_simple.html', context)
\ No newline at end of file
+    return render(request, 'admin/face_study/export_advanced_simple.html', context)
+
+@staff_member_required
+def image_consensus(request, code):
+    """Consenso de uma imagem (média e desvio por emoção), lido só de FaceEmotionSummary"""
+    image = get_object_or_404(FaceImage.objects.only('id', 'code', 'rating_count'), code=code)
+    return JsonResponse({
+        'image': image.code,
+        'rating_count': image.rating_count,
+        'emotions': get_consensus(image),
+    })
+
+@staff_member_required
+def download_export(request, job_id):
+    """CSV de uma ExportJob concluída; os arquivos ficam fora de MEDIA_ROOT e só saem por aqui"""
+    job = get_object_or_404(ExportJob, pk=job_id, status=ExportJob.STATUS_DONE)
+    if not job.file or not job.file.storage.exists(job.file.name):
+        raise Http404('Export file not found.')
+    return FileResponse(
+        job.file.open('rb'), as_attachment=True, filename=f'ratings_export_{job.pk}.csv', content_type='text/csv',
+    )
@@ -47,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'face_study.session_utils.StudyStateMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -129,10 +130,48 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Exportações (contêm e-mails dos participantes): fora de MEDIA_ROOT, baixadas
+# só pela view download_export, restrita à equipe
+STUDY_EXPORT_ROOT = os.path.join(BASE_DIR, 'exports')
+
+# Um job "running" sem checkpoint há mais que isso (segundos) é considerado
+# abandonado e pode ser retomado por outro worker (ver run_export_jobs)
+EXPORT_JOB_STALE_AFTER = 600
+
 # Configurações de Sessão
 SESSION_COOKIE_AGE = 3600  # 1 hora
 SESSION_SAVE_EVERY_REQUEST = True
 
+# Páginas da sessão de avaliação em versão async (face_study/async_views.py).
+# O asgi.py liga esta opção; no WSGI cada view async rodaria num event loop próprio
+STUDY_ASYNC_VIEWS = os.environ.get('STUDY_ASYNC_VIEWS') == '1'
+
 # Configurações de Upload
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
-DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880
\ No newline at end of file
+DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880
+# Tempo de validade das reservas de imagens de uma sessão de avaliação
+STUDY_RESERVATION_TTL = SESSION_COOKIE_AGE  # segundos
+
+# Cookie assinado com o estado da sessão de avaliação (face_study.session_utils.StudyState)
+STUDY_STATE_COOKIE_NAME = 'face_study_state'
+
+# Intervalo (segundos) entre as leituras das versões da configuração ativa e do
+# catálogo de emoções no banco: por quanto tempo uma alteração feita em outro
+# processo pode demorar a aparecer
+STUDY_CACHE_VERSION_TTL = 1.0
+
+# Acima deste número de linhas o admin usa a estimativa do banco no lugar de COUNT(*)
+ADMIN_APPROXIMATE_COUNT_THRESHOLD = 100000
+
+# Processos do build_image_derivatives, que gera miniaturas e versões web das imagens enviadas
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# Imagens por página na galeria da tela de upload
+UPLOAD_GALLERY_PAGE_SIZE = 50
+
+# O hash do conteúdo é calculado enquanto o arquivo chega (deduplicação de imagens)
+FILE_UPLOAD_HANDLERS = [
+    'face_study.image_utils.ContentHashUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]